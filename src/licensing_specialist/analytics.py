@@ -0,0 +1,213 @@
+"""In-memory columnar snapshot of the tables the dashboard and reports aggregate over.
+
+Each table is loaded once with a single SELECT and stored as compact typed
+columns (``array.array``): ids and flags as integers, dates as proleptic
+ordinals (0 = NULL), scores as doubles (NaN = NULL) and text categoricals as
+integer codes into a category list (code 0 = NULL). Filters produce byte masks
+and counts are taken with ``itertools.compress`` / ``collections.Counter``, so
+the per-row work runs in C rather than over ``sqlite3.Row`` objects.
+
+The snapshot is reloaded whenever ``db.get_data_version`` reports a commit.
+It serves the plain filter/count reports (dashboard stats, module stats and
+recruiter performance). Reports that need ordered or windowed work (score
+percentiles, attempt numbering, incremental trend buckets, the funnel's
+milestones) stay in SQLite, where that work is indexed.
+"""
+from array import array
+from collections import Counter
+from datetime import date
+from itertools import compress, repeat
+from operator import and_
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+import logging
+import math
+import threading
+
+from . import db
+
+logger = logging.getLogger(__name__)
+
+# table -> [(column, kind)]; kind is one of "int", "date", "float", "category"
+SNAPSHOT_SCHEMA = {
+    "recruiter": [
+        ("id", "int"), ("name", "category"),
+    ],
+    "trainee": [
+        ("id", "int"), ("recruiter_id", "int"), ("rvp_name", "category"), ("dob", "date"),
+    ],
+    "class": [
+        ("id", "int"), ("name", "category"), ("start_date", "date"), ("end_date", "date"),
+    ],
+    "exam": [
+        ("id", "int"), ("trainee_id", "int"), ("class_id", "int"), ("module", "category"),
+        ("is_practice", "int"), ("passed", "category"), ("exam_date", "date"), ("score_value", "float"),
+    ],
+    "license": [
+        ("id", "int"), ("trainee_id", "int"), ("status", "category"), ("license_type", "category"),
+        ("invoiced", "int"), ("application_submitted_date", "date"), ("approval_date", "date"),
+    ],
+    "practice_exam_status": [
+        ("trainee_id", "int"), ("module", "category"), ("completed", "int"),
+    ],
+}
+
+
+def _to_ordinal(value: Optional[str]) -> int:
+    if not value:
+        return 0
+    try:
+        return date.fromisoformat(str(value)[:10]).toordinal()
+    except ValueError:
+        return 0
+
+
+def _encode_column(kind: str, values: Sequence[Any]) -> Tuple[array, Optional[List[Any]]]:
+    """Pack raw column values into a typed array (plus categories for categoricals)."""
+    if kind == "int":
+        return array('q', [v or 0 for v in values]), None
+    if kind == "date":
+        return array('i', map(_to_ordinal, values)), None
+    if kind == "float":
+        return array('d', [math.nan if v is None else float(v) for v in values]), None
+    categories = [None] + [v for v in dict.fromkeys(values) if v is not None]
+    lookup = {v: i for i, v in enumerate(categories)}
+    return array('i', map(lookup.__getitem__, values)), categories
+
+
+class ColumnTable:
+    """A single table held as typed columns of equal length."""
+
+    def __init__(self, name: str, length: int):
+        self.name = name
+        self.length = length
+        self.columns: Dict[str, array] = {}
+        self.categories: Dict[str, List[Any]] = {}
+
+    def __len__(self) -> int:
+        return self.length
+
+    def code(self, column: str, value: Any) -> int:
+        """Integer code of a categorical value, or -1 if it never occurs."""
+        try:
+            return self.categories[column].index(value)
+        except ValueError:
+            return -1
+
+    def all(self) -> bytes:
+        return b"\x01" * self.length
+
+    def mask(self, column: str, value: Any = None, *, isin: Optional[Iterable[Any]] = None) -> bytes:
+        """Mask of rows where column == value (or is one of `isin`). Categoricals compare on values, not codes."""
+        col = self.columns[column]
+        if column in self.categories:
+            if isin is not None:
+                wanted = {self.code(column, v) for v in isin}
+                return bytes(map(wanted.__contains__, col))
+            return bytes(map(self.code(column, value).__eq__, col))
+        if isin is not None:
+            return bytes(map(set(isin).__contains__, col))
+        return bytes(map(value.__eq__, col))
+
+    def date_mask(self, column: str, since: Optional[str] = None, until: Optional[str] = None) -> bytes:
+        """Mask of rows whose date column falls in [since, until); NULL dates never match."""
+        col = self.columns[column]
+        result = bytes(map((0).__lt__, col))
+        if since:
+            result = combine(result, bytes(map(_to_ordinal(since).__le__, col)))
+        if until:
+            result = combine(result, bytes(map(_to_ordinal(until).__gt__, col)))
+        return result
+
+    def values(self, column: str, mask: Optional[bytes] = None) -> List[Any]:
+        """Decoded column values, optionally restricted to a mask."""
+        col = self.columns[column] if mask is None else compress(self.columns[column], mask)
+        cats = self.categories.get(column)
+        return [cats[c] for c in col] if cats is not None else list(col)
+
+    def lookup(self, column: str, other: "ColumnTable", value_column: str, key: str = "id") -> str:
+        """Add (once) a column of `other.value_column` looked up through this table's `column`; returns its name.
+
+        The derived column is named "column.value_column" and can be used with
+        mask/values/count_by like any other. Unmatched rows read as NULL.
+        """
+        name = f"{column}.{value_column}"
+        if name not in self.columns:
+            source = other.columns[value_column]
+            target = dict(zip(other.columns[key], source))
+            if value_column in other.categories:
+                self.categories[name] = other.categories[value_column]
+            self.columns[name] = array(source.typecode, map(target.get, self.columns[column], repeat(0)))
+        return name
+
+    def count(self, mask: Optional[bytes] = None) -> int:
+        return self.length if mask is None else mask.count(1)
+
+    def count_by(self, columns: Sequence[str], mask: Optional[bytes] = None) -> Dict[Any, int]:
+        """Row counts per distinct value (or tuple of values) of `columns`, decoded."""
+        cols = [self.columns[c] if mask is None else compress(self.columns[c], mask) for c in columns]
+        counts = Counter(cols[0]) if len(cols) == 1 else Counter(zip(*cols))
+        decoders = [self.categories.get(c) for c in columns]
+        result = {}
+        for key, n in counts.items():
+            if len(cols) == 1:
+                result[decoders[0][key] if decoders[0] is not None else key] = n
+            else:
+                result[tuple(d[k] if d is not None else k for d, k in zip(decoders, key))] = n
+        return result
+
+
+def combine(*masks: bytes) -> bytes:
+    """AND several masks together."""
+    result = masks[0]
+    for m in masks[1:]:
+        result = bytes(map(and_, result, m))
+    return result
+
+
+class AnalyticsSnapshot:
+    """All SNAPSHOT_SCHEMA tables loaded from one read transaction."""
+
+    def __init__(self, tables: Dict[str, ColumnTable], version: tuple):
+        self.tables = tables
+        self.version = version
+
+    def table(self, name: str) -> ColumnTable:
+        return self.tables[name]
+
+    @classmethod
+    def load(cls, db_path: Optional[Path] = None) -> "AnalyticsSnapshot":
+        version = db.get_data_version(db_path)
+        tables = {}
+        with db.get_db_connection(db_path) as conn:
+            conn.row_factory = None
+            cur = conn.cursor()
+            cur.execute("BEGIN")  # every table from the same snapshot
+            for name, spec in SNAPSHOT_SCHEMA.items():
+                cur.execute(f"SELECT {', '.join(c for c, _ in spec)} FROM {name}")
+                rows = cur.fetchall()
+                table = ColumnTable(name, len(rows))
+                columns = list(zip(*rows)) if rows else [()] * len(spec)
+                for (col, kind), values in zip(spec, columns):
+                    table.columns[col], cats = _encode_column(kind, values)
+                    if cats is not None:
+                        table.categories[col] = cats
+                tables[name] = table
+            conn.commit()
+        logger.info("Loaded analytics snapshot: " + ", ".join(f"{n}={len(t)}" for n, t in tables.items()))
+        return cls(tables, version)
+
+
+_snapshots: Dict[str, AnalyticsSnapshot] = {}
+_snapshot_lock = threading.Lock()
+
+
+def get_snapshot(db_path: Optional[Path] = None) -> AnalyticsSnapshot:
+    """Return the cached snapshot for the database, reloading it if anything was committed since."""
+    key = str(db_path or db.DEFAULT_DB)
+    with _snapshot_lock:
+        snap = _snapshots.get(key)
+        if snap is None or snap.version != db.get_data_version(db_path):
+            snap = AnalyticsSnapshot.load(db_path)
+            _snapshots[key] = snap
+        return snap
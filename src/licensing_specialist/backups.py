@@ -0,0 +1,163 @@
+"""Online backups of the live database: stepped copy, verification and compression.
+
+run_backup() copies the database with sqlite3.Connection.backup() a few
+thousand pages per step. The source is read-locked only while a step runs, so
+the GUI keeps writing during a backup. A writer waiting to commit makes the
+next step back off until it is done. If another connection changes the
+database mid-copy, SQLite restarts the copy from the first page; restarts are
+counted in the result. After BACKUP_MAX_RESTARTS restarts the stepped copy
+gives up and copies the whole database in one step instead, holding the read
+lock until it is done; the result reports that fallback. The finished copy must pass PRAGMA integrity_check
+before it is compressed, so a damaged backup is never kept.
+
+BackupJob runs a backup on a daemon thread (jobs.BackgroundJob); the GUI polls it from a timer.
+"""
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+import gzip
+import lzma
+import sqlite3
+import time
+
+from . import db
+from .jobs import BackgroundJob
+
+BACKUP_PAGES = 1024 # Pages copied per backup step (4 MiB at the default page size)
+BACKUP_RETRY_PAUSE = 0.05 # Seconds to back off when a writer holds the database
+BACKUP_MAX_RESTARTS = 5 # Restarts before the stepped copy falls back to a single-step copy
+COMPRESS_CHUNK = 1 << 20 # Bytes read per compression step
+
+# compression name -> (opener, file suffix). Low levels: gz (zlib) at level 1 is several times
+# faster than its default for a few percent more bytes; xz (lzma) is ~30% smaller again but slower.
+COMPRESSORS = {
+    "gz": (lambda path, mode: gzip.open(path, mode, compresslevel=1), ".gz"),
+    "xz": (lambda path, mode: lzma.open(path, mode, preset=1), ".xz"),
+    None: (None, ""),
+}
+
+
+class BackupCancelled(Exception):
+    """Raised inside the copy when the caller asks to stop."""
+
+
+class _TooManyRestarts(Exception):
+    """Raised inside the stepped copy once concurrent writes have restarted it too often."""
+
+
+def backup_filename(stamp: datetime, compression: Optional[str]) -> str:
+    return f"licensing_{stamp:%Y%m%d_%H%M%S}.db{COMPRESSORS[compression][1]}"
+
+
+def _copy(db_path, target: Path, pages: int, progress, cancelled, max_restarts: int) -> Dict[str, Any]:
+    state = {"remaining": None, "restarts": 0, "pages": 0}
+
+    def step(status: int, remaining: int, total: int) -> None:
+        if state["remaining"] is not None and remaining > state["remaining"]:
+            state["restarts"] += 1
+            if state["restarts"] >= max_restarts:
+                raise _TooManyRestarts()
+        state["remaining"], state["pages"] = remaining, total
+        if progress:
+            progress(total - remaining, 2 * total)
+        if cancelled and cancelled():
+            raise BackupCancelled()
+
+    source = db.get_conn(db_path)
+    copy = sqlite3.connect(str(target))
+    fallback = False
+    try:
+        try:
+            source.backup(copy, pages=pages, progress=step, sleep=BACKUP_RETRY_PAUSE)
+        except _TooManyRestarts:
+            # Writers keep winning the race: copy everything in one step so no write can restart it
+            state["remaining"], fallback = None, True
+            source.backup(copy, pages=-1, progress=step, sleep=BACKUP_RETRY_PAUSE)
+    finally:
+        copy.close()
+        source.close()
+    return {"pages": state["pages"], "restarts": state["restarts"], "fallback": fallback}
+
+
+def verify(path: Path) -> None:
+    """Raise sqlite3.DatabaseError unless the file passes PRAGMA integrity_check."""
+    conn = sqlite3.connect(str(path))
+    try:
+        problems = [r[0] for r in conn.execute("PRAGMA integrity_check").fetchall()]
+    finally:
+        conn.close()
+    if problems != ["ok"]:
+        raise sqlite3.DatabaseError(f"backup failed integrity check: {problems[0]}")
+
+
+def _compress(raw: Path, target: Path, opener, pages: int, progress, cancelled) -> None:
+    size = raw.stat().st_size or 1
+    done = 0
+    with open(raw, "rb") as src, opener(target, "wb") as out:
+        while True:
+            chunk = src.read(COMPRESS_CHUNK)
+            if not chunk:
+                break
+            out.write(chunk)
+            done += len(chunk)
+            if progress:
+                progress(pages + pages * done // size, 2 * pages)
+            if cancelled and cancelled():
+                raise BackupCancelled()
+
+
+def run_backup(dest_dir, compression: Optional[str] = "gz", pages: int = BACKUP_PAGES,
+               progress: Optional[Callable[[int, int], None]] = None, cancelled: Optional[Callable[[], bool]] = None,
+               max_restarts: int = BACKUP_MAX_RESTARTS, db_path=None) -> Dict[str, Any]:
+    """Back the database up into `dest_dir` as a new timestamped file.
+
+    `progress(done, total)` counts copied pages for the first half of `total`
+    and compressed pages for the second. Raises BackupCancelled if `cancelled()`
+    turns true; partial files are always removed. Once the stepped copy has
+    restarted `max_restarts` times it is redone in a single step, and
+    `fallback` is True in the result.
+    Returns {path, pages, bytes, restarts, fallback, seconds}.
+    """
+    if compression not in COMPRESSORS:
+        raise ValueError(f"unknown backup compression {compression!r}; expected one of gz, xz or None")
+    started = time.monotonic()
+    dest = Path(dest_dir)
+    dest.mkdir(parents=True, exist_ok=True)
+    stamp = datetime.now()
+    final = dest / backup_filename(stamp, compression)
+    raw = dest / (backup_filename(stamp, None) + ".partial")
+    packed = final.with_name(final.name + ".partial")
+    opener = COMPRESSORS[compression][0]
+    try:
+        copied = _copy(db_path, raw, pages, progress, cancelled, max_restarts)
+        verify(raw)
+        if opener is None:
+            raw.replace(final)
+        else:
+            _compress(raw, packed, opener, copied["pages"], progress, cancelled)
+            packed.replace(final)
+    finally:
+        raw.unlink(missing_ok=True)
+        packed.unlink(missing_ok=True)
+    return {"path": str(final), "pages": copied["pages"], "bytes": final.stat().st_size,
+            "restarts": copied["restarts"], "fallback": copied["fallback"],
+            "seconds": round(time.monotonic() - started, 2)}
+
+
+def prune(dest_dir, keep: int) -> int:
+    """Delete all but the newest `keep` backups in `dest_dir`; returns how many were removed."""
+    backups = sorted(p for p in Path(dest_dir).glob("licensing_*.db*") if not p.name.endswith(".partial"))
+    stale = backups[:-keep] if keep > 0 else backups
+    for p in stale:
+        p.unlink(missing_ok=True)
+    return len(stale)
+
+
+class BackupJob(BackgroundJob):
+    """A backup running on a daemon thread (see jobs.BackgroundJob).
+
+    `run(progress, cancelled)` does the work (services.backup_database).
+    """
+
+    def __init__(self, run: Callable[[Callable[[int, int], None], Callable[[], bool]], Any]):
+        super().__init__(run, name="licensing-backup")
@@ -1,9 +1,14 @@
 import re
+import json
+import math
 import sqlite3
 import contextlib
 import logging
+import os
+import threading
+from datetime import date
 from pathlib import Path
-from typing import Optional, List, Any, Dict, Union
+from typing import Optional, List, Any, Dict, Iterator, Tuple, Union
 
 logger = logging.getLogger(__name__)
 
@@ -116,6 +121,52 @@ def get_db_connection(db_path: Optional[Path] = None):
         conn.close()
 
 
+def readonly_uri(db_path: Optional[Path] = None) -> str:
+    """file: URI that opens (or ATTACHes) the database read-only."""
+    return Path(db_path or DEFAULT_DB).resolve().as_uri() + "?mode=ro"
+
+
+def get_readonly_conn(db_path: Optional[Path] = None) -> sqlite3.Connection:
+    """Connection that can only read (mode=ro), for worker processes that must not take write locks."""
+    conn = sqlite3.connect(readonly_uri(db_path), uri=True)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+# Dedicated per-file connections used only to read PRAGMA data_version.
+_version_watchers: Dict[str, tuple] = {}
+_version_lock = threading.Lock()
+_watcher_generation = 0
+
+
+def get_data_version(db_path: Optional[Path] = None) -> tuple:
+    """Return an opaque token that changes whenever any connection commits to the database.
+
+    SQLite bumps PRAGMA data_version on a connection when *another* connection
+    commits, so a long-lived watcher connection that never writes sees every
+    change made through get_conn(). Use the token as a cache key.
+    """
+    global _watcher_generation
+    path = str(db_path or DEFAULT_DB)
+    try:
+        st = os.stat(path)
+        ident = (st.st_dev, st.st_ino)
+    except OSError:
+        ident = None
+    with _version_lock:
+        entry = _version_watchers.get(path)
+        if entry is None or entry[1] != ident:
+            if entry is not None:
+                entry[0].close()
+            _watcher_generation += 1
+            watcher = sqlite3.connect(path, check_same_thread=False)
+            entry = (watcher, ident, _watcher_generation)
+            _version_watchers[path] = entry
+        watcher, _, generation = entry
+        version = watcher.execute("PRAGMA data_version").fetchone()[0]
+    return (generation, version)
+
+
 def init_db(db_path: Optional[Path] = None) -> None:
     conn = get_conn(db_path)
     cur = conn.cursor()
@@ -200,46 +251,477 @@ def _migrate_db(db_path: Optional[Path] = None) -> None:
             "module": "TEXT",
             "is_practice": "INTEGER DEFAULT 0",
             "passed": "INTEGER",
-            "reimbursement_requested": "INTEGER DEFAULT 0"
+            "reimbursement_requested": "INTEGER DEFAULT 0",
+            "score_value": "REAL",
+            "created_at": "TEXT",
+            "updated_at": "TEXT",
+            "uid": "TEXT"
         },
         "recruiter": {
-            "rep_code": "TEXT"
+            "rep_code": "TEXT",
+            "created_at": "TEXT",
+            "updated_at": "TEXT",
+            "uid": "TEXT"
         },
         "trainee": {
             "rep_code": "TEXT",
             "rvp_name": "TEXT",
-            "rvp_rep_code": "TEXT"
+            "rvp_rep_code": "TEXT",
+            "created_at": "TEXT",
+            "updated_at": "TEXT",
+            "uid": "TEXT"
         },
         "license": {
             "license_type": "TEXT",
-            "invoiced": "INTEGER DEFAULT 0"
+            "invoiced": "INTEGER DEFAULT 0",
+            "expiry_date": "TEXT",
+            "created_at": "TEXT",
+            "updated_at": "TEXT",
+            "uid": "TEXT"
+        },
+        "class": {
+            "uid": "TEXT"
         }
     }
 
     logger.info("Starting database migrations...")
-    for table, cols in migrations.items():
-        _ensure_columns(table, cols, db_path)
+    added = {table: _ensure_columns(table, cols, db_path) for table, cols in migrations.items()}
 
     # Special table handling
     _ensure_practice_status_table(db_path)
-
-
-def _ensure_columns(table_name: str, column_definitions: Dict[str, str], db_path: Optional[Path] = None) -> None:
-    """Utility to ensure specified columns exist in a table."""
+    _ensure_indexes(db_path)
+    _ensure_exam_change_tracking(db_path)
+    _ensure_activity_journal(db_path)
+    _ensure_license_status_history(db_path)
+    if "score_value" in added["exam"]:
+        # Once only: scores that do not parse stay NULL and would otherwise be re-parsed on every start
+        _backfill_score_values(db_path)
+    _ensure_report_cube(db_path)
+    _ensure_trainee_milestones(db_path)
+    _ensure_invoice_ledger(db_path)
+    _ensure_change_log(db_path)
+    _ensure_change_timestamps(db_path)
+
+
+def _ensure_columns(table_name: str, column_definitions: Dict[str, str], db_path: Optional[Path] = None) -> List[str]:
+    """Utility to ensure specified columns exist in a table; returns the columns it added."""
     conn = get_conn(db_path)
     cur = conn.cursor()
+    added = []
     try:
         cur.execute(f"PRAGMA table_info({table_name})")
         existing_cols = {r['name'] for r in cur.fetchall()}
         for col_name, col_def in column_definitions.items():
             if col_name not in existing_cols:
                 cur.execute(f"ALTER TABLE {table_name} ADD COLUMN {col_name} {col_def}")
+                added.append(col_name)
+        conn.commit()
+    finally:
+        conn.close()
+    return added
+
+
+
+
+
+# A license still waiting on approval; {l} is the license table or alias. The deadline
+# scanner repeats this expression verbatim so SQLite can use the partial index below.
+PENDING_LICENSE_SQL = "(LOWER({l}.status) IN ('pending', 'waiting', '') OR {l}.status IS NULL)"
+
+
+def _ensure_indexes(db_path: Optional[Path] = None) -> None:
+    """Create the secondary indexes used by the reporting and lookup queries."""
+    indexes = {
+        "idx_license_trainee_submitted": "license(trainee_id, application_submitted_date)",
+        "idx_exam_trainee_date": "exam(trainee_id, exam_date)",
+        "idx_trainee_rvp": "trainee(rvp_name, rvp_rep_code)",
+        "idx_license_submitted": "license(application_submitted_date, id)",
+        "idx_exam_date": "exam(exam_date)",
+        "idx_exam_module_date": "exam(module, exam_date, is_practice, passed)",
+        "idx_exam_trainee_outcome": "exam(trainee_id, is_practice, exam_date, passed)",
+        "idx_practice_status_completion": "practice_exam_status(trainee_id, completed, module, completed_date)",
+        "idx_license_trainee_approval": "license(trainee_id, approval_date)",
+        "idx_license_approval": "license(approval_date)",
+        "idx_trainee_rvp_recruiter": "trainee(rvp_name, rvp_rep_code, recruiter_id, last_name, first_name)",
+        "idx_license_expiry": "license(expiry_date) WHERE expiry_date IS NOT NULL",
+        "idx_trainee_name": "trainee(last_name, first_name)",
+        "idx_license_uninvoiced": "license(trainee_id) WHERE invoiced = 0",
+        "idx_trainee_updated": "trainee(updated_at)",
+        "idx_recruiter_updated": "recruiter(updated_at)",
+        "idx_exam_updated": "exam(updated_at)",
+        "idx_license_updated": "license(updated_at)",
+        "idx_license_pending_submitted": f"license(application_submitted_date) WHERE {PENDING_LICENSE_SQL.format(l='license')}",
+    }
+    conn = get_conn(db_path)
+    cur = conn.cursor()
+    try:
+        for name, target in indexes.items():
+            cur.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {target}")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _ensure_exam_change_tracking(db_path: Optional[Path] = None) -> None:
+    """Record the exam_date of every exam row written so date-bucketed caches can refresh only what changed.
+
+    Table schema:
+        exam_date_change(seq INTEGER PRIMARY KEY, exam_date TEXT)
+    Updates log both the old and new date since a row can move between buckets.
+    Readers prune what they have consumed (prune_exam_date_changes).
+    """
+    conn = get_conn(db_path)
+    cur = conn.cursor()
+    try:
+        cur.executescript(
+            """
+CREATE TABLE IF NOT EXISTS exam_date_change (
+    seq INTEGER PRIMARY KEY,
+    exam_date TEXT
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_exam_date_change_insert AFTER INSERT ON exam
+BEGIN
+    INSERT INTO exam_date_change (exam_date) VALUES (NEW.exam_date);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_exam_date_change_update
+AFTER UPDATE OF exam_date, module, is_practice, passed ON exam
+BEGIN
+    INSERT INTO exam_date_change (exam_date) VALUES (OLD.exam_date);
+    INSERT INTO exam_date_change (exam_date) VALUES (NEW.exam_date);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_exam_date_change_delete AFTER DELETE ON exam
+BEGIN
+    INSERT INTO exam_date_change (exam_date) VALUES (OLD.exam_date);
+END;
+            """
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def prune_exam_date_changes(consumed_seq: int, min_rows: int = 1, db_path: Optional[Path] = None) -> int:
+    """Delete exam_date_change rows before `consumed_seq` once at least `min_rows` of them have piled up.
+
+    The row at `consumed_seq` is kept so new rows keep getting higher seqs. Seqs
+    are otherwise contiguous, so a reader that finds MIN(seq) past its own seq + 1
+    knows rows it never saw were pruned and must rebuild in full.
+    Returns the number of rows deleted.
+    """
+    with get_db_connection(db_path) as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT MIN(seq) FROM exam_date_change")
+        oldest = cur.fetchone()[0]
+        if oldest is None or consumed_seq - oldest < min_rows:
+            return 0
+        cur.execute("DELETE FROM exam_date_change WHERE seq < ?", (consumed_seq,))
+        conn.commit()
+        return cur.rowcount
+
+
+# entity table -> (feed type, SQL summary built from the row alias {r}, user-editable columns)
+# Updates only journal when one of the listed columns is written, so derived/bookkeeping
+# columns maintained by migrations or triggers do not flood the feed.
+ACTIVITY_ENTITIES = {
+    "trainee": (
+        "Trainee",
+        "{r}.first_name || ' ' || {r}.last_name",
+        "first_name, last_name, dob, recruiter_id, rep_code, rvp_name, rvp_rep_code"
+    ),
+    "exam": (
+        "Exam",
+        "COALESCE((SELECT last_name FROM trainee WHERE id = {r}.trainee_id), '—') || ' (' || "
+        "COALESCE({r}.module, '—') || '): ' || "
+        "CASE {r}.passed WHEN 1 THEN 'Passed' WHEN 0 THEN 'Failed' ELSE 'Taken' END",
+        "trainee_id, class_id, exam_date, score, notes, module, is_practice, passed, reimbursement_requested"
+    ),
+    "license": (
+        "License",
+        "COALESCE((SELECT last_name FROM trainee WHERE id = {r}.trainee_id), '—') || ': ' || COALESCE({r}.status, '—')",
+        "trainee_id, application_submitted_date, approval_date, license_number, status, notes, license_type, invoiced"
+    ),
+}
+
+
+def _ensure_activity_journal(db_path: Optional[Path] = None) -> None:
+    """Ensure the append-only activity journal and the triggers that feed it exist.
+
+    Table schema:
+        activity_event(id INTEGER PRIMARY KEY, ts TEXT, entity_type TEXT, entity_id INTEGER, action TEXT, summary TEXT)
+    ts is UTC with millisecond precision. On first creation the journal is seeded
+    from existing rows that have a date: exams by exam date, licenses by
+    application date, trainees by the earliest of those. Seeds are clamped to
+    now, and undated rows are not seeded, so no history lands above real activity.
+    """
+    conn = get_conn(db_path)
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'activity_event'")
+        is_new = cur.fetchone() is None
+        cur.executescript(
+            """
+CREATE TABLE IF NOT EXISTS activity_event (
+    id INTEGER PRIMARY KEY,
+    ts TEXT NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now')),
+    entity_type TEXT NOT NULL,
+    entity_id INTEGER,
+    action TEXT NOT NULL,
+    summary TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_activity_event_ts ON activity_event(ts);
+            """
+        )
+        for table, (entity_type, summary, columns) in ACTIVITY_ENTITIES.items():
+            events = (("INSERT", "added", "NEW"), (f"UPDATE OF {columns}", "updated", "NEW"), ("DELETE", "deleted", "OLD"))
+            for event, action, row in events:
+                cur.execute(
+                    f"CREATE TRIGGER IF NOT EXISTS trg_activity_{table}_{event.split()[0].lower()} AFTER {event} ON {table} "
+                    f"BEGIN "
+                    f"INSERT INTO activity_event (entity_type, entity_id, action, summary) "
+                    f"VALUES ('{entity_type}', {row}.id, '{action}', {summary.format(r=row)}); "
+                    f"END"
+                )
+        if is_new:
+            now = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+            seeds = {
+                "trainee": "(SELECT MIN(d) FROM (SELECT MIN(exam_date) AS d FROM exam WHERE trainee_id = t.id "
+                           "UNION ALL SELECT MIN(application_submitted_date) FROM license WHERE trainee_id = t.id))",
+                "exam": "t.exam_date",
+                "license": "t.application_submitted_date",
+            }
+            for table, ts_expr in seeds.items():
+                entity_type, summary, _ = ACTIVITY_ENTITIES[table]
+                cur.execute(
+                    f"INSERT INTO activity_event (ts, entity_type, entity_id, action, summary) "
+                    f"SELECT MIN(s.ts, {now}), '{entity_type}', s.id, 'added', s.summary FROM "
+                    f"(SELECT {ts_expr} AS ts, t.id AS id, {summary.format(r='t')} AS summary FROM {table} t) s "
+                    f"WHERE s.ts IS NOT NULL AND s.ts != '' ORDER BY s.id"
+                )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+
+def _ensure_license_status_history(db_path: Optional[Path] = None) -> None:
+    """Ensure license status changes are journaled so status can be queried as of any date.
+
+    Table schema:
+        license_status_history(id INTEGER PRIMARY KEY, license_id INTEGER, status TEXT, changed_at TEXT)
+    A new license starts at its application date; later status changes are stamped
+    with the UTC time they were saved. On first creation history is reconstructed
+    from existing rows: approved licenses get a Pending span from submission to
+    approval, everything else a single row for its current status.
+    """
+    conn = get_conn(db_path)
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'license_status_history'")
+        is_new = cur.fetchone() is None
+        cur.executescript(
+            """
+CREATE TABLE IF NOT EXISTS license_status_history (
+    id INTEGER PRIMARY KEY,
+    license_id INTEGER NOT NULL,
+    status TEXT,
+    changed_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now')),
+    FOREIGN KEY(license_id) REFERENCES license(id) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS idx_license_status_history ON license_status_history(license_id, changed_at);
+
+CREATE TRIGGER IF NOT EXISTS trg_license_status_insert AFTER INSERT ON license
+BEGIN
+    INSERT INTO license_status_history (license_id, status, changed_at)
+    VALUES (NEW.id, NEW.status, COALESCE(NEW.application_submitted_date, strftime('%Y-%m-%d %H:%M:%f', 'now')));
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_license_status_update AFTER UPDATE OF status ON license
+WHEN OLD.status IS NOT NEW.status
+BEGIN
+    INSERT INTO license_status_history (license_id, status) VALUES (NEW.id, NEW.status);
+END;
+            """
+        )
+        if is_new:
+            approved = (
+                "LOWER(status) IN ('approved', 'issued', 'active') AND application_submitted_date IS NOT NULL "
+                "AND approval_date > application_submitted_date"
+            )
+            cur.execute(
+                f"INSERT INTO license_status_history (license_id, status, changed_at) "
+                f"SELECT id, 'Pending', application_submitted_date FROM license WHERE {approved}"
+            )
+            cur.execute(
+                f"INSERT INTO license_status_history (license_id, status, changed_at) "
+                f"SELECT id, status, CASE WHEN {approved} THEN approval_date "
+                f"ELSE COALESCE(application_submitted_date, approval_date, strftime('%Y-%m-%d %H:%M:%f', 'now')) END "
+                f"FROM license"
+            )
+        conn.commit()
+    finally:
+        conn.close()
+
+# Tables whose rows carry created_at / updated_at, maintained by the triggers below
+TIMESTAMPED_TABLES = ("trainee", "recruiter", "exam", "license")
+
+
+def _ensure_change_timestamps(db_path: Optional[Path] = None) -> None:
+    """Create the triggers that stamp created_at / updated_at, and the export watermark table.
+
+    Rows that predate the columns keep NULL timestamps (their history is
+    unknown); a delta export without a watermark includes them. The update
+    trigger fires only when a statement leaves updated_at unchanged, so
+    callers that set it explicitly (and the insert trigger's own stamp) are
+    respected. Only updated_at is written, so the UPDATE OF triggers of the
+    activity journal and status history never cascade from it.
+
+    Table schema:
+        export_watermark(feed TEXT PRIMARY KEY, watermark TEXT, exported_at TEXT)
+    """
+    now = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+    conn = get_conn(db_path)
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            """
+CREATE TABLE IF NOT EXISTS export_watermark (
+    feed TEXT PRIMARY KEY,
+    watermark TEXT NOT NULL,
+    exported_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now'))
+)
+            """
+        )
+        for table in TIMESTAMPED_TABLES:
+            cur.execute(
+                f"CREATE TRIGGER IF NOT EXISTS trg_{table}_created AFTER INSERT ON {table} "
+                f"WHEN NEW.created_at IS NULL OR NEW.updated_at IS NULL "
+                f"BEGIN UPDATE {table} SET created_at = COALESCE(NEW.created_at, {now}), "
+                f"updated_at = COALESCE(NEW.updated_at, {now}) WHERE id = NEW.id; END"
+            )
+            cur.execute(
+                f"CREATE TRIGGER IF NOT EXISTS trg_{table}_updated AFTER UPDATE ON {table} "
+                f"WHEN NEW.updated_at IS OLD.updated_at "
+                f"BEGIN UPDATE {table} SET updated_at = {now} WHERE id = NEW.id; END"
+            )
         conn.commit()
     finally:
         conn.close()
 
+# Tables replicated by sync.py, parents first: the data columns whose updates are
+# logged, and the foreign keys that travel as the referenced row's uid
+SYNC_TABLES = {
+    "recruiter": {"columns": ["name", "email", "phone", "rep_code"], "refs": {}},
+    "class": {"columns": ["name", "start_date", "end_date"], "refs": {}},
+    "trainee": {
+        "columns": ["first_name", "last_name", "dob", "recruiter_id", "rep_code", "rvp_name", "rvp_rep_code"],
+        "refs": {"recruiter_id": "recruiter"},
+    },
+    "exam": {
+        "columns": ["trainee_id", "class_id", "exam_date", "score", "score_value", "notes", "module",
+                    "is_practice", "passed", "reimbursement_requested"],
+        "refs": {"trainee_id": "trainee", "class_id": "class"},
+    },
+    "license": {
+        "columns": ["trainee_id", "application_submitted_date", "approval_date", "license_number", "status",
+                    "notes", "license_type", "invoiced", "expiry_date"],
+        "refs": {"trainee_id": "trainee"},
+    },
+}
+
+
+def _ensure_change_log(db_path: Optional[Path] = None) -> None:
+    """Create the change-data-capture log used by sync.py and the triggers that feed it.
+
+    Every SYNC_TABLES row gets a random uid (its identity across databases).
+    change_log keeps one entry per row, the latest change: an insert, update
+    or delete replaces the previous entry with a new, ever-increasing version
+    (AUTOINCREMENT, so versions are never reused). site and ts stamp where and
+    when the change was made; sync overwrites them with the origin's stamp
+    when it applies a peer's change. Updates are logged only for the data
+    columns, so uid and timestamp stamping never produce entries. On first
+    creation existing rows get uids and an 'I' entry so a first sync sends them.
+
+    Table schema:
+        sync_state(id = 1, site_id TEXT)  -- this database's random site id
+        sync_peer(site_id TEXT PRIMARY KEY, last_seen INTEGER, synced_at TEXT)  -- peer's change_log version applied here
+        change_log(version INTEGER PRIMARY KEY AUTOINCREMENT, tbl, row_id, uid, op 'I'|'U'|'D'|'A', site, ts)
+    op 'A' marks a row moved to the archive file (archive_trainees).
+    """
+    now = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+    site = "(SELECT site_id FROM sync_state WHERE id = 1)"
+    conn = get_conn(db_path)
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'change_log'")
+        is_new = cur.fetchone() is None
+        cur.executescript(
+            """
+CREATE TABLE IF NOT EXISTS sync_state (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    site_id TEXT NOT NULL
+);
+INSERT OR IGNORE INTO sync_state (id, site_id) VALUES (1, lower(hex(randomblob(8))));
 
+CREATE TABLE IF NOT EXISTS sync_peer (
+    site_id TEXT PRIMARY KEY,
+    last_seen INTEGER NOT NULL DEFAULT 0,
+    synced_at TEXT
+);
 
+CREATE TABLE IF NOT EXISTS change_log (
+    version INTEGER PRIMARY KEY AUTOINCREMENT,
+    tbl TEXT NOT NULL,
+    row_id INTEGER NOT NULL,
+    uid TEXT NOT NULL,
+    op TEXT NOT NULL,
+    site TEXT NOT NULL,
+    ts TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_change_log_row ON change_log(tbl, uid);
+            """
+        )
+        for table, spec in SYNC_TABLES.items():
+            if is_new:
+                # Handing out uids is not an edit: drop the updated_at stamp trigger for the
+                # backfill; _ensure_change_timestamps runs next and recreates it.
+                cur.execute(f"DROP TRIGGER IF EXISTS trg_{table}_updated")
+                cur.execute(f"UPDATE {table} SET uid = lower(hex(randomblob(16))) WHERE uid IS NULL")
+                stamp = ("COALESCE(updated_at, created_at, '1970-01-01 00:00:00.000')"
+                         if table in TIMESTAMPED_TABLES else "'1970-01-01 00:00:00.000'")
+                cur.execute(
+                    f"INSERT INTO change_log (tbl, row_id, uid, op, site, ts) "
+                    f"SELECT '{table}', id, uid, 'I', {site}, {stamp} FROM {table} ORDER BY id"
+                )
+            cur.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS idx_{table}_uid ON {table}(uid)")
+            cur.execute(
+                f"CREATE TRIGGER IF NOT EXISTS trg_cdc_{table}_insert AFTER INSERT ON {table} "
+                f"BEGIN "
+                f"UPDATE {table} SET uid = lower(hex(randomblob(16))) WHERE id = NEW.id AND NEW.uid IS NULL; "
+                f"INSERT OR REPLACE INTO change_log (tbl, row_id, uid, op, site, ts) "
+                f"VALUES ('{table}', NEW.id, (SELECT uid FROM {table} WHERE id = NEW.id), 'I', {site}, {now}); "
+                f"END"
+            )
+            cur.execute(
+                f"CREATE TRIGGER IF NOT EXISTS trg_cdc_{table}_update AFTER UPDATE OF {', '.join(spec['columns'])} "
+                f"ON {table} WHEN NEW.uid IS NOT NULL "
+                f"BEGIN "
+                f"INSERT OR REPLACE INTO change_log (tbl, row_id, uid, op, site, ts) "
+                f"VALUES ('{table}', NEW.id, NEW.uid, 'U', {site}, {now}); "
+                f"END"
+            )
+            cur.execute(
+                f"CREATE TRIGGER IF NOT EXISTS trg_cdc_{table}_delete AFTER DELETE ON {table} WHEN OLD.uid IS NOT NULL "
+                f"BEGIN "
+                f"INSERT OR REPLACE INTO change_log (tbl, row_id, uid, op, site, ts) "
+                f"VALUES ('{table}', OLD.id, OLD.uid, 'D', {site}, {now}); "
+                f"END"
+            )
+        conn.commit()
+    finally:
+        conn.close()
 
 
 def _ensure_practice_status_table(db_path: Optional[Path] = None) -> None:
@@ -319,6 +801,295 @@ CREATE TABLE practice_exam_status (
         conn.close()
 
 
+def _parse_score(score: Optional[str]) -> Optional[float]:
+    """Parse a free-text exam score into a percentage.
+
+    Accepts "85", "85.5", "85%" and "42/50" (-> 84.0). Returns None when the
+    text is empty, not recognisable as a score, or not a finite number
+    ("nan", "inf", "1e400").
+    """
+    if score is None:
+        return None
+    s = str(score).strip().rstrip('%').strip()
+    if not s:
+        return None
+    try:
+        if '/' in s:
+            num, den = (float(p) for p in s.split('/', 1))
+            value = round(num / den * 100, 2) if den else None
+        else:
+            value = float(s)
+    except (ValueError, OverflowError):
+        return None
+    return value if value is not None and math.isfinite(value) else None
+
+
+def _backfill_score_values(db_path: Optional[Path] = None) -> None:
+    """Populate exam.score_value from the text scores; run when the column is first added."""
+    conn = get_conn(db_path)
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT id, score FROM exam WHERE score IS NOT NULL AND score_value IS NULL")
+        updates = [(v, r['id']) for r in cur.fetchall() if (v := _parse_score(r['score'])) is not None]
+        if updates:
+            cur.executemany("UPDATE exam SET score_value = ? WHERE id = ?", updates)
+            logger.info(f"Backfilled numeric scores for {len(updates)} exams")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+
+def _ensure_report_cube(db_path: Optional[Path] = None) -> None:
+    """Create the pre-aggregated reporting cube and its refresh bookkeeping.
+
+    Table schema:
+        report_cube(month, rvp_name, rvp_rep_code, recruiter_id, module, is_practice,
+                    licenses_issued, licenses_pending, licenses_invoiced, exams_taken, exams_passed)
+        report_cube_state(id = 1, open_month TEXT, refreshed_at TEXT)
+        report_cube_dirty(month TEXT PRIMARY KEY)
+    License facts have NULL module/is_practice; facts without a usable date go
+    in month CUBE_UNDATED. open_month is the earliest month the next incremental
+    refresh re-rolls; it only moves forward. Triggers add the old and new fact
+    month of every license/exam write, and every month of a trainee whose
+    RVP/recruiter changes, to report_cube_dirty so closed months get re-rolled too.
+    """
+    conn = get_conn(db_path)
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'report_cube_dirty'")
+        is_new = cur.fetchone() is None
+        lic_old, lic_new = (CUBE_LICENSE_MONTH_SQL.format(r=r) for r in ("OLD", "NEW"))
+        exam_old, exam_new = (CUBE_EXAM_MONTH_SQL.format(r=r) for r in ("OLD", "NEW"))
+        mark = "INSERT OR IGNORE INTO report_cube_dirty (month) VALUES"
+        cur.executescript(
+            f"""
+CREATE TABLE IF NOT EXISTS report_cube (
+    month TEXT NOT NULL,
+    rvp_name TEXT,
+    rvp_rep_code TEXT,
+    recruiter_id INTEGER,
+    module TEXT,
+    is_practice INTEGER,
+    licenses_issued INTEGER NOT NULL DEFAULT 0,
+    licenses_pending INTEGER NOT NULL DEFAULT 0,
+    licenses_invoiced INTEGER NOT NULL DEFAULT 0,
+    exams_taken INTEGER NOT NULL DEFAULT 0,
+    exams_passed INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE INDEX IF NOT EXISTS idx_report_cube_month ON report_cube(month);
+
+CREATE TABLE IF NOT EXISTS report_cube_state (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    open_month TEXT NOT NULL,
+    refreshed_at TEXT
+);
+
+CREATE TABLE IF NOT EXISTS report_cube_dirty (
+    month TEXT PRIMARY KEY
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS trg_cube_license_insert AFTER INSERT ON license
+BEGIN
+    {mark} ({lic_new});
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_cube_license_update
+AFTER UPDATE OF trainee_id, application_submitted_date, approval_date, status, invoiced ON license
+BEGIN
+    {mark} ({lic_old});
+    {mark} ({lic_new});
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_cube_license_delete AFTER DELETE ON license
+BEGIN
+    {mark} ({lic_old});
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_cube_exam_insert AFTER INSERT ON exam
+BEGIN
+    {mark} ({exam_new});
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_cube_exam_update
+AFTER UPDATE OF trainee_id, exam_date, module, is_practice, passed ON exam
+BEGIN
+    {mark} ({exam_old});
+    {mark} ({exam_new});
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_cube_exam_delete AFTER DELETE ON exam
+BEGIN
+    {mark} ({exam_old});
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_cube_trainee_update
+AFTER UPDATE OF rvp_name, rvp_rep_code, recruiter_id ON trainee
+BEGIN
+    INSERT OR IGNORE INTO report_cube_dirty (month)
+    SELECT {CUBE_LICENSE_MONTH_SQL.format(r="l")} FROM license l WHERE l.trainee_id = NEW.id
+    UNION SELECT {CUBE_EXAM_MONTH_SQL.format(r="e")} FROM exam e WHERE e.trainee_id = NEW.id;
+END;
+            """
+        )
+        if is_new:
+            # Closed months rolled before tracking existed may be stale: rebuild in full next time
+            cur.execute("DELETE FROM report_cube_state")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+# Recompute the funnel milestones of the trainees matching {where} (alias t)
+_MILESTONE_ROW_SQL = """
+    INSERT OR REPLACE INTO trainee_milestone (trainee_id, practice_done, first_exam, first_pass, approved)
+    SELECT t.id,
+           (SELECT CASE WHEN COUNT(*) = (SELECT COUNT(*) FROM milestone_module) THEN MAX(ps.completed_date) END
+            FROM practice_exam_status ps
+            WHERE ps.trainee_id = t.id AND ps.completed = 1 AND ps.module IN (SELECT module FROM milestone_module)),
+           (SELECT MIN(e.exam_date) FROM exam e
+            WHERE e.trainee_id = t.id AND COALESCE(e.is_practice, 0) = 0 AND e.exam_date IS NOT NULL),
+           (SELECT MIN(e.exam_date) FROM exam e
+            WHERE e.trainee_id = t.id AND COALESCE(e.is_practice, 0) = 0 AND e.passed = 1),
+           (SELECT MIN(l.approval_date) FROM license l WHERE l.trainee_id = t.id AND l.approval_date > '')
+    FROM trainee t
+    WHERE {where}
+"""
+
+# table -> columns whose changes move a milestone
+MILESTONE_SOURCES = {
+    "exam": ("trainee_id", "exam_date", "is_practice", "passed"),
+    "license": ("trainee_id", "approval_date"),
+    "practice_exam_status": ("trainee_id", "module", "completed", "completed_date"),
+}
+
+
+def _ensure_trainee_milestones(db_path: Optional[Path] = None) -> None:
+    """Keep each trainee's time-to-license milestones in one row for the funnel report.
+
+    Table schema:
+        trainee_milestone(trainee_id INTEGER PRIMARY KEY, practice_done TEXT, first_exam TEXT,
+                          first_pass TEXT, approved TEXT)
+        milestone_module(module TEXT PRIMARY KEY)  -- practice modules that must all be complete
+    practice_done is the last completion date once every milestone_module is
+    complete; first_exam/first_pass are the first provincial (non-practice)
+    exam and pass; approved is the first license approval. Triggers on the
+    MILESTONE_SOURCES tables recompute the affected trainee's row on every
+    write; set_milestone_modules() recomputes them all when the module list changes.
+    """
+    conn = get_conn(db_path)
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'trainee_milestone'")
+        is_new = cur.fetchone() is None
+        cur.executescript(
+            """
+CREATE TABLE IF NOT EXISTS trainee_milestone (
+    trainee_id INTEGER PRIMARY KEY,
+    practice_done TEXT,
+    first_exam TEXT,
+    first_pass TEXT,
+    approved TEXT
+);
+
+CREATE TABLE IF NOT EXISTS milestone_module (
+    module TEXT PRIMARY KEY
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS trg_milestone_trainee_delete AFTER DELETE ON trainee
+BEGIN
+    DELETE FROM trainee_milestone WHERE trainee_id = OLD.id;
+END;
+            """
+        )
+        for table, columns in MILESTONE_SOURCES.items():
+            for event, ids in (("INSERT", "NEW.trainee_id"), (f"UPDATE OF {', '.join(columns)}",
+                               "OLD.trainee_id, NEW.trainee_id"), ("DELETE", "OLD.trainee_id")):
+                name = event.split()[0].lower()
+                cur.execute(
+                    f"CREATE TRIGGER IF NOT EXISTS trg_milestone_{table}_{name} AFTER {event} ON {table} "
+                    f"BEGIN {_MILESTONE_ROW_SQL.format(where=f't.id IN ({ids})')}; END"
+                )
+        if is_new:
+            cur.execute(_MILESTONE_ROW_SQL.format(where="1"))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def set_milestone_modules(modules: List[str], db_path: Optional[Path] = None) -> bool:
+    """Make `modules` the practice modules a trainee must complete; True if that changed the stored list.
+
+    A change recomputes every trainee's milestones, so it costs one pass over the data.
+    """
+    with get_db_connection(db_path) as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT module FROM milestone_module")
+        if {r["module"] for r in cur.fetchall()} == set(modules):
+            return False
+        cur.execute("BEGIN IMMEDIATE")
+        try:
+            cur.execute("DELETE FROM milestone_module")
+            cur.executemany("INSERT INTO milestone_module (module) VALUES (?)", [(m,) for m in set(modules)])
+            cur.execute(_MILESTONE_ROW_SQL.format(where="1"))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return True
+
+
+DEFAULT_INVOICE_AMOUNT = 50.0
+
+
+def _ensure_invoice_ledger(db_path: Optional[Path] = None) -> None:
+    """Create the invoice ledger tables and seed the default per-license rate.
+
+    Table schema:
+        invoice_rate(license_type TEXT PRIMARY KEY, amount REAL)  -- '*' is the fallback rate
+        invoice_batch(id, run_id, created_at, rvp_name, rvp_rep_code, line_count, total_amount)
+        invoice_line(id, batch_id, license_id UNIQUE, amount)
+    A license can only ever appear on one invoice line, which makes runs idempotent.
+    """
+    conn = get_conn(db_path)
+    cur = conn.cursor()
+    try:
+        cur.executescript(
+            f"""
+CREATE TABLE IF NOT EXISTS invoice_rate (
+    license_type TEXT PRIMARY KEY,
+    amount REAL NOT NULL
+);
+INSERT OR IGNORE INTO invoice_rate (license_type, amount) VALUES ('*', {DEFAULT_INVOICE_AMOUNT});
+
+CREATE TABLE IF NOT EXISTS invoice_batch (
+    id INTEGER PRIMARY KEY,
+    run_id INTEGER NOT NULL,
+    created_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now')),
+    rvp_name TEXT NOT NULL,
+    rvp_rep_code TEXT,
+    line_count INTEGER NOT NULL DEFAULT 0,
+    total_amount REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_invoice_batch_run ON invoice_batch(run_id);
+CREATE INDEX IF NOT EXISTS idx_invoice_batch_rvp ON invoice_batch(rvp_name, rvp_rep_code);
+
+CREATE TABLE IF NOT EXISTS invoice_line (
+    id INTEGER PRIMARY KEY,
+    batch_id INTEGER NOT NULL,
+    license_id INTEGER NOT NULL UNIQUE,
+    amount REAL NOT NULL,
+    FOREIGN KEY(batch_id) REFERENCES invoice_batch(id) ON DELETE CASCADE,
+    FOREIGN KEY(license_id) REFERENCES license(id) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS idx_invoice_line_batch ON invoice_line(batch_id);
+            """
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
 def _validate_rep_code(rep_code: Optional[str]) -> Optional[str]:
     """Validate rep_code is 5 alphanumeric characters. Return uppercased code or raise ValueError.
 
@@ -407,14 +1178,20 @@ def update_trainee(trainee_id: int, first_name: str, last_name: str, dob: Option
 def delete_trainee(trainee_id: int, db_path: Optional[Path] = None) -> None:
     trainee_crud.delete(trainee_id, db_path=db_path)
 
-def get_trainee(trainee_id: int, db_path: Optional[Path] = None) -> Optional[sqlite3.Row]:
-    return trainee_crud.get(trainee_id, db_path=db_path)
+def get_trainee(trainee_id: int, db_path: Optional[Path] = None, include_archive: bool = False) -> Optional[sqlite3.Row]:
+    row = trainee_crud.get(trainee_id, db_path=db_path)
+    if row is None and include_archive:
+        with get_db_connection(db_path) as conn:
+            if attach_archive(conn, db_path):
+                row = conn.execute("SELECT * FROM archive.trainee WHERE id = ?", (trainee_id,)).fetchone()
+    return row
 
-def list_trainees(db_path: Optional[Path] = None) -> List[sqlite3.Row]:
+def list_trainees(db_path: Optional[Path] = None, include_archive: bool = False) -> List[sqlite3.Row]:
     with get_db_connection(db_path) as conn:
         cur = conn.cursor()
+        trainee = _with_archive(conn, "trainee", include_archive, db_path)
         cur.execute(
-            "SELECT t.*, r.name as recruiter_name FROM trainee t LEFT JOIN recruiter r ON t.recruiter_id = r.id ORDER BY t.last_name, t.first_name"
+            f"SELECT t.*, r.name as recruiter_name FROM {trainee} t LEFT JOIN recruiter r ON t.recruiter_id = r.id ORDER BY t.last_name, t.first_name"
         )
         rows = cur.fetchall()
     return rows
@@ -452,6 +1229,7 @@ def add_exam(trainee_id: int, class_id: Optional[int], exam_date: Optional[str],
         "class_id": class_id,
         "exam_date": exam_date,
         "score": score,
+        "score_value": _parse_score(score),
         "notes": notes,
         "module": module,
         "is_practice": int(bool(is_practice)),
@@ -545,6 +1323,7 @@ def update_exam(exam_id: int, trainee_id: int, class_id: Optional[int], exam_dat
         "class_id": class_id,
         "exam_date": exam_date,
         "score": score,
+        "score_value": _parse_score(score),
         "notes": notes,
         "module": module,
         "is_practice": int(bool(is_practice)),
@@ -568,7 +1347,8 @@ def list_exams(db_path: Optional[Path] = None) -> List[sqlite3.Row]:
 
 def add_license(trainee_id: int, application_submitted_date: Optional[str], approval_date: Optional[str], 
                 license_number: Optional[str], status: Optional[str], notes: Optional[str], 
-                license_type: Optional[str] = None, invoiced: bool = False, db_path: Optional[Path] = None) -> int:
+                license_type: Optional[str] = None, invoiced: bool = False, expiry_date: Optional[str] = None,
+                db_path: Optional[Path] = None) -> int:
     return license_crud.add({
         "trainee_id": trainee_id,
         "application_submitted_date": application_submitted_date,
@@ -577,12 +1357,14 @@ def add_license(trainee_id: int, application_submitted_date: Optional[str], appr
         "status": status,
         "notes": notes,
         "license_type": license_type,
-        "invoiced": 1 if invoiced else 0
+        "invoiced": 1 if invoiced else 0,
+        "expiry_date": expiry_date
     }, db_path=db_path)
 
 def update_license(license_id: int, trainee_id: int, application_submitted_date: Optional[str], approval_date: Optional[str], 
                    license_number: Optional[str], status: Optional[str], notes: Optional[str],
-                   license_type: Optional[str] = None, invoiced: bool = False, db_path: Optional[Path] = None) -> None:
+                   license_type: Optional[str] = None, invoiced: bool = False, expiry_date: Optional[str] = None,
+                   db_path: Optional[Path] = None) -> None:
     license_crud.update(license_id, {
         "trainee_id": trainee_id,
         "application_submitted_date": application_submitted_date,
@@ -591,7 +1373,8 @@ def update_license(license_id: int, trainee_id: int, application_submitted_date:
         "status": status,
         "notes": notes,
         "license_type": license_type,
-        "invoiced": 1 if invoiced else 0
+        "invoiced": 1 if invoiced else 0,
+        "expiry_date": expiry_date
     }, db_path=db_path)
 
 def delete_license(license_id: int, db_path: Optional[Path] = None) -> None:
@@ -607,6 +1390,165 @@ def list_licenses(db_path: Optional[Path] = None) -> List[sqlite3.Row]:
         rows = cur.fetchall()
     return rows
 
+def query_licenses(rvp: Optional[tuple] = None, license_type: Optional[str] = None, text: Optional[str] = None,
+                   status: Optional[str] = None, limit: Optional[int] = None, after: Optional[tuple] = None,
+                   recruiter_id: Optional[int] = None, unassigned: bool = False, trainee_id: Optional[int] = None,
+                   db_path: Optional[Path] = None) -> List[sqlite3.Row]:
+    """List licenses joined to their trainee with all filtering done in SQL.
+
+    rvp is a (rvp_name, rvp_rep_code) pair; recruiter_id and trainee_id narrow
+    it to one branch of the RVP tree, and unassigned=True to trainees without a
+    recruiter. text matches the trainee name
+    ("Last, First") or the license number; status is compared case-insensitively.
+    Rows are ordered newest submission first. For paging, pass the
+    (application_submitted_date, id) of the last row seen as `after`.
+    """
+    clauses = []
+    params: List[Any] = []
+    if rvp is not None:
+        rvp_name, rvp_rep_code = rvp
+        clauses.append("t.rvp_name = ? AND t.rvp_rep_code IS ?")
+        params += [rvp_name, rvp_rep_code]
+    if recruiter_id is not None or unassigned:
+        clauses.append("t.recruiter_id IS ?")
+        params.append(recruiter_id)
+    if trainee_id is not None:
+        clauses.append("l.trainee_id = ?")
+        params.append(trainee_id)
+    if license_type:
+        clauses.append("l.license_type = ?")
+        params.append(license_type)
+    if text:
+        pattern = "%" + text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        clauses.append(
+            "(t.last_name || ', ' || t.first_name LIKE ? ESCAPE '\\' OR l.license_number LIKE ? ESCAPE '\\')"
+        )
+        params += [pattern, pattern]
+    if status:
+        clauses.append("LOWER(l.status) = LOWER(?)")
+        params.append(status)
+    if after is not None:
+        after_date, after_id = after
+        if after_date is None:
+            clauses.append("(l.application_submitted_date IS NULL AND l.id < ?)")
+            params.append(after_id)
+        else:
+            # DESC order puts NULL dates last
+            clauses.append(
+                "(l.application_submitted_date < ? OR (l.application_submitted_date = ? AND l.id < ?) "
+                "OR l.application_submitted_date IS NULL)"
+            )
+            params += [after_date, after_date, after_id]
+
+    sql = (
+        "SELECT l.*, t.first_name, t.last_name, t.rvp_name, t.rvp_rep_code "
+        "FROM license l JOIN trainee t ON l.trainee_id = t.id"
+    )
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY l.application_submitted_date DESC, l.id DESC"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(int(limit))
+
+    with get_db_connection(db_path) as conn:
+        cur = conn.cursor()
+        cur.execute(sql, params)
+        rows = cur.fetchall()
+    return rows
+
+def list_activity_events(limit: int = 10, before: Optional[tuple] = None, db_path: Optional[Path] = None) -> List[sqlite3.Row]:
+    """Return journal entries newest first. Pass the (ts, id) of the last entry seen as `before` to page back."""
+    with get_db_connection(db_path) as conn:
+        cur = conn.cursor()
+        if before is None:
+            cur.execute("SELECT * FROM activity_event ORDER BY ts DESC, id DESC LIMIT ?", (limit,))
+        else:
+            before_ts, before_id = before
+            cur.execute(
+                "SELECT * FROM activity_event WHERE ts < ? OR (ts = ? AND id < ?) "
+                "ORDER BY ts DESC, id DESC LIMIT ?",
+                (before_ts, before_ts, before_id, limit)
+            )
+        rows = cur.fetchall()
+    return rows
+
+
+def get_license_status_counts_as_of(as_of: str, db_path: Optional[Path] = None) -> Dict[Optional[str], int]:
+    """Number of licenses in each status at the end of the given ISO date, from license_status_history."""
+    with get_db_connection(db_path) as conn:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            SELECT status, COUNT(*) AS cnt
+            FROM (
+                SELECT status, ROW_NUMBER() OVER (
+                    PARTITION BY license_id ORDER BY changed_at DESC, id DESC
+                ) AS rn
+                FROM license_status_history
+                WHERE changed_at < date(?, '+1 day')
+            )
+            WHERE rn = 1
+            GROUP BY status
+            ORDER BY status
+            """,
+            (as_of,)
+        )
+        rows = cur.fetchall()
+    return {r['status']: r['cnt'] for r in rows}
+
+
+def scan_license_deadlines(pending_before: str, expiring_before: str, today: str, limit: int = 50,
+                           db_path: Optional[Path] = None) -> Dict[str, Any]:
+    """Find licenses pending since before `pending_before` and licenses expiring before `expiring_before`.
+
+    Every query is a range scan on a partial index (pending submissions, non-NULL
+    expiry dates), so the cost tracks the number of hits rather than license history.
+    Returns counts ('stale_pending', 'expiring', 'expired' relative to `today`) and
+    up to `limit` rows of each kind, oldest submission / soonest expiry first.
+    """
+    pending = PENDING_LICENSE_SQL.format(l='l')
+    columns = (
+        "l.id, l.trainee_id, t.first_name, t.last_name, l.license_type, l.status, "
+        "l.application_submitted_date, l.expiry_date"
+    )
+    with get_db_connection(db_path) as conn:
+        cur = conn.cursor()
+        cur.execute(
+            f"SELECT COUNT(*) FROM license l WHERE {pending} AND l.application_submitted_date < ?",
+            (pending_before,)
+        )
+        stale_count = cur.fetchone()[0]
+        cur.execute(
+            "SELECT COUNT(*) AS total, COALESCE(SUM(l.expiry_date < ?), 0) AS expired FROM license l "
+            "WHERE l.expiry_date IS NOT NULL AND l.expiry_date < ?",
+            (today, expiring_before)
+        )
+        expiry = cur.fetchone()
+        cur.execute(
+            f"SELECT {columns} FROM license l JOIN trainee t ON t.id = l.trainee_id "
+            f"WHERE {pending} AND l.application_submitted_date < ? "
+            f"ORDER BY l.application_submitted_date LIMIT ?",
+            (pending_before, limit)
+        )
+        stale_rows = cur.fetchall()
+        cur.execute(
+            f"SELECT {columns} FROM license l JOIN trainee t ON t.id = l.trainee_id "
+            f"WHERE l.expiry_date IS NOT NULL AND l.expiry_date < ? "
+            f"ORDER BY l.expiry_date LIMIT ?",
+            (expiring_before, limit)
+        )
+        expiry_rows = cur.fetchall()
+    return {
+        "counts": {
+            "stale_pending": stale_count,
+            "expiring": expiry["total"] - expiry["expired"],
+            "expired": expiry["expired"],
+        },
+        "stale_pending": stale_rows,
+        "expiring": expiry_rows,
+    }
+
 
 def get_practice_module_completion_count(trainee_id: int, required_modules: List[str], db_path: Optional[Path] = None) -> int:
     """Return count of required practice modules marked as complete for the trainee."""
@@ -643,7 +1585,7 @@ def get_rvp_invoice_summary(db_path: Optional[Path] = None) -> List[sqlite3.Row]
     with get_db_connection(db_path) as conn:
         cur = conn.cursor()
         sql = """
-            SELECT l.id as license_id, l.license_type, l.invoiced,
+            SELECT l.id as license_id, l.license_type, l.invoiced, l.license_number, l.application_submitted_date,
                    t.first_name, t.last_name, t.rvp_name, t.rvp_rep_code 
             FROM license l
             JOIN trainee t ON l.trainee_id = t.id
@@ -654,6 +1596,139 @@ def get_rvp_invoice_summary(db_path: Optional[Path] = None) -> List[sqlite3.Row]
         rows = cur.fetchall()
     return rows
 
+def get_invoice_rates(db_path: Optional[Path] = None) -> Dict[str, float]:
+    """Per-license invoice amount by license type; the '*' entry applies to every other type."""
+    with get_db_connection(db_path) as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT license_type, amount FROM invoice_rate ORDER BY license_type")
+        rows = cur.fetchall()
+    return {r['license_type']: r['amount'] for r in rows}
+
+def set_invoice_rate(license_type: str, amount: float, db_path: Optional[Path] = None) -> None:
+    """Set the per-license invoice amount for a license type ('*' for the default)."""
+    with get_db_connection(db_path) as conn:
+        cur = conn.cursor()
+        cur.execute(
+            "INSERT INTO invoice_rate (license_type, amount) VALUES (?, ?) "
+            "ON CONFLICT(license_type) DO UPDATE SET amount = excluded.amount",
+            (license_type, float(amount))
+        )
+        conn.commit()
+
+def create_invoice_run(rvp: Optional[tuple] = None, submitted_through: Optional[str] = None,
+                       db_path: Optional[Path] = None) -> List[sqlite3.Row]:
+    """Invoice every uninvoiced license of one RVP, or of all RVPs, in a single transaction.
+
+    rvp is a (rvp_name, rvp_rep_code) pair; submitted_through optionally limits the
+    run to applications submitted on or before that date. One invoice_batch is
+    created per RVP with a line per license priced from invoice_rate, batch totals
+    are summed in SQL and the licenses are flagged invoiced. Licenses already on an
+    invoice line, or flagged invoiced by hand, are skipped, so re-running is a no-op.
+    Returns the batches created (possibly none).
+    """
+    clauses = ["l.invoiced = 0", "t.rvp_name IS NOT NULL", "t.rvp_name != ''",
+               "NOT EXISTS (SELECT 1 FROM invoice_line il WHERE il.license_id = l.id)"]
+    params: List[Any] = []
+    if rvp is not None:
+        clauses.append("t.rvp_name = ? AND t.rvp_rep_code IS ?")
+        params += list(rvp)
+    if submitted_through:
+        clauses.append("l.application_submitted_date <= ?")
+        params.append(submitted_through)
+    eligible = "FROM license l JOIN trainee t ON t.id = l.trainee_id WHERE " + " AND ".join(clauses)
+
+    with get_db_connection(db_path) as conn:
+        cur = conn.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        try:
+            cur.execute("SELECT COALESCE(MAX(run_id), 0) + 1 FROM invoice_batch")
+            run_id = cur.fetchone()[0]
+            cur.execute(
+                f"INSERT INTO invoice_batch (run_id, rvp_name, rvp_rep_code) "
+                f"SELECT DISTINCT ?, t.rvp_name, t.rvp_rep_code {eligible}",
+                [run_id] + params
+            )
+            cur.execute(
+                f"""
+                INSERT INTO invoice_line (batch_id, license_id, amount)
+                SELECT b.id, l.id, COALESCE(r.amount, d.amount, {DEFAULT_INVOICE_AMOUNT})
+                FROM license l
+                JOIN trainee t ON t.id = l.trainee_id
+                JOIN invoice_batch b ON b.run_id = ? AND b.rvp_name = t.rvp_name AND b.rvp_rep_code IS t.rvp_rep_code
+                LEFT JOIN invoice_rate r ON r.license_type = l.license_type
+                LEFT JOIN invoice_rate d ON d.license_type = '*'
+                WHERE {" AND ".join(clauses)}
+                """,
+                [run_id] + params
+            )
+            cur.execute(
+                """
+                UPDATE invoice_batch SET
+                    line_count = (SELECT COUNT(*) FROM invoice_line il WHERE il.batch_id = invoice_batch.id),
+                    total_amount = (SELECT COALESCE(SUM(il.amount), 0) FROM invoice_line il WHERE il.batch_id = invoice_batch.id)
+                WHERE run_id = ?
+                """,
+                (run_id,)
+            )
+            cur.execute(
+                "UPDATE license SET invoiced = 1 WHERE id IN ("
+                "SELECT il.license_id FROM invoice_line il JOIN invoice_batch b ON b.id = il.batch_id WHERE b.run_id = ?)",
+                (run_id,)
+            )
+            cur.execute("SELECT * FROM invoice_batch WHERE run_id = ? ORDER BY rvp_name, rvp_rep_code", (run_id,))
+            batches = cur.fetchall()
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    logger.info(f"Invoice run {run_id}: {len(batches)} batch(es), {sum(b['line_count'] for b in batches)} license(s)")
+    return batches
+
+def list_invoice_batches(rvp: Optional[tuple] = None, db_path: Optional[Path] = None) -> List[sqlite3.Row]:
+    """Invoice batches newest first, optionally for one (rvp_name, rvp_rep_code)."""
+    with get_db_connection(db_path) as conn:
+        cur = conn.cursor()
+        if rvp is None:
+            cur.execute("SELECT * FROM invoice_batch ORDER BY id DESC")
+        else:
+            cur.execute(
+                "SELECT * FROM invoice_batch WHERE rvp_name = ? AND rvp_rep_code IS ? ORDER BY id DESC",
+                tuple(rvp)
+            )
+        rows = cur.fetchall()
+    return rows
+
+
+# Invoice lines billed to one RVP (name, rep_code) in [start, end) by created_at, for statements
+RVP_STATEMENT_SQL = """
+    SELECT b.id AS batch_id, substr(b.created_at, 1, 10) AS invoiced_on, t.last_name, t.first_name,
+           l.license_type, l.license_number, l.application_submitted_date, il.amount
+    FROM invoice_batch b
+    JOIN invoice_line il ON il.batch_id = b.id
+    JOIN license l ON l.id = il.license_id
+    JOIN trainee t ON t.id = l.trainee_id
+    WHERE b.rvp_name = ? AND b.rvp_rep_code IS ? AND b.created_at >= ? AND b.created_at < ?
+    ORDER BY b.id, t.last_name, t.first_name
+"""
+
+
+# Copies one RVP's rows from the attached live database (src) into an extract (main), in
+# this order. Each statement is driven by an index: idx_trainee_rvp picks the trainees, the
+# trainee_id indexes their exams, licenses and practice rows, and primary keys the few
+# recruiters and classes they refer to, so an extract reads only its own rows. CROSS JOIN
+# pins the small extract trainee table as the outer loop (it has no statistics yet).
+RVP_EXTRACT_COPY_SQL = {
+    "trainee": "INSERT INTO main.trainee SELECT * FROM src.trainee WHERE rvp_name = ? AND rvp_rep_code IS ?",
+    "exam": "INSERT INTO main.exam SELECT e.* FROM main.trainee t CROSS JOIN src.exam e ON e.trainee_id = t.id",
+    "license": "INSERT INTO main.license SELECT l.* FROM main.trainee t CROSS JOIN src.license l ON l.trainee_id = t.id",
+    "practice_exam_status": "INSERT INTO main.practice_exam_status SELECT p.* FROM main.trainee t "
+                            "CROSS JOIN src.practice_exam_status p ON p.trainee_id = t.id",
+    "recruiter": "INSERT INTO main.recruiter SELECT * FROM src.recruiter "
+                 "WHERE id IN (SELECT recruiter_id FROM main.trainee)",
+    "class": "INSERT INTO main.class SELECT * FROM src.class WHERE id IN (SELECT class_id FROM main.exam)",
+}
+
+
 def list_unique_rvps(db_path: Optional[Path] = None) -> List[sqlite3.Row]:
     """Get list of unique RVPs (name, rep_code) from existing trainees."""
     with get_db_connection(db_path) as conn:
@@ -662,20 +1737,28 @@ def list_unique_rvps(db_path: Optional[Path] = None) -> List[sqlite3.Row]:
         rows = cur.fetchall()
     return rows
 
-def get_rvp_stats(db_path: Optional[Path] = None) -> List[dict]:
-    """Get license counts (Active/Issued vs Pending) per RVP."""
+# License counts shared by every level of the RVP hierarchy (rows are trainee t LEFT JOIN license l)
+_LICENSE_COUNT_COLUMNS = f"""
+    COUNT(l.id) as total_licenses,
+    SUM(CASE WHEN LOWER(l.status) IN ('approved', 'issued', 'active') THEN 1 ELSE 0 END) as issued_count,
+    SUM(CASE WHEN l.id IS NOT NULL AND {PENDING_LICENSE_SQL.format(l='l')} THEN 1 ELSE 0 END) as pending_count,
+    SUM(CASE WHEN l.invoiced = 1 THEN 1 ELSE 0 END) as invoiced_count
+"""
+
+def get_rvp_stats(db_path: Optional[Path] = None, include_archive: bool = False) -> List[dict]:
+    """Get trainee and license counts (Active/Issued vs Pending) per RVP, optionally counting archived trainees."""
     with get_db_connection(db_path) as conn:
         cur = conn.cursor()
-        sql = """
+        trainee = _with_archive(conn, "trainee", include_archive, db_path)
+        license = _with_archive(conn, "license", include_archive, db_path)
+        sql = f"""
             SELECT 
                 t.rvp_name, 
                 t.rvp_rep_code,
-                COUNT(l.id) as total_licenses,
-                SUM(CASE WHEN LOWER(l.status) IN ('approved', 'issued', 'active') THEN 1 ELSE 0 END) as issued_count,
-                SUM(CASE WHEN LOWER(l.status) IN ('pending', 'waiting', '') OR l.status IS NULL THEN 1 ELSE 0 END) as pending_count,
-                SUM(CASE WHEN l.invoiced = 1 THEN 1 ELSE 0 END) as invoiced_count
-            FROM trainee t
-            LEFT JOIN license l ON t.id = l.trainee_id
+                COUNT(DISTINCT t.id) as trainee_count,
+                {_LICENSE_COUNT_COLUMNS}
+            FROM {trainee} t
+            LEFT JOIN {license} l ON t.id = l.trainee_id
             WHERE t.rvp_name IS NOT NULL AND t.rvp_name != ''
             GROUP BY t.rvp_name, t.rvp_rep_code
             ORDER BY t.rvp_name
@@ -684,6 +1767,46 @@ def get_rvp_stats(db_path: Optional[Path] = None) -> List[dict]:
         rows = cur.fetchall()
     return [dict(r) for r in rows]
 
+def get_rvp_recruiter_stats(rvp_name: str, rvp_rep_code: Optional[str] = None, db_path: Optional[Path] = None) -> List[dict]:
+    """Trainee and license counts per recruiter under one RVP (recruiter_id None = unassigned trainees)."""
+    with get_db_connection(db_path) as conn:
+        cur = conn.cursor()
+        sql = f"""
+            SELECT
+                t.recruiter_id,
+                r.name as recruiter_name,
+                COUNT(DISTINCT t.id) as trainee_count,
+                {_LICENSE_COUNT_COLUMNS}
+            FROM trainee t
+            LEFT JOIN recruiter r ON r.id = t.recruiter_id
+            LEFT JOIN license l ON t.id = l.trainee_id
+            WHERE t.rvp_name = ? AND t.rvp_rep_code IS ?
+            GROUP BY t.recruiter_id
+            ORDER BY r.name IS NULL, r.name
+        """
+        cur.execute(sql, (rvp_name, rvp_rep_code))
+        rows = cur.fetchall()
+    return [dict(r) for r in rows]
+
+def get_rvp_trainee_stats(rvp_name: str, rvp_rep_code: Optional[str], recruiter_id: Optional[int],
+                          db_path: Optional[Path] = None) -> List[dict]:
+    """License counts per trainee under one RVP and recruiter (None matches trainees without a recruiter)."""
+    with get_db_connection(db_path) as conn:
+        cur = conn.cursor()
+        sql = f"""
+            SELECT
+                t.id, t.first_name, t.last_name,
+                {_LICENSE_COUNT_COLUMNS}
+            FROM trainee t
+            LEFT JOIN license l ON t.id = l.trainee_id
+            WHERE t.rvp_name = ? AND t.rvp_rep_code IS ? AND t.recruiter_id IS ?
+            GROUP BY t.id
+            ORDER BY t.last_name, t.first_name
+        """
+        cur.execute(sql, (rvp_name, rvp_rep_code, recruiter_id))
+        rows = cur.fetchall()
+    return [dict(r) for r in rows]
+
 def get_trainees_by_rvp(rvp_name: str, rvp_rep_code: Optional[str] = None, db_path: Optional[Path] = None) -> List[sqlite3.Row]:
     """List all trainees assigned to a specific RVP."""
     with get_db_connection(db_path) as conn:
@@ -701,19 +1824,10 @@ def get_trainees_by_rvp(rvp_name: str, rvp_rep_code: Optional[str] = None, db_pa
         return cur.fetchall()
 
 
-def get_license_info_for_trainee(trainee_id: int, db_path: Optional[Path] = None) -> Optional[dict]:
-    """Retrieve license information for a specific trainee."""
-    with get_db_connection(db_path) as conn:
-        cur = conn.cursor()
-        cur.execute(
-            "SELECT application_submitted_date, approval_date, license_number, status, license_type, invoiced "
-            "FROM license WHERE trainee_id = ? ORDER BY application_submitted_date DESC LIMIT 1",
-            (trainee_id,)
-        )
-        row = cur.fetchone()
-    if not row:
-        return None
+def _license_info(row: sqlite3.Row) -> dict:
     return {
+        "id": row["id"],
+        "trainee_id": row["trainee_id"],
         "application_submitted_date": row["application_submitted_date"],
         "approval_date": row["approval_date"],
         "license_number": row["license_number"],
@@ -721,6 +1835,585 @@ def get_license_info_for_trainee(trainee_id: int, db_path: Optional[Path] = None
         "license_type": row["license_type"],
         "invoiced": bool(row["invoiced"])
     }
+
+
+def get_latest_licenses(trainee_ids: Optional[List[int]] = None, db_path: Optional[Path] = None) -> Dict[int, dict]:
+    """Return a map of trainee_id -> most recently submitted license.
+
+    Uses a single window-function pass over the (trainee_id, application_submitted_date)
+    index. When trainee_ids is None every trainee with a license is included.
+    """
+    sql = """
+        SELECT id, trainee_id, application_submitted_date, approval_date, license_number,
+               status, license_type, invoiced
+        FROM (
+            SELECT l.*, ROW_NUMBER() OVER (
+                PARTITION BY l.trainee_id
+                ORDER BY l.application_submitted_date DESC, l.id DESC
+            ) AS rn
+            FROM license l
+            {where}
+        )
+        WHERE rn = 1
+    """
+    params: tuple = ()
+    where = ""
+    if trainee_ids is not None:
+        if not trainee_ids:
+            return {}
+        # One bound JSON array instead of thousands of placeholders
+        where = "WHERE l.trainee_id IN (SELECT value FROM json_each(?))"
+        params = (json.dumps([int(t) for t in trainee_ids]),)
+    with get_db_connection(db_path) as conn:
+        cur = conn.cursor()
+        cur.execute(sql.format(where=where), params)
+        rows = cur.fetchall()
+    return {r["trainee_id"]: _license_info(r) for r in rows}
+
+
+def get_license_info_for_trainee(trainee_id: int, db_path: Optional[Path] = None) -> Optional[dict]:
+    """Retrieve license information for a specific trainee."""
+    return get_latest_licenses([trainee_id], db_path=db_path).get(trainee_id)
+
+
+
+CUBE_DIMENSIONS = ("month", "rvp_name", "rvp_rep_code", "recruiter_id", "module", "is_practice")
+CUBE_MEASURES = ("licenses_issued", "licenses_pending", "licenses_invoiced", "exams_taken", "exams_passed")
+
+# Month of facts with no (valid) date; sorts before every real month
+CUBE_UNDATED = ""
+
+# Fact month of a license/exam row {r}: licenses are dated by approval, falling back to submission
+CUBE_LICENSE_MONTH_SQL = (
+    "COALESCE(strftime('%Y-%m', COALESCE({r}.approval_date, {r}.application_submitted_date)), '" + CUBE_UNDATED + "')"
+)
+CUBE_EXAM_MONTH_SQL = "COALESCE(strftime('%Y-%m', {r}.exam_date), '" + CUBE_UNDATED + "')"
+
+# Every license and exam row as one fact, rolled up per trainee RVP/recruiter in a single grouped pass.
+# The status buckets match get_rvp_stats. The inner date filters only exist so the indexes can skip
+# closed history; the outer month filter (open months plus dirty ones) decides.
+_CUBE_ROLLUP_SQL = """
+    INSERT INTO report_cube ({dims}, {measures})
+    SELECT f.month, t.rvp_name, t.rvp_rep_code, t.recruiter_id, f.module, f.is_practice,
+           SUM(f.issued), SUM(f.pending), SUM(f.invoiced), SUM(f.taken), SUM(f.passed)
+    FROM (
+        SELECT {license_month} AS month,
+               l.trainee_id, NULL AS module, NULL AS is_practice,
+               CASE WHEN LOWER(l.status) IN ('approved', 'issued', 'active') THEN 1 ELSE 0 END AS issued,
+               CASE WHEN {pending} THEN 1 ELSE 0 END AS pending,
+               CASE WHEN l.invoiced = 1 THEN 1 ELSE 0 END AS invoiced,
+               0 AS taken, 0 AS passed
+        FROM license l
+        WHERE l.approval_date >= :since OR l.application_submitted_date >= :since{license_undated}
+        UNION ALL
+        SELECT {exam_month}, e.trainee_id, e.module, COALESCE(e.is_practice, 0),
+               0, 0, 0, 1, CASE WHEN e.passed = 1 THEN 1 ELSE 0 END
+        FROM exam e
+        WHERE e.exam_date >= :since{exam_undated}
+    ) f
+    JOIN trainee t ON t.id = f.trainee_id
+    WHERE f.month >= :month OR f.month IN (SELECT value FROM json_each(:dirty))
+    GROUP BY f.month, t.rvp_name, t.rvp_rep_code, t.recruiter_id, f.module, f.is_practice
+"""
+
+
+def refresh_report_cube(full: bool = False, db_path: Optional[Path] = None) -> str:
+    """Re-roll the reporting cube and return the first month that was rebuilt.
+
+    Normally only months from the stored open_month onward (the current month,
+    plus the previous one right after a month rollover) are deleted and
+    re-aggregated, together with any closed month a write has touched since
+    the last refresh (report_cube_dirty); other closed months are left as they
+    are. Pass full=True, or call on a cube that was never built, to rebuild
+    all history.
+    """
+    current = date.today().strftime("%Y-%m")
+    with get_db_connection(db_path) as conn:
+        cur = conn.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        try:
+            cur.execute("SELECT open_month FROM report_cube_state WHERE id = 1")
+            row = cur.fetchone()
+            start = CUBE_UNDATED if full or row is None else min(row["open_month"], current)
+            cur.execute("SELECT month FROM report_cube_dirty WHERE month < ?", (start,))
+            dirty = [r["month"] for r in cur.fetchall()]
+            dated = [m for m in dirty if m != CUBE_UNDATED]
+            since = min([start, *dated])
+            # Undated facts can't be found through the date indexes; scan for them only when needed
+            undated = start == CUBE_UNDATED or CUBE_UNDATED in dirty
+            cur.execute("DELETE FROM report_cube WHERE month >= ? OR month IN (SELECT value FROM json_each(?))",
+                        (start, json.dumps(dirty)))
+            cur.execute(
+                _CUBE_ROLLUP_SQL.format(
+                    dims=", ".join(CUBE_DIMENSIONS), measures=", ".join(CUBE_MEASURES),
+                    pending=PENDING_LICENSE_SQL.format(l="l"),
+                    license_month=CUBE_LICENSE_MONTH_SQL.format(r="l"), exam_month=CUBE_EXAM_MONTH_SQL.format(r="e"),
+                    license_undated=" OR strftime('%Y-%m', COALESCE(l.approval_date, l.application_submitted_date)) IS NULL"
+                    if undated else "",
+                    exam_undated=" OR strftime('%Y-%m', e.exam_date) IS NULL" if undated else "",
+                ),
+                {"since": f"{since}-01" if since else "", "month": start, "dirty": json.dumps(dirty)}
+            )
+            cur.execute("DELETE FROM report_cube_dirty")
+            cur.execute(
+                "INSERT INTO report_cube_state (id, open_month, refreshed_at) VALUES (1, ?, datetime('now')) "
+                "ON CONFLICT(id) DO UPDATE SET open_month = excluded.open_month, refreshed_at = excluded.refreshed_at",
+                (current,)
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    logger.info(f"Refreshed report cube from {start or 'the beginning'}")
+    return start
+
+
+def query_report_cube(group_by: List[str], filters: Optional[Dict[str, Any]] = None,
+                      month_from: Optional[str] = None, month_to: Optional[str] = None,
+                      db_path: Optional[Path] = None) -> List[sqlite3.Row]:
+    """Slice and dice the reporting cube.
+
+    group_by lists the CUBE_DIMENSIONS to keep (an empty list gives grand totals);
+    every CUBE_MEASURES column is summed over the rest. filters maps a dimension to
+    a value (None matches NULL) or a list of values. month_from/month_to bound the
+    "YYYY-MM" month inclusively and leave out undated facts (month CUBE_UNDATED).
+    Grouping by recruiter_id also returns recruiter_name.
+    """
+    filters = filters or {}
+    unknown = [d for d in list(group_by) + list(filters) if d not in CUBE_DIMENSIONS]
+    if unknown:
+        raise ValueError(f"Unknown cube dimension(s): {', '.join(map(str, unknown))}")
+
+    clauses = []
+    params: List[Any] = []
+    for dim, value in filters.items():
+        if isinstance(value, (list, tuple, set)):
+            clauses.append(f"c.{dim} IN (SELECT value FROM json_each(?))")
+            params.append(json.dumps(list(value)))
+        else:
+            clauses.append(f"c.{dim} IS ?")
+            params.append(value)
+    if month_from:
+        clauses.append("c.month >= ?")
+        params.append(month_from)
+    if month_to:
+        clauses.append("c.month <= ?")
+        params.append(month_to)
+    if month_from or month_to:
+        clauses.append("c.month != ?")
+        params.append(CUBE_UNDATED)
+
+    select = [f"c.{d}" for d in group_by]
+    join = ""
+    if "recruiter_id" in group_by:
+        select.append("r.name AS recruiter_name")
+        join = " LEFT JOIN recruiter r ON r.id = c.recruiter_id"
+    select += [f"SUM(c.{m}) AS {m}" for m in CUBE_MEASURES]
+    sql = f"SELECT {', '.join(select)} FROM report_cube c{join}"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    if group_by:
+        keys = ", ".join(f"c.{d}" for d in group_by)
+        sql += f" GROUP BY {keys} ORDER BY {keys}"
+
+    with get_db_connection(db_path) as conn:
+        cur = conn.cursor()
+        cur.execute(sql, params)
+        rows = cur.fetchall()
+    return rows
+
+
+# Provincial attempts numbered per (trainee, module) in date order; undated exams count last
+PROVINCIAL_ATTEMPTS_SQL = """
+    SELECT e.*, ROW_NUMBER() OVER (
+        PARTITION BY e.trainee_id, e.module ORDER BY e.exam_date IS NULL, e.exam_date, e.id
+    ) AS attempt
+    FROM exam e
+    WHERE COALESCE(e.is_practice, 0) = 0 {where}
+"""
+
+
+def list_provincial_attempts(trainee_id: int, db_path: Optional[Path] = None) -> List[sqlite3.Row]:
+    """A trainee's provincial exams, newest first, each with its attempt number for that module."""
+    with get_db_connection(db_path) as conn:
+        cur = conn.cursor()
+        cur.execute(
+            f"SELECT * FROM ({PROVINCIAL_ATTEMPTS_SQL.format(where='AND e.trainee_id = ?')}) "
+            f"ORDER BY exam_date DESC, id DESC",
+            (trainee_id,)
+        )
+        rows = cur.fetchall()
+    return rows
+
+
+# Export dataset -> explicit output columns ({name: SQL expression}), FROM clause and ORDER BY.
+# Orders follow an index so rows stream without a sort step.
+EXPORT_DATASETS = {
+    "trainees": {
+        "columns": {
+            "id": "t.id", "first_name": "t.first_name", "last_name": "t.last_name", "dob": "t.dob",
+            "recruiter_id": "t.recruiter_id", "recruiter_name": "r.name", "rep_code": "t.rep_code",
+            "rvp_name": "t.rvp_name", "rvp_rep_code": "t.rvp_rep_code", "updated_at": "t.updated_at",
+        },
+        "from": "trainee t LEFT JOIN recruiter r ON t.recruiter_id = r.id",
+        "order_by": "t.last_name, t.first_name",
+        "changed": "t.updated_at",
+    },
+    "licenses": {
+        "columns": {
+            "id": "l.id", "trainee_id": "l.trainee_id", "first_name": "t.first_name", "last_name": "t.last_name",
+            "license_type": "l.license_type", "status": "l.status",
+            "application_submitted_date": "l.application_submitted_date", "approval_date": "l.approval_date",
+            "expiry_date": "l.expiry_date", "license_number": "l.license_number", "invoiced": "l.invoiced",
+            "notes": "l.notes", "updated_at": "l.updated_at",
+        },
+        "from": "license l JOIN trainee t ON l.trainee_id = t.id",
+        "order_by": "l.application_submitted_date DESC, l.id DESC",
+        "changed": "l.updated_at",
+    },
+    "recruiters": {
+        "columns": {
+            "id": "r.id", "name": "r.name", "email": "r.email", "phone": "r.phone", "rep_code": "r.rep_code",
+            "updated_at": "r.updated_at",
+        },
+        "from": "recruiter r",
+        "order_by": "r.name",
+        "changed": "r.updated_at",
+    },
+}
+
+
+def export_columns(dataset: str) -> List[str]:
+    """Output column names of an export dataset, in order."""
+    return list(EXPORT_DATASETS[dataset]["columns"])
+
+
+def _export_window(dataset: str, since: Optional[str], until: Optional[str]) -> Tuple[str, list]:
+    """WHERE clause and params restricting a dataset to rows changed in [since, until).
+
+    Without `since` rows with no timestamp (older than the columns) are included.
+    """
+    changed = EXPORT_DATASETS[dataset]["changed"]
+    clauses, params = [], []
+    if since is not None:
+        clauses.append(f"{changed} >= ?")
+        params.append(since)
+    if until is not None:
+        clauses.append(f"{changed} < ?" if since is not None else f"({changed} < ? OR {changed} IS NULL)")
+        params.append(until)
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+
+def count_export_rows(dataset: str, db_path: Optional[Path] = None,
+                      since: Optional[str] = None, until: Optional[str] = None) -> int:
+    spec = EXPORT_DATASETS[dataset]
+    where, params = _export_window(dataset, since, until)
+    with get_db_connection(db_path) as conn:
+        cur = conn.cursor()
+        cur.execute(f"SELECT COUNT(*) FROM {spec['from']}{where}", params)
+        return cur.fetchone()[0]
+
+
+def export_cutoff(db_path: Optional[Path] = None) -> str:
+    """Timestamp that closes a delta-export window.
+
+    Taken under a brief write lock: any writer that stamped an earlier
+    updated_at has committed by then, and later writers stamp a later time,
+    so windows [previous cutoff, cutoff) neither miss nor repeat rows.
+    """
+    with get_db_connection(db_path) as conn:
+        cur = conn.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        cur.execute("SELECT strftime('%Y-%m-%d %H:%M:%f', 'now')")
+        cutoff = cur.fetchone()[0]
+        conn.commit()
+    return cutoff
+
+
+def get_export_watermark(feed: str, db_path: Optional[Path] = None) -> Optional[str]:
+    with get_db_connection(db_path) as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT watermark FROM export_watermark WHERE feed = ?", (feed,))
+        row = cur.fetchone()
+    return row['watermark'] if row else None
+
+
+def set_export_watermark(feed: str, watermark: Optional[str], db_path: Optional[Path] = None) -> None:
+    """Store a feed's watermark; None forgets it so the next delta export is a full one."""
+    with get_db_connection(db_path) as conn:
+        cur = conn.cursor()
+        if watermark is None:
+            cur.execute("DELETE FROM export_watermark WHERE feed = ?", (feed,))
+        else:
+            cur.execute(
+                "INSERT INTO export_watermark (feed, watermark) VALUES (?, ?) "
+                "ON CONFLICT(feed) DO UPDATE SET watermark = excluded.watermark, "
+                "exported_at = strftime('%Y-%m-%d %H:%M:%f', 'now')",
+                (feed, watermark)
+            )
+        conn.commit()
+
+
+def iter_export_chunks(dataset: str, chunk_size: int = 5000, db_path: Optional[Path] = None,
+                       since: Optional[str] = None, until: Optional[str] = None) -> Iterator[List[tuple]]:
+    """Yield an export dataset as lists of plain tuples (export_columns order), chunk_size rows at a time.
+
+    Rows come straight off one open cursor, so memory stays proportional to
+    chunk_size. The connection closes when the generator is exhausted or closed.
+    since/until restrict the export to rows changed in that window (see export_cutoff).
+    """
+    spec = EXPORT_DATASETS[dataset]
+    select = ", ".join(f"{expr} AS {name}" for name, expr in spec["columns"].items())
+    where, params = _export_window(dataset, since, until)
+    with get_db_connection(db_path) as conn:
+        conn.row_factory = None
+        cur = conn.cursor()
+        cur.execute(f"SELECT {select} FROM {spec['from']}{where} ORDER BY {spec['order_by']}", params)
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+
+
+# Key columns a bulk import resolves references against (see importers.ImportLookups)
+IMPORT_LOOKUP_QUERIES = {
+    "recruiters": "SELECT id, name, rep_code FROM recruiter",
+    "trainees": "SELECT id, first_name, last_name, rep_code, rvp_name, rvp_rep_code FROM trainee",
+    "classes": "SELECT id, name FROM class",
+    "license_numbers": "SELECT license_number FROM license WHERE license_number IS NOT NULL AND license_number != ''",
+}
+
+
+def load_import_lookups(db_path: Optional[Path] = None) -> Dict[str, List[tuple]]:
+    """Fetch IMPORT_LOOKUP_QUERIES as plain tuples from one read transaction."""
+    with get_db_connection(db_path) as conn:
+        conn.row_factory = None
+        cur = conn.cursor()
+        cur.execute("BEGIN")
+        result = {name: cur.execute(sql).fetchall() for name, sql in IMPORT_LOOKUP_QUERIES.items()}
+        conn.commit()
+    return result
+
+
+def insert_rows(table: str, columns: List[str], rows: List[tuple], db_path: Optional[Path] = None) -> None:
+    """Insert a batch of rows with one executemany in a single transaction."""
+    if not rows:
+        return
+    sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+    with get_db_connection(db_path) as conn:
+        cur = conn.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        try:
+            cur.executemany(sql, rows)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+
+# Records a results file can be matched against (see reconciliation.ResultsIndex)
+RECONCILE_INDEX_QUERIES = {
+    "trainees": "SELECT id, first_name, last_name, rep_code FROM trainee",
+    "licenses": "SELECT id, trainee_id, license_number, license_type, status FROM license",
+    "exams": "SELECT id, trainee_id, module, exam_date, passed FROM exam WHERE COALESCE(is_practice, 0) = 0",
+}
+
+
+def load_reconcile_index(db_path: Optional[Path] = None) -> Dict[str, List[tuple]]:
+    """Fetch RECONCILE_INDEX_QUERIES as plain tuples from one read transaction."""
+    with get_db_connection(db_path) as conn:
+        conn.row_factory = None
+        cur = conn.cursor()
+        cur.execute("BEGIN")
+        result = {name: cur.execute(sql).fetchall() for name, sql in RECONCILE_INDEX_QUERIES.items()}
+        conn.commit()
+    return result
+
+
+def apply_reconciled_results(exam_updates: List[tuple], license_updates: List[tuple],
+                             db_path: Optional[Path] = None) -> None:
+    """Apply matched results in one transaction.
+
+    exam_updates: (passed, score, score_value, exam_id)
+    license_updates: (status, approval_date, license_number, expiry_date, license_id)
+    A NULL in either keeps the stored value.
+    """
+    with get_db_connection(db_path) as conn:
+        cur = conn.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        try:
+            cur.executemany(
+                "UPDATE exam SET passed = COALESCE(?, passed), score = COALESCE(?, score), score_value = COALESCE(?, score_value) "
+                "WHERE id = ?",
+                exam_updates,
+            )
+            cur.executemany(
+                "UPDATE license SET status = COALESCE(?, status), approval_date = COALESCE(?, approval_date), "
+                "license_number = COALESCE(?, license_number), expiry_date = COALESCE(?, expiry_date) WHERE id = ?",
+                license_updates,
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+
+# Tables moved by archive_trainees(), parents first: the column tying a row to its trainee, and
+# the table that column points at when the tie runs through one of the trainee's licenses.
+# Status history and invoice lines hang off licenses and would otherwise be lost to ON DELETE CASCADE.
+ARCHIVE_TABLES = {
+    "trainee": ("id", None),
+    "exam": ("trainee_id", None),
+    "license": ("trainee_id", None),
+    "practice_exam_status": ("trainee_id", None),
+    "trainee_class": ("trainee_id", None),
+    "license_status_history": ("license_id", "license"),
+    "invoice_line": ("license_id", "license"),
+}
+# Archive tables keep the live columns and indexes but no foreign keys: recruiters, classes
+# and invoice batches stay in the live database.
+_FOREIGN_KEY_CLAUSE = re.compile(
+    r",\s*FOREIGN KEY\s*\([^)]*\)\s*REFERENCES\s+\w+\s*\([^)]*\)"
+    r"(\s+ON\s+(DELETE|UPDATE)\s+(SET\s+NULL|SET\s+DEFAULT|CASCADE|RESTRICT|NO\s+ACTION))*",
+    re.IGNORECASE,
+)
+
+
+def archive_path(db_path: Optional[Path] = None) -> Path:
+    """The archive file that belongs to a database: licensing.db -> licensing_archive.db."""
+    path = Path(db_path or DEFAULT_DB)
+    return path.with_name(f"{path.stem}_archive{path.suffix}")
+
+
+def _table_columns(conn: sqlite3.Connection, schema: str, table: str) -> List[str]:
+    return [r[1] for r in conn.execute(f"PRAGMA {schema}.table_info({table})").fetchall()]
+
+
+def _ensure_archive_schema(conn: sqlite3.Connection) -> None:
+    """Create the attached archive's tables and indexes from the live schema, adding any new live columns."""
+    for table in ARCHIVE_TABLES:
+        archived = _table_columns(conn, "archive", table)
+        if not archived:
+            sql = conn.execute("SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()[0]
+            sql = re.sub(r'^CREATE TABLE\s+"?(\w+)"?', r'CREATE TABLE archive.\1', _FOREIGN_KEY_CLAUSE.sub("", sql))
+            conn.execute(sql)
+            continue
+        for _, name, ctype, _, default, _ in conn.execute(f"PRAGMA main.table_info({table})").fetchall():
+            if name not in archived:
+                conn.execute(f"ALTER TABLE archive.{table} ADD COLUMN {name} {ctype}"
+                             + (f" DEFAULT {default}" if default is not None else ""))
+    marks = ", ".join("?" * len(ARCHIVE_TABLES))
+    for (sql,) in conn.execute(
+        f"SELECT sql FROM main.sqlite_master WHERE type = 'index' AND sql IS NOT NULL AND tbl_name IN ({marks})",
+        list(ARCHIVE_TABLES)
+    ).fetchall():
+        conn.execute(re.sub(r'^CREATE (UNIQUE )?INDEX\s+(IF NOT EXISTS\s+)?',
+                            lambda m: f"CREATE {m.group(1) or ''}INDEX IF NOT EXISTS archive.", sql))
+
+
+def archive_trainees(approved_before: str, db_path: Optional[Path] = None) -> Dict[str, int]:
+    """Move trainees whose latest license was approved before `approved_before` into the archive file.
+
+    The latest license (by submission, as in get_latest_licenses) must have an
+    issued status and an approval date before the cutoff; older applications
+    do not matter. The trainee and its rows in every ARCHIVE_TABLES table are
+    copied to the archive and deleted from the live database in a single
+    transaction across both files. Archiving is not an edit: the journal
+    entries the deletes would leave are dropped, and each archived row's
+    change-log entry keeps its last stamp and version with op 'A', so sync
+    still sends unsynced rows (from the archive) and never revives them. The
+    rows holding each table's highest id stay live, so SQLite never hands an
+    archived id to a new row.
+    Returns the number of rows moved per table.
+    """
+    conn = get_conn(db_path)
+    try:
+        conn.execute("ATTACH DATABASE ? AS archive", (str(archive_path(db_path)),))
+        cur = conn.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        try:
+            _ensure_archive_schema(conn)
+            cur.execute("DROP TABLE IF EXISTS temp.archive_ids")
+            cur.execute("CREATE TEMP TABLE archive_ids (id INTEGER PRIMARY KEY)")
+            cur.execute(
+                "INSERT INTO temp.archive_ids SELECT trainee_id FROM ("
+                "    SELECT l.trainee_id, l.status, l.approval_date, ROW_NUMBER() OVER ("
+                "        PARTITION BY l.trainee_id ORDER BY l.application_submitted_date DESC, l.id DESC"
+                "    ) AS rn FROM main.license l"
+                ") WHERE rn = 1 AND LOWER(status) IN ('approved', 'issued', 'active') AND approval_date < ?",
+                (approved_before,)
+            )
+            for table, (key, via) in ARCHIVE_TABLES.items():
+                if "id" in _table_columns(conn, "main", table):
+                    owner = key if via is None else f"(SELECT trainee_id FROM main.{via} WHERE id = {key})"
+                    cur.execute(f"DELETE FROM temp.archive_ids WHERE id = "
+                                f"(SELECT {owner} FROM main.{table} ORDER BY id DESC LIMIT 1)")
+
+            counts = {}
+            for table, (key, via) in ARCHIVE_TABLES.items():
+                columns = ", ".join(_table_columns(conn, "main", table))
+                ids = "SELECT id FROM temp.archive_ids"
+                if via is not None:
+                    ids = f"SELECT id FROM main.{via} WHERE trainee_id IN ({ids})"
+                cur.execute(f"INSERT INTO archive.{table} ({columns}) SELECT {columns} FROM main.{table} "
+                            f"WHERE {key} IN ({ids})")
+                counts[table] = cur.rowcount
+
+            cur.execute("DROP TABLE IF EXISTS temp.archive_log")
+            cur.execute("CREATE TEMP TABLE archive_log AS SELECT * FROM main.change_log WHERE 0")
+            for table in SYNC_TABLES:
+                if table in ARCHIVE_TABLES:
+                    key, _ = ARCHIVE_TABLES[table]
+                    cur.execute(f"INSERT INTO temp.archive_log SELECT c.* FROM main.{table} r "
+                                f"JOIN main.change_log c ON c.tbl = '{table}' AND c.uid = r.uid "
+                                f"WHERE r.{key} IN (SELECT id FROM temp.archive_ids)")
+
+            journal = cur.execute("SELECT COALESCE(MAX(id), 0) FROM main.activity_event").fetchone()[0]
+            version = cur.execute("SELECT COALESCE(MAX(version), 0) FROM main.change_log").fetchone()[0]
+            # Everything else follows the trainee through ON DELETE CASCADE
+            cur.execute("DELETE FROM main.trainee WHERE id IN (SELECT id FROM temp.archive_ids)")
+            cur.execute("DELETE FROM main.activity_event WHERE id > ?", (journal,))
+            # The deletes' 'D' entries become 'A' markers; rows logged before keep their old stamp and version
+            cur.execute("DELETE FROM main.change_log WHERE version > ? AND (tbl, uid) IN "
+                        "(SELECT tbl, uid FROM temp.archive_log)", (version,))
+            cur.execute("UPDATE main.change_log SET op = 'A' WHERE version > ?", (version,))
+            cur.execute("INSERT INTO main.change_log (version, tbl, row_id, uid, op, site, ts) "
+                        "SELECT version, tbl, row_id, uid, 'A', site, ts FROM temp.archive_log")
+            cur.execute("DROP TABLE temp.archive_ids")
+            cur.execute("DROP TABLE temp.archive_log")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    finally:
+        conn.close()
+    return counts
+
+
+def attach_archive(conn: sqlite3.Connection, db_path: Optional[Path] = None) -> bool:
+    """ATTACH the database's archive file as `archive` if one exists; True if it is now attached."""
+    if any(r[1] == "archive" for r in conn.execute("PRAGMA database_list").fetchall()):
+        return True
+    path = archive_path(db_path)
+    if not path.exists():
+        return False
+    conn.execute("ATTACH DATABASE ? AS archive", (str(path),))
+    return True
+
+
+def _with_archive(conn: sqlite3.Connection, table: str, include_archive: bool, db_path: Optional[Path] = None) -> str:
+    """`table`, or, when asked and an archive exists, a subquery over its live and archived rows."""
+    if not include_archive or not attach_archive(conn, db_path):
+        return table
+    archived = set(_table_columns(conn, "archive", table))
+    if not archived:
+        return table
+    live = _table_columns(conn, "main", table)
+    # Columns added to the live table after the last archive run read as NULL for archived rows
+    old = ", ".join(c if c in archived else f"NULL AS {c}" for c in live)
+    return f"(SELECT {', '.join(live)} FROM main.{table} UNION ALL SELECT {old} FROM archive.{table})"
+
 # Example usage for recruiter CRUD
 recruiter_crud = CRUDHelper("recruiter")
 trainee_crud = CRUDHelper("trainee")
@@ -0,0 +1,185 @@
+"""Streaming export writers.
+
+Every writer receives the column names up front and then chunks of plain
+tuples straight from db.iter_export_chunks(), so memory stays proportional to
+the chunk size whatever the format:
+
+- csv / jsonl: written with the standard library.
+- xlsx: openpyxl in write-only mode (optional; ``pip install openpyxl``).
+- parquet: pyarrow, one row group per chunk (optional; ``pip install pyarrow``).
+
+Formats whose dependency is missing are left out of available_formats().
+"""
+from typing import Any, Dict, List, Sequence, Type
+import csv
+import json
+import logging
+
+try:
+    import openpyxl
+except ImportError:  # optional: XLSX export
+    openpyxl = None
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # optional: Parquet export
+    pyarrow = None
+
+logger = logging.getLogger(__name__)
+
+
+class ExportWriter:
+    """Base class: open the target in __init__, append chunks with write_rows(), finish with close()."""
+    name = ""
+    extension = ""
+    description = ""
+
+    def __init__(self, path: str, columns: Sequence[str]):
+        self.path = path
+        self.columns = list(columns)
+
+    @classmethod
+    def available(cls) -> bool:
+        return True
+
+    def write_rows(self, rows: List[tuple]) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        raise NotImplementedError
+
+
+class CsvWriter(ExportWriter):
+    name = "csv"
+    extension = ".csv"
+    description = "CSV Files (*.csv)"
+
+    def __init__(self, path: str, columns: Sequence[str]):
+        super().__init__(path, columns)
+        self._file = open(path, 'w', newline='', encoding='utf-8')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(self.columns)
+
+    def write_rows(self, rows: List[tuple]) -> None:
+        self._writer.writerows(rows)
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class JsonLinesWriter(ExportWriter):
+    name = "jsonl"
+    extension = ".jsonl"
+    description = "JSON Lines (*.jsonl)"
+
+    def __init__(self, path: str, columns: Sequence[str]):
+        super().__init__(path, columns)
+        self._file = open(path, 'w', encoding='utf-8')
+
+    def write_rows(self, rows: List[tuple]) -> None:
+        cols = self.columns
+        self._file.writelines(json.dumps(dict(zip(cols, r)), ensure_ascii=False) + "\n" for r in rows)
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class XlsxWriter(ExportWriter):
+    """Write-only openpyxl workbook: rows are serialized as they are appended, not held as cells."""
+    name = "xlsx"
+    extension = ".xlsx"
+    description = "Excel Workbook (*.xlsx)"
+
+    def __init__(self, path: str, columns: Sequence[str]):
+        super().__init__(path, columns)
+        self._workbook = openpyxl.Workbook(write_only=True)
+        self._sheet = self._workbook.create_sheet("Export")
+        self._sheet.append(self.columns)
+
+    @classmethod
+    def available(cls) -> bool:
+        return openpyxl is not None
+
+    def write_rows(self, rows: List[tuple]) -> None:
+        for r in rows:
+            self._sheet.append(r)
+
+    def close(self) -> None:
+        self._workbook.save(self.path)
+
+
+class ParquetWriter(ExportWriter):
+    """One Parquet row group per chunk.
+
+    Column types are inferred from the first chunk (all-NULL columns become
+    strings); later values that do not fit a string column are stringified.
+    """
+    name = "parquet"
+    extension = ".parquet"
+    description = "Parquet Files (*.parquet)"
+
+    def __init__(self, path: str, columns: Sequence[str]):
+        super().__init__(path, columns)
+        self._schema = None
+        self._writer = None
+
+    @classmethod
+    def available(cls) -> bool:
+        return pyarrow is not None
+
+    def _column_array(self, values: List[Any], field: Any) -> Any:
+        try:
+            return pyarrow.array(values, type=field.type)
+        except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError):
+            if not pyarrow.types.is_string(field.type):
+                raise
+            return pyarrow.array([None if v is None else str(v) for v in values], type=field.type)
+
+    def write_rows(self, rows: List[tuple]) -> None:
+        values = list(zip(*rows)) if rows else [()] * len(self.columns)
+        if self._schema is None:
+            fields = []
+            for name, col in zip(self.columns, values):
+                inferred = pyarrow.array(col).type
+                fields.append(pyarrow.field(name, pyarrow.string() if pyarrow.types.is_null(inferred) else inferred))
+            self._schema = pyarrow.schema(fields)
+            self._writer = pyarrow.parquet.ParquetWriter(self.path, self._schema)
+        arrays = [self._column_array(list(col), field) for col, field in zip(values, self._schema)]
+        self._writer.write_table(pyarrow.Table.from_arrays(arrays, schema=self._schema))
+
+    def close(self) -> None:
+        if self._writer is None:
+            # No rows: still produce a valid file with string columns
+            self._schema = pyarrow.schema([pyarrow.field(c, pyarrow.string()) for c in self.columns])
+            self._writer = pyarrow.parquet.ParquetWriter(self.path, self._schema)
+        self._writer.close()
+
+
+EXPORT_FORMATS: Dict[str, Type[ExportWriter]] = {
+    w.name: w for w in (CsvWriter, JsonLinesWriter, XlsxWriter, ParquetWriter)
+}
+
+
+def available_formats() -> Dict[str, Type[ExportWriter]]:
+    """Export formats whose optional dependencies are installed."""
+    return {name: w for name, w in EXPORT_FORMATS.items() if w.available()}
+
+
+def get_writer(fmt: str) -> Type[ExportWriter]:
+    """Writer class for a format name, or ValueError if unknown or its dependency is missing."""
+    writer = EXPORT_FORMATS.get(fmt)
+    if writer is None:
+        raise ValueError(f"Unknown export format {fmt!r}; expected one of {sorted(EXPORT_FORMATS)}")
+    if not writer.available():
+        raise ValueError(f"Export format {fmt!r} needs an optional dependency that is not installed")
+    return writer
+
+
+def format_for_path(path: str, default: str = "csv") -> str:
+    """Pick the export format from a file name's extension."""
+    lowered = str(path).lower()
+    for name, writer in EXPORT_FORMATS.items():
+        if lowered.endswith(writer.extension):
+            return name
+    return default
@@ -0,0 +1,67 @@
+"""Per-RVP extract databases: standalone SQLite files holding one RVP's data only.
+
+services.generate_rvp_extracts() hands each RVP to write_extract() in a process
+pool. A worker creates a fresh file with the live schema of the extracted
+tables, ATTACHes the live database read-only and copies that RVP's trainees,
+their exams, licenses and practice status, and the recruiters and classes
+they refer to (db.RVP_EXTRACT_COPY_SQL). Every copy is an indexed lookup, so
+all extracts together read about as much as one pass over the data, and no
+worker ever takes a lock on the live database.
+"""
+from pathlib import Path
+from typing import Any, Dict, Optional
+import os
+import sqlite3
+
+from . import db
+from .statements import rvp_slug
+
+
+def extract_filename(rvp_name: str, rvp_rep_code: Optional[str]) -> str:
+    return f"extract_{rvp_slug(rvp_name, rvp_rep_code)}.db"
+
+
+def write_extract(db_file: str, rvp_name: str, rvp_rep_code: Optional[str], out_dir: str) -> Dict[str, Any]:
+    """Build one RVP's extract next to its final name, then move it into place."""
+    path = Path(out_dir) / extract_filename(rvp_name, rvp_rep_code)
+    partial = path.with_suffix(".db.partial")
+    partial.unlink(missing_ok=True)
+    conn = sqlite3.connect(str(partial), uri=True)
+    try:
+        counts = _copy_rvp(conn, db_file, rvp_name, rvp_rep_code)
+    except Exception:
+        conn.close()
+        partial.unlink(missing_ok=True)
+        raise
+    conn.close()
+    os.replace(partial, path)
+    return {"rvp_name": rvp_name, "rvp_rep_code": rvp_rep_code, "path": str(path), **counts}
+
+
+def _copy_rvp(conn: sqlite3.Connection, db_file: str, rvp_name: str, rvp_rep_code: Optional[str]) -> Dict[str, int]:
+    """Create the extract schema in `conn` and copy one RVP's rows into it; row counts per table."""
+    # A half-written extract is simply thrown away, so skip the journal
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("ATTACH DATABASE ? AS src", (db.readonly_uri(db_file),))
+    tables = list(db.RVP_EXTRACT_COPY_SQL)
+    marks = ", ".join("?" * len(tables))
+    schema = conn.execute(
+        f"SELECT type, sql FROM src.sqlite_master WHERE tbl_name IN ({marks}) "
+        f"AND type IN ('table', 'index') AND sql IS NOT NULL",
+        tables
+    ).fetchall()
+    counts = {}
+    with conn:
+        for kind, sql in schema:
+            if kind == "table":
+                conn.execute(sql)
+        for table, sql in db.RVP_EXTRACT_COPY_SQL.items():
+            params = (rvp_name, rvp_rep_code) if table == "trainee" else ()
+            counts[table] = conn.execute(sql, params).rowcount
+        # Indexes last: building them once is cheaper than maintaining them per row
+        for kind, sql in schema:
+            if kind == "index":
+                conn.execute(sql)
+    conn.execute("DETACH DATABASE src")
+    return counts
@@ -0,0 +1,268 @@
+"""Bulk CSV import: header mapping, row validation and reference resolution.
+
+services.import_dataset() reads a file in chunks and passes each row (a dict
+keyed by normalized header) to the dataset's validator in IMPORT_DATASETS. A
+validator returns the tuple to insert, in the dataset's column order, or raises
+ValueError with the reason the row is rejected.
+
+Recruiters, trainees, classes and RVPs are resolved through ImportLookups:
+in-memory maps loaded once per import and extended as rows are accepted, so
+validation never queries the database per row. The headers match the export
+datasets, so an exported file can be imported again.
+"""
+from datetime import date
+from typing import Any, Dict, List, Optional, Set, Tuple
+import re
+
+from . import db
+
+_TRUE = {"1", "y", "yes", "true", "pass", "passed"}
+_FALSE = {"0", "n", "no", "false", "fail", "failed"}
+
+
+def normalize_header(header: List[str]) -> List[str]:
+    """Lower-case header names with runs of spaces, dashes and dots turned into underscores."""
+    return [re.sub(r'[\s\-.]+', '_', (h or "").strip().lower()) for h in header]
+
+
+def _text(row: Dict[str, str], *names: str) -> Optional[str]:
+    """First non-blank value among the given columns, stripped; None if all are blank or absent."""
+    for name in names:
+        value = (row.get(name) or "").strip()
+        if value:
+            return value
+    return None
+
+
+def _date(row: Dict[str, str], name: str) -> Optional[str]:
+    value = _text(row, name)
+    if value is None:
+        return None
+    try:
+        return date.fromisoformat(value[:10]).isoformat()
+    except ValueError:
+        raise ValueError(f"{name} must be a YYYY-MM-DD date, got {value!r}")
+
+
+def _flag(row: Dict[str, str], name: str) -> Optional[bool]:
+    value = _text(row, name)
+    if value is None:
+        return None
+    if value.lower() in _TRUE:
+        return True
+    if value.lower() in _FALSE:
+        return False
+    raise ValueError(f"{name} must be yes/no, got {value!r}")
+
+
+def _rep_code(row: Dict[str, str], name: str) -> Optional[str]:
+    try:
+        return db._validate_rep_code(_text(row, name))
+    except ValueError as e:
+        raise ValueError(f"{name}: {e}")
+
+
+def _single(matches: Optional[List[int]], what: str, key: str) -> int:
+    if not matches:
+        raise ValueError(f"unknown {what} {key!r}")
+    if len(matches) > 1:
+        raise ValueError(f"ambiguous {what} {key!r} matches {len(matches)} records")
+    return matches[0]
+
+
+class ImportLookups:
+    """Maps from natural keys (rep codes, names, license numbers) to existing record ids."""
+
+    def __init__(self, data: Dict[str, List[tuple]]):
+        self.recruiter_ids: Set[int] = set()
+        self.recruiters_by_code: Dict[str, int] = {}
+        self.recruiters_by_name: Dict[str, List[int]] = {}
+        for rid, name, rep_code in data["recruiters"]:
+            self.add_recruiter(rid, name, rep_code)
+
+        self.trainee_ids: Set[int] = set()
+        self.trainees_by_code: Dict[str, int] = {}
+        self.trainees_by_name: Dict[Tuple[str, str], List[int]] = {}
+        self.rvp_codes_by_name: Dict[str, Set[str]] = {}
+        self.rvp_names_by_code: Dict[str, str] = {}
+        for tid, first, last, rep_code, rvp_name, rvp_rep_code in data["trainees"]:
+            self.add_trainee(tid, first, last, rep_code, rvp_name, rvp_rep_code)
+
+        self.classes_by_name: Dict[str, List[int]] = {}
+        for cid, name in data["classes"]:
+            if name:
+                self.classes_by_name.setdefault(name.strip().lower(), []).append(cid)
+
+        self.license_numbers: Set[str] = {n.strip().upper() for (n,) in data["license_numbers"]}
+
+    @classmethod
+    def load(cls, db_path=None) -> "ImportLookups":
+        return cls(db.load_import_lookups(db_path))
+
+    def add_recruiter(self, rid: Optional[int], name: Optional[str], rep_code: Optional[str]) -> None:
+        # Rows accepted in the current import have no id yet (None): they only block duplicates
+        if rid is not None:
+            self.recruiter_ids.add(rid)
+        if rep_code:
+            self.recruiters_by_code[rep_code.upper()] = rid
+        if name:
+            self.recruiters_by_name.setdefault(name.strip().lower(), []).append(rid)
+
+    def add_trainee(self, tid: Optional[int], first: Optional[str], last: Optional[str], rep_code: Optional[str],
+                    rvp_name: Optional[str], rvp_rep_code: Optional[str]) -> None:
+        if tid is not None:
+            self.trainee_ids.add(tid)
+        if rep_code:
+            self.trainees_by_code[rep_code.upper()] = tid
+        if first and last:
+            self.trainees_by_name.setdefault((first.strip().lower(), last.strip().lower()), []).append(tid)
+        if rvp_name and rvp_rep_code:
+            self.rvp_codes_by_name.setdefault(rvp_name.strip().lower(), set()).add(rvp_rep_code.upper())
+            self.rvp_names_by_code.setdefault(rvp_rep_code.upper(), rvp_name.strip())
+
+    def recruiter(self, row: Dict[str, str]) -> Optional[int]:
+        """Recruiter id from recruiter_id, recruiter_rep_code or recruiter_name (in that order)."""
+        rid = _text(row, "recruiter_id")
+        if rid is not None:
+            if not rid.isdigit() or int(rid) not in self.recruiter_ids:
+                raise ValueError(f"unknown recruiter_id {rid!r}")
+            return int(rid)
+        code = _rep_code(row, "recruiter_rep_code")
+        if code is not None:
+            if self.recruiters_by_code.get(code) is None:
+                raise ValueError(f"unknown recruiter rep code {code!r}")
+            return self.recruiters_by_code[code]
+        name = _text(row, "recruiter_name", "recruiter")
+        if name is None:
+            return None
+        return _single(self.recruiters_by_name.get(name.lower()), "recruiter", name)
+
+    def trainee(self, row: Dict[str, str]) -> int:
+        """Trainee id from trainee_id, trainee_rep_code or first_name + last_name (in that order)."""
+        tid = _text(row, "trainee_id")
+        if tid is not None:
+            if not tid.isdigit() or int(tid) not in self.trainee_ids:
+                raise ValueError(f"unknown trainee_id {tid!r}")
+            return int(tid)
+        code = _rep_code(row, "trainee_rep_code")
+        if code is not None:
+            if self.trainees_by_code.get(code) is None:
+                raise ValueError(f"unknown trainee rep code {code!r}")
+            return self.trainees_by_code[code]
+        first, last = _text(row, "first_name"), _text(row, "last_name")
+        if not first or not last:
+            raise ValueError("trainee_id, trainee_rep_code or first_name and last_name required")
+        matches = [t for t in self.trainees_by_name.get((first.lower(), last.lower()), []) if t is not None]
+        return _single(matches, "trainee", f"{first} {last}")
+
+    def rvp(self, row: Dict[str, str]) -> Tuple[Optional[str], Optional[str]]:
+        """(rvp_name, rvp_rep_code), filling whichever half is missing from known RVPs."""
+        name, code = _text(row, "rvp_name"), _rep_code(row, "rvp_rep_code")
+        if code is not None:
+            known = self.rvp_names_by_code.get(code)
+            if name is None:
+                return known, code
+            if known is not None and known.lower() != name.lower():
+                raise ValueError(f"RVP rep code {code!r} belongs to {known!r}, not {name!r}")
+            return name, code
+        if name is None:
+            return None, None
+        codes = self.rvp_codes_by_name.get(name.lower(), set())
+        if len(codes) > 1:
+            raise ValueError(f"ambiguous RVP {name!r} has rep codes {', '.join(sorted(codes))}")
+        return name, next(iter(codes), None)
+
+    def class_id(self, row: Dict[str, str]) -> Optional[int]:
+        name = _text(row, "class_name", "class")
+        if name is None:
+            return None
+        return _single(self.classes_by_name.get(name.lower()), "class", name)
+
+
+def _validate_recruiter(row: Dict[str, str], lookups: ImportLookups) -> tuple:
+    name = _text(row, "name", "recruiter_name")
+    if not name:
+        raise ValueError("name is required")
+    rep_code = _rep_code(row, "rep_code")
+    if rep_code and rep_code in lookups.recruiters_by_code:
+        raise ValueError(f"recruiter rep code {rep_code!r} already exists")
+    if name.lower() in lookups.recruiters_by_name:
+        raise ValueError(f"recruiter {name!r} already exists")
+    lookups.add_recruiter(None, name, rep_code)
+    return name, _text(row, "email"), _text(row, "phone"), rep_code
+
+
+def _validate_trainee(row: Dict[str, str], lookups: ImportLookups) -> tuple:
+    first, last = _text(row, "first_name"), _text(row, "last_name")
+    if not first or not last:
+        raise ValueError("first_name and last_name are required")
+    rep_code = _rep_code(row, "rep_code")
+    if rep_code and rep_code in lookups.trainees_by_code:
+        raise ValueError(f"trainee rep code {rep_code!r} already exists")
+    dob = _date(row, "dob")
+    recruiter_id = lookups.recruiter(row)
+    rvp_name, rvp_rep_code = lookups.rvp(row)
+    lookups.add_trainee(None, first, last, rep_code, rvp_name, rvp_rep_code)
+    return first, last, dob, recruiter_id, rep_code, rvp_name, rvp_rep_code
+
+
+def _validate_exam(row: Dict[str, str], lookups: ImportLookups) -> tuple:
+    trainee_id = lookups.trainee(row)
+    class_id = lookups.class_id(row)
+    score = _text(row, "score")
+    passed = _flag(row, "passed")
+    return (trainee_id, class_id, _date(row, "exam_date"), score, db._parse_score(score), _text(row, "notes"),
+            _text(row, "module"), int(bool(_flag(row, "is_practice"))),
+            None if passed is None else int(passed), int(bool(_flag(row, "reimbursement_requested"))))
+
+
+def _validate_license(row: Dict[str, str], lookups: ImportLookups) -> tuple:
+    trainee_id = lookups.trainee(row)
+    number = _text(row, "license_number")
+    if number:
+        if number.upper() in lookups.license_numbers:
+            raise ValueError(f"license number {number!r} already exists")
+        lookups.license_numbers.add(number.upper())
+    return (trainee_id, _date(row, "application_submitted_date"), _date(row, "approval_date"), number,
+            _text(row, "status") or "Pending", _text(row, "notes"), _text(row, "license_type"),
+            int(bool(_flag(row, "invoiced"))), _date(row, "expiry_date"))
+
+
+# dataset -> table, insert columns (validator tuple order), header groups of which each needs one, validator
+IMPORT_DATASETS: Dict[str, Dict[str, Any]] = {
+    "recruiters": {
+        "table": "recruiter",
+        "columns": ["name", "email", "phone", "rep_code"],
+        "required": [("name", "recruiter_name")],
+        "validate": _validate_recruiter,
+    },
+    "trainees": {
+        "table": "trainee",
+        "columns": ["first_name", "last_name", "dob", "recruiter_id", "rep_code", "rvp_name", "rvp_rep_code"],
+        "required": [("first_name",), ("last_name",)],
+        "validate": _validate_trainee,
+    },
+    "exams": {
+        "table": "exam",
+        "columns": ["trainee_id", "class_id", "exam_date", "score", "score_value", "notes", "module",
+                    "is_practice", "passed", "reimbursement_requested"],
+        "required": [("trainee_id", "trainee_rep_code", "last_name")],
+        "validate": _validate_exam,
+    },
+    "licenses": {
+        "table": "license",
+        "columns": ["trainee_id", "application_submitted_date", "approval_date", "license_number", "status",
+                    "notes", "license_type", "invoiced", "expiry_date"],
+        "required": [("trainee_id", "trainee_rep_code", "last_name")],
+        "validate": _validate_license,
+    },
+}
+
+
+def check_header(dataset: str, header: List[str]) -> None:
+    """Raise ValueError if a normalized header lacks a column the dataset cannot do without."""
+    missing = [" or ".join(group) for group in IMPORT_DATASETS[dataset]["required"]
+               if not any(name in header for name in group)]
+    if missing:
+        raise ValueError(f"{dataset} import file is missing column(s): {'; '.join(missing)}")
+
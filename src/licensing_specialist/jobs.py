@@ -0,0 +1,46 @@
+"""Long-running work on a daemon thread that the GUI polls from a timer.
+
+A BackgroundJob calls `run(progress, cancelled)` on its own thread. The GUI
+reads `running`, `done` and `total` from a QTimer and picks up `result` once
+the thread finishes, so the event loop never blocks on the work itself.
+"""
+from typing import Any, Callable, Optional
+import threading
+
+
+class BackgroundJob:
+    """Work running on a daemon thread. Poll `running`, `done` and `total`; `cancel()` asks it to stop early.
+
+    `run(progress, cancelled)` does the work; its return value is kept in
+    `result` once the thread finishes.
+    """
+
+    def __init__(self, run: Callable[[Callable[[int, int], None], Callable[[], bool]], Any],
+                 name: str = "licensing-job"):
+        self.done = 0
+        self.total = 0
+        self.result: Any = None
+        self._run = run
+        self._cancel = threading.Event()
+        self._thread = threading.Thread(target=self._work, name=name, daemon=True)
+
+    def _progress(self, done: int, total: int) -> None:
+        self.done, self.total = done, total
+
+    def _work(self) -> None:
+        self.result = self._run(self._progress, self._cancel.is_set)
+
+    def start(self) -> "BackgroundJob":
+        self._thread.start()
+        return self
+
+    @property
+    def running(self) -> bool:
+        return self._thread.is_alive()
+
+    def cancel(self) -> None:
+        self._cancel.set()
+
+    def wait(self, timeout: Optional[float] = None) -> Any:
+        self._thread.join(timeout)
+        return self.result
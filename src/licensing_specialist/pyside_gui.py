@@ -8,7 +8,7 @@ from PySide6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
     QTabWidget, QLabel, QToolBar, QMessageBox, QFileDialog, QCompleter
 )
-from PySide6.QtCore import Qt, QSize, QStringListModel
+from PySide6.QtCore import Qt, QSize, QStringListModel, QTimer
 from PySide6.QtGui import QAction, QKeySequence, QIcon, QShortcut
 
 from . import db
@@ -31,9 +31,11 @@ class MainWindow(QMainWindow):
         self.setWindowTitle("Licensing Specialist (PySide6)")
         self.setMinimumSize(1000, 700)
         self._dark_mode = False
+        self._backup_job = None
         db.init_db()
         self._apply_theme()
         self._build()
+        self._schedule_backups()
 
     def _build(self) -> None:
         central = QWidget()
@@ -67,8 +69,12 @@ class MainWindow(QMainWindow):
         self.addAction(edit_act)
         self.addAction(del_act)
         
-        # Only add Theme button to toolbar
+        backup_act = QAction(_load_icon("export"), "Back Up Now", self)
+        backup_act.triggered.connect(self._backup_now)
+
+        # Only add Theme and Backup buttons to toolbar
         tb.addAction(theme_act)
+        tb.addAction(backup_act)
         self.addToolBar(tb)
 
         # Setup Tabs
@@ -95,6 +101,46 @@ class MainWindow(QMainWindow):
     def _show_status(self, msg: str, timeout: int = 5000) -> None:
         self.statusBar().showMessage(msg, timeout)
 
+    def _schedule_backups(self) -> None:
+        """Back up hourly on a background thread; a poll timer reports progress in the status bar."""
+        self._backup_timer = QTimer(self)
+        self._backup_timer.timeout.connect(self._start_backup)
+        self._backup_timer.start(services.BACKUP_INTERVAL_MINUTES * 60 * 1000)
+        self._backup_poll = QTimer(self)
+        self._backup_poll.timeout.connect(self._poll_backup)
+
+    def _backup_now(self) -> None:
+        if not self._start_backup():
+            self._show_status("A backup is already running")
+
+    def _start_backup(self) -> bool:
+        if self._backup_job is not None and self._backup_job.running:
+            return False
+        self._backup_job = services.start_backup(keep=services.BACKUP_KEEP)
+        self._backup_poll.start(500)
+        return True
+
+    def _poll_backup(self) -> None:
+        job = self._backup_job
+        if job.running:
+            percent = 100 * job.done // job.total if job.total else 0
+            self.statusBar().showMessage(f"Backing up... {percent}%")
+            return
+        self._backup_poll.stop()
+        if job.result is None:
+            self._show_status("Backup failed; see the log for details", 10000)
+        elif job.result['fallback']:
+            self._show_status(f"Backed up to {job.result['path']} (busy database: copied in one step)", 10000)
+        else:
+            self._show_status(f"Backed up to {job.result['path']}")
+
+    def closeEvent(self, event) -> None:
+        # Backup threads are daemons: stop one cleanly instead of leaving partial files behind
+        if self._backup_job is not None and self._backup_job.running:
+            self._backup_job.cancel()
+            self._backup_job.wait(5)
+        super().closeEvent(event)
+
     def _global_add(self) -> None:
         tab = self.tabs.currentWidget()
         if hasattr(tab, '_add_recruiter'): tab._add_recruiter()
@@ -0,0 +1,170 @@
+"""Matching provincial results files against trainees, exams and licenses.
+
+A results row identifies a trainee by license number, rep code or name, and
+carries an exam result (module plus passed/score) and/or a license decision
+(status, approval date, license number, expiry). ResultsIndex holds hash maps
+on each of those keys, built once from db.load_reconcile_index(), so every row
+is matched in O(1). match() returns the updates a row implies or raises
+Unmatched / Ambiguous (or ValueError for malformed values); nothing touches the
+database until services.reconcile_results() applies all matches together.
+"""
+from typing import Dict, List, Optional, Tuple
+import unicodedata
+
+from . import db
+from .importers import _date, _flag, _rep_code, _text
+
+# Same statuses as db.PENDING_LICENSE_SQL
+PENDING_STATUSES = {"pending", "waiting", ""}
+
+
+class Unmatched(ValueError):
+    """No trainee, exam or license fits the row."""
+
+
+class Ambiguous(ValueError):
+    """More than one record fits the row, or its keys disagree."""
+
+
+def _norm(value: Optional[str]) -> str:
+    # Strip accents and punctuation so "Zoë O'Neil" and "zoe oneil" meet
+    value = unicodedata.normalize("NFKD", value or "")
+    return " ".join("".join(c for c in value if c.isalnum() or c.isspace()).lower().split())
+
+
+def normalize_name(first: Optional[str], last: Optional[str]) -> Tuple[str, str]:
+    return _norm(first), _norm(last)
+
+
+def _row_name(row: Dict[str, str]) -> Optional[Tuple[str, str]]:
+    """(first, last) from first_name/last_name, or from a single name column ("Last, First" or "First Last")."""
+    first, last = _text(row, "first_name"), _text(row, "last_name")
+    if not (first and last):
+        name = _text(row, "name", "trainee", "candidate")
+        if not name:
+            return None
+        if "," in name:
+            last, first = (p.strip() for p in name.split(",", 1))
+        else:
+            first, _, last = name.rpartition(" ")
+        if not (first and last):
+            return None
+    return normalize_name(first, last)
+
+
+class ResultsIndex:
+    """Hash indexes over the trainees, provincial exams and licenses a results row can refer to."""
+
+    def __init__(self, data: Dict[str, List[tuple]]):
+        self.trainees_by_code: Dict[str, int] = {}
+        self.trainees_by_name: Dict[Tuple[str, str], List[int]] = {}
+        for tid, first, last, rep_code in data["trainees"]:
+            if rep_code:
+                self.trainees_by_code[rep_code.upper()] = tid
+            self.trainees_by_name.setdefault(normalize_name(first, last), []).append(tid)
+
+        self.licenses_by_number: Dict[str, Tuple[int, int]] = {}
+        self.licenses_by_trainee: Dict[int, List[tuple]] = {}
+        for lid, tid, number, license_type, status in data["licenses"]:
+            if number and number.strip():
+                self.licenses_by_number[number.strip().upper()] = (lid, tid)
+            self.licenses_by_trainee.setdefault(tid, []).append((lid, license_type, status))
+
+        self.exams_by_module: Dict[Tuple[int, str], List[tuple]] = {}
+        for eid, tid, module, exam_date, passed in data["exams"]:
+            self.exams_by_module.setdefault((tid, (module or "").strip().lower()), []).append((eid, exam_date, passed))
+
+        # record id -> row number of the first results row that claimed it
+        self.claimed_exams: Dict[int, int] = {}
+        self.claimed_licenses: Dict[int, int] = {}
+
+    @classmethod
+    def load(cls, db_path=None) -> "ResultsIndex":
+        return cls(db.load_reconcile_index(db_path))
+
+    def _trainee(self, row: Dict[str, str]) -> Tuple[int, Optional[int]]:
+        """(trainee_id, license_id) using the strongest key present: license number, rep code, then name."""
+        number = _text(row, "license_number")
+        code = _rep_code(row, "rep_code") or _rep_code(row, "trainee_rep_code")
+        by_number = self.licenses_by_number.get(number.upper()) if number else None
+        by_code = self.trainees_by_code.get(code) if code else None
+        if by_number:
+            if by_code is not None and by_code != by_number[1]:
+                raise Ambiguous(f"license {number!r} and rep code {code!r} belong to different trainees")
+            return by_number[1], by_number[0]
+        if by_code is not None:
+            return by_code, None
+        name = _row_name(row)
+        if name is None:
+            raise Unmatched("no known license number or rep code, and no name to fall back on")
+        matches = self.trainees_by_name.get(name, [])
+        if not matches:
+            raise Unmatched(f"no trainee named {' '.join(name)!r}")
+        if len(matches) > 1:
+            raise Ambiguous(f"{len(matches)} trainees named {' '.join(name)!r}")
+        return matches[0], None
+
+    def _exam(self, trainee_id: int, module: str, exam_date: Optional[str]) -> int:
+        exams = self.exams_by_module.get((trainee_id, module.lower()), [])
+        if exam_date:
+            candidates = [e for e in exams if e[1] == exam_date]
+            where = f"on {exam_date}"
+        else:
+            candidates = [e for e in exams if e[2] is None]
+            where = "awaiting a result"
+        if not candidates:
+            raise Unmatched(f"no provincial {module} exam {where}")
+        if len(candidates) > 1:
+            raise Ambiguous(f"{len(candidates)} provincial {module} exams {where}")
+        return candidates[0][0]
+
+    def _license(self, trainee_id: int, license_type: Optional[str]) -> int:
+        candidates = [lid for lid, ltype, status in self.licenses_by_trainee.get(trainee_id, [])
+                      if (status or "").strip().lower() in PENDING_STATUSES
+                      and (not license_type or (ltype or "").lower() == license_type.lower())]
+        kind = f"{license_type} license" if license_type else "license"
+        if not candidates:
+            raise Unmatched(f"no pending {kind}")
+        if len(candidates) > 1:
+            raise Ambiguous(f"{len(candidates)} pending {kind}s")
+        return candidates[0]
+
+    def match(self, row: Dict[str, str], row_number: int) -> Tuple[Optional[tuple], Optional[tuple]]:
+        """(exam_update, license_update) for db.apply_reconciled_results; either may be None."""
+        module = _text(row, "module", "exam")
+        passed = _flag(row, "passed") if _text(row, "passed") else _flag(row, "result")
+        score = _text(row, "score")
+        exam_date = _date(row, "exam_date")
+        status = _text(row, "status", "license_status")
+        approval_date = _date(row, "approval_date")
+        expiry_date = _date(row, "expiry_date")
+        has_exam = bool(module) and (passed is not None or score is not None)
+        has_license = bool(status or approval_date)
+        if not (has_exam or has_license):
+            raise ValueError("row has neither an exam result (module with passed/score) nor a license status")
+
+        trainee_id, license_id = self._trainee(row)
+        exam_update = license_update = None
+        if has_exam:
+            exam_id = self._exam(trainee_id, module, exam_date)
+            if exam_id in self.claimed_exams:
+                raise Ambiguous(f"same exam as row {self.claimed_exams[exam_id]}")
+            exam_update = (None if passed is None else int(passed), score, db._parse_score(score), exam_id)
+        if has_license:
+            if license_id is None:
+                license_id = self._license(trainee_id, _text(row, "license_type"))
+            if license_id in self.claimed_licenses:
+                raise Ambiguous(f"same license as row {self.claimed_licenses[license_id]}")
+            number = _text(row, "license_number")
+            owner = self.licenses_by_number.get(number.upper()) if number else None
+            if owner and owner[0] != license_id:
+                raise Ambiguous(f"license number {number!r} is already on another license")
+            license_update = (status or "Approved", approval_date, number, expiry_date, license_id)
+
+        if exam_update:
+            self.claimed_exams[exam_update[-1]] = row_number
+        if license_update:
+            self.claimed_licenses[license_id] = row_number
+            if license_update[2]:
+                self.licenses_by_number[license_update[2].upper()] = (license_id, trainee_id)
+        return exam_update, license_update
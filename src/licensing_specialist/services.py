@@ -1,13 +1,91 @@
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Callable, Hashable
 from pathlib import Path
 import logging
 import csv
-from datetime import datetime, timedelta
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from collections import Counter
+from itertools import groupby, islice
+from operator import itemgetter
+from datetime import date, timedelta
 from . import db
+from . import analytics
+from . import backups
+from . import exporters
+from . import extracts
+from . import importers
+from . import jobs
+from . import reconciliation
+from . import statements
+from . import sync
 
 logger = logging.getLogger(__name__)
 PRACTICE_MODULES = ["Life", "A&S", "Seg Funds", "Ethics"]
 REQUIRED_PRACTICE_MODULES = PRACTICE_MODULES # For now, all modules are required
+REPORT_WINDOWS = (30, 90, 365)
+STALE_PENDING_DAYS = 60 # Applications pending longer than this need chasing
+EXPIRY_WARNING_DAYS = 30 # Licenses expiring within this many days need renewal
+EXPORT_CHUNK_SIZE = 5000 # Rows fetched and written per step when streaming exports
+IMPORT_CHUNK_SIZE = 5000 # Rows validated and inserted per transaction by bulk imports
+BACKUP_DIR = db.DEFAULT_DB.parent / "backups" # Where scheduled backups go
+ARCHIVE_AFTER_MONTHS = 24 # Trainees fully licensed this long ago are moved to the archive
+BACKUP_INTERVAL_MINUTES = 60 # How often the GUI takes a scheduled backup
+BACKUP_KEEP = 48 # Scheduled backups kept; older ones are pruned
+
+# Report results keyed by (name, db file), stored with the data version they were computed at
+_report_cache: Dict[tuple, tuple] = {}
+
+def _cached_report(key: Hashable, db_path: Optional[Path], compute: Callable[[], Any], stamp: Hashable = None) -> Any:
+    """Return compute() memoized until the database next changes.
+
+    `stamp` is stored with the entry rather than in the key, so an input that
+    drifts (such as a trailing window's start date) replaces the entry
+    instead of adding a new one.
+    """
+    token = (db.get_data_version(db_path), stamp)
+    cache_key = (key, str(db_path or db.DEFAULT_DB))
+    hit = _report_cache.get(cache_key)
+    if hit is not None and hit[0] == token:
+        return hit[1]
+    result = compute()
+    _report_cache[cache_key] = (token, result)
+    return result
+
+def _window_start(days: Optional[int]) -> Optional[str]:
+    """ISO date for the start of a trailing window of `days`, or None for all time."""
+    if days is None:
+        return None
+    return (date.today() - timedelta(days=days)).isoformat()
+
+def _rate(passes: int, graded: int) -> str:
+    return f"{passes / graded * 100:.1f}%" if graded > 0 else "N/A"
+
+# SQL expressions mapping a date column to the first day of its bucket (weeks start on Monday)
+TREND_PERIODS = {
+    "week": "date({col}, 'weekday 0', '-6 days')",
+    "month": "strftime('%Y-%m-01', {col})",
+}
+
+EXAM_CHANGE_PRUNE_ROWS = 1000 # Consumed exam_date_change rows allowed to pile up before they are deleted
+# Per (period, db file): bucket totals plus the data version and exam_date_change seq they reflect
+_trend_cache: Dict[tuple, Dict[str, Any]] = {}
+
+# Per db file: the data version the reporting cube's open month was last re-rolled at
+_cube_versions: Dict[str, tuple] = {}
+
+def _seewhy_qualified(completion_dates: Dict[str, str], first_provincial_exam_date: Optional[str]) -> bool:
+    """Every required module must be completed strictly before the first provincial exam."""
+    if not first_provincial_exam_date:
+        return False
+    for module in REQUIRED_PRACTICE_MODULES:
+        completion_date = completion_dates.get(module)
+        if not completion_date:
+            return False
+        if completion_date.split('T')[0] >= first_provincial_exam_date:
+            return False
+    return True
 
 def check_seewhy_guarantee(trainee_id: int, first_provincial_exam_date: Optional[str], db_path: Optional[Path] = None) -> bool:
     """Check if trainee qualifies for SeeWhy Guarantee."""
@@ -16,19 +94,7 @@ def check_seewhy_guarantee(trainee_id: int, first_provincial_exam_date: Optional
             return False
         
         completion_dates = db.get_all_practice_module_completion_dates(trainee_id, db_path)
-        
-        for module in REQUIRED_PRACTICE_MODULES:
-            if module not in completion_dates:
-                return False
-                
-        for module in REQUIRED_PRACTICE_MODULES:
-            completion_date = completion_dates[module]
-            if not completion_date:
-                return False
-            if completion_date.split('T')[0] >= first_provincial_exam_date:
-                return False
-        
-        return True
+        return _seewhy_qualified(completion_dates, first_provincial_exam_date)
     except Exception as e:
         logger.error(f"Error checking SeeWhy guarantee for trainee {trainee_id}: {e}")
         return False
@@ -64,48 +130,102 @@ def all_practice_modules_complete(trainee_id: int, db_path: Optional[Path] = Non
         logger.error(f"Error checking practice modules for trainee {trainee_id}: {e}")
         return False
 
+def get_trainee_profile(trainee_id: int, db_path: Optional[Path] = None) -> Optional[Dict[str, Any]]:
+    """Load everything the trainee details pane shows using a single connection.
+
+    Returns None if the trainee does not exist. Practice completion, the first
+    provincial exam date and the SeeWhy flag are derived from the rows already
+    fetched rather than re-queried.
+    """
+    try:
+        with db.get_db_connection(db_path) as conn:
+            cur = conn.cursor()
+            cur.execute(
+                "SELECT t.*, r.name as recruiter_name FROM trainee t "
+                "LEFT JOIN recruiter r ON t.recruiter_id = r.id WHERE t.id = ?",
+                (trainee_id,)
+            )
+            trainee = cur.fetchone()
+            if not trainee:
+                return None
+
+            cur.execute(
+                "SELECT module, completed, completed_date FROM practice_exam_status WHERE trainee_id = ?",
+                (trainee_id,)
+            )
+            practice_rows = cur.fetchall()
+
+            cur.execute(
+                "SELECT c.* FROM class c JOIN trainee_class tc ON c.id = tc.class_id "
+                "WHERE tc.trainee_id = ? ORDER BY c.start_date",
+                (trainee_id,)
+            )
+            classes = cur.fetchall()
+
+            cur.execute("SELECT * FROM exam WHERE trainee_id = ? ORDER BY exam_date DESC", (trainee_id,))
+            exams = cur.fetchall()
+
+            cur.execute(
+                "SELECT * FROM license WHERE trainee_id = ? ORDER BY application_submitted_date DESC",
+                (trainee_id,)
+            )
+            licenses = cur.fetchall()
+
+        completed = {r['module'] for r in practice_rows if r['completed']}
+        completion_dates = {r['module']: r['completed_date'] for r in practice_rows
+                            if r['completed'] and r['completed_date']}
+        prov_dates = [e['exam_date'] for e in exams if not e['is_practice'] and e['exam_date']]
+        first_provincial_date = min(prov_dates) if prov_dates else None
+
+        return {
+            "trainee": trainee,
+            "recruiter_name": trainee['recruiter_name'],
+            "practice_summary": {mod: mod in completed for mod in REQUIRED_PRACTICE_MODULES},
+            "modules_complete": all(mod in completed for mod in REQUIRED_PRACTICE_MODULES),
+            "first_provincial_date": first_provincial_date,
+            "seewhy": _seewhy_qualified(completion_dates, first_provincial_date),
+            "classes": classes,
+            "exams": exams,
+            "licenses": licenses,
+        }
+    except Exception as e:
+        logger.error(f"Error loading profile for trainee {trainee_id}: {e}")
+        return None
+
 def get_dashboard_stats(db_path: Optional[Path] = None) -> Dict[str, int]:
-    """Aggregate high-level stats for the dashboard."""
+    """Aggregate high-level stats for the dashboard from the analytics snapshot."""
     try:
-        conn = db.get_conn(db_path)
-        cur = conn.cursor()
-        
-        # Trainees
-        cur.execute("SELECT COUNT(*) FROM trainee")
-        total_trainees = cur.fetchone()[0]
-        
-        # Exams - Total and Recently passed (last 30 days)
-        cur.execute("SELECT COUNT(*) FROM exam")
-        total_exams = cur.fetchone()[0]
-        
-        now = datetime.now().isoformat()
-        last_30 = (datetime.now() - timedelta(days=30)).isoformat()
-        cur.execute("SELECT COUNT(*) FROM exam WHERE passed = 1 AND exam_date >= ?", (last_30,))
-        recent_passes = cur.fetchone()[0]
-        
-        # Licenses - Pending
-        cur.execute("SELECT COUNT(*) FROM license WHERE status != 'Approved' AND status != 'Issued'") # Adjusted logic
-        pending_licenses = cur.fetchone()[0]
+        snap = analytics.get_snapshot(db_path)
+        trainees = snap.table("trainee")
+        exams = snap.table("exam")
+        licenses = snap.table("license")
+        classes = snap.table("class")
+        practice = snap.table("practice_exam_status")
+
+        today = date.today()
+        last_30 = (today - timedelta(days=30)).isoformat()
+        recent_passes = exams.count(analytics.combine(
+            exams.mask("passed", 1), exams.date_mask("exam_date", since=last_30)
+        ))
+
+        # Any recorded status other than Approved/Issued
+        statuses = licenses.categories["status"][1:]
+        pending_licenses = licenses.count(
+            licenses.mask("status", isin=[st for st in statuses if st not in ("Approved", "Issued")])
+        )
+
+        active_classes = classes.count(classes.date_mask("end_date", since=today.isoformat()))
+
+        # Ready for provincial: every required practice module marked complete
+        done = analytics.combine(
+            practice.mask("completed", 1), practice.mask("module", isin=REQUIRED_PRACTICE_MODULES)
+        )
+        per_trainee = practice.count_by(["trainee_id"], done)
+        ready_count = sum(1 for n in per_trainee.values() if n == len(REQUIRED_PRACTICE_MODULES))
 
-        # Classes
-        cur.execute("SELECT COUNT(*) FROM class WHERE end_date >= ?", (now.split('T')[0],))
-        active_classes = cur.fetchone()[0]
-        
-        # Readiness for Provincial
-        cur.execute("SELECT COUNT(*) FROM trainee")
-        # For efficiency in a real app, this would be a single SQL bit or a cached value.
-        # But let's stay simple:
-        cur.execute("SELECT id FROM trainee")
-        t_ids = [r[0] for r in cur.fetchall()]
-        ready_count = 0
-        for tid in t_ids:
-            if is_ready_for_provincial_exam(tid, db_path):
-                ready_count += 1
-        
-        conn.close()
         return {
-            "total_trainees": total_trainees,
-            "total_exams": total_exams,
+            "total_trainees": trainees.count(),
+            "total_exams": exams.count(),
             "recent_passes": recent_passes,
             "pending_licenses": pending_licenses,
             "active_classes": active_classes,
@@ -115,136 +235,544 @@ def get_dashboard_stats(db_path: Optional[Path] = None) -> Dict[str, int]:
         logger.error(f"Error getting dashboard stats: {e}")
         return {}
 
-def get_recent_activity(db_path: Optional[Path] = None) -> List[Dict[str, str]]:
-    """Fetch the latest activity across the app."""
-    activities = []
+def get_recent_activity(limit: int = 10, before: Optional[tuple] = None, db_path: Optional[Path] = None) -> List[Dict[str, Any]]:
+    """Fetch the latest activity across the app from the activity journal.
+
+    Each item carries an opaque 'cursor'; pass the last one back as `before`
+    to load older history.
+    """
     try:
-        conn = db.get_conn(db_path)
-        cur = conn.cursor()
-        
-        # Latest 5 Trainees
-        cur.execute("SELECT first_name, last_name, id FROM trainee ORDER BY id DESC LIMIT 5")
-        for r in cur.fetchall():
+        activities = []
+        for r in db.list_activity_events(limit, before, db_path):
+            label = r['summary'] or ""
+            if r['action'] != "added":
+                label = f"{label} ({r['action']})"
             activities.append({
-                "type": "Trainee",
-                "label": f"{r['first_name']} {r['last_name']}",
-                "timestamp": "" # IDs don't have timestamps, but sort order works
+                "type": r['entity_type'],
+                "label": label,
+                "timestamp": (r['ts'] or "")[:16],
+                "cursor": (r['ts'], r['id']),
             })
-            
-        # Latest 5 Exams
-        cur.execute("""
-            SELECT e.exam_date, e.module, t.last_name, e.passed 
-            FROM exam e 
-            JOIN trainee t ON e.trainee_id = t.id 
-            ORDER BY e.exam_date DESC, e.id DESC LIMIT 5
-        """)
-        for r in cur.fetchall():
-            res = "Passed" if r['passed'] == 1 else "Failed" if r['passed'] == 0 else "Taken"
-            activities.append({
-                "type": "Exam",
-                "label": f"{r['last_name']} ({r['module']}): {res}",
-                "timestamp": r['exam_date'] or ""
-            })
-            
-        # Latest 5 Licenses
-        cur.execute("""
-            SELECT l.application_submitted_date, t.last_name, l.status 
-            FROM license l 
-            JOIN trainee t ON l.trainee_id = t.id 
-            ORDER BY l.id DESC LIMIT 5
-        """)
-        for r in cur.fetchall():
-            activities.append({
-                "type": "License",
-                "label": f"{r['last_name']}: {r['status']}",
-                "timestamp": r['application_submitted_date'] or ""
-            })
-            
-        conn.close()
-        
-        # Sort by timestamp if available, else by current order (recent first)
-        activities.sort(key=lambda x: x['timestamp'], reverse=True)
-        return activities[:10]
+        return activities
     except Exception as e:
         logger.error(f"Error getting recent activity: {e}")
         return []
-def export_to_csv(data: List[Dict[str, Any]], filename: str) -> bool:
-    """Export a list of dictionaries to a CSV file."""
+
+def scan_license_deadlines(pending_days: int = STALE_PENDING_DAYS, expiry_days: int = EXPIRY_WARNING_DAYS,
+                           limit: int = 50, db_path: Optional[Path] = None) -> Dict[str, Any]:
+    """Counts and a ranked worklist of stale pending applications and upcoming/overdue expiries.
+
+    A pending application is due `pending_days` after submission; a license is due
+    on its expiry date. The worklist is ordered by due date, most overdue first,
+    and each item carries days_left (negative when overdue).
+    """
+    empty = {"counts": {"stale_pending": 0, "expiring": 0, "expired": 0}, "worklist": []}
     try:
-        if not data:
-            return False
-            
-        keys = data[0].keys()
-        with open(filename, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=keys)
-            writer.writeheader()
-            writer.writerows(data)
-        logger.info(f"Successfully exported {len(data)} records to {filename}")
-        return True
+        today = date.today()
+        scan = db.scan_license_deadlines(
+            pending_before=(today - timedelta(days=pending_days)).isoformat(),
+            expiring_before=(today + timedelta(days=expiry_days + 1)).isoformat(),
+            today=today.isoformat(),
+            limit=limit,
+            db_path=db_path
+        )
+        worklist = []
+        for kind, rows in (("stale_pending", scan["stale_pending"]), ("expiring", scan["expiring"])):
+            for r in rows:
+                raw = r['application_submitted_date'] if kind == "stale_pending" else r['expiry_date']
+                try:
+                    due = date.fromisoformat(raw[:10])
+                except ValueError:
+                    logger.warning(f"License {r['id']} has an unparseable date: {raw!r}")
+                    continue
+                if kind == "stale_pending":
+                    due += timedelta(days=pending_days)
+                    reason = f"Pending since {raw}"
+                else:
+                    reason = f"{'Expired' if due < today else 'Expires'} {raw}"
+                worklist.append({
+                    "license_id": r['id'],
+                    "trainee_id": r['trainee_id'],
+                    "trainee": f"{r['first_name']} {r['last_name']}",
+                    "license_type": r['license_type'],
+                    "kind": kind,
+                    "reason": reason,
+                    "due_date": due.isoformat(),
+                    "days_left": (due - today).days,
+                })
+        worklist.sort(key=itemgetter("due_date", "license_id"))
+        return {"counts": scan["counts"], "worklist": worklist[:limit]}
     except Exception as e:
-        logger.error(f"Error exporting to CSV: {e}")
-        return False
+        logger.error(f"Error scanning license deadlines: {e}")
+        return empty
 
-def get_trainee_export_data(db_path: Optional[Path] = None) -> List[Dict[str, Any]]:
-    """Fetch all trainee data formatted for export."""
+def run_invoices(rvp: Optional[tuple] = None, submitted_through: Optional[str] = None,
+                 db_path: Optional[Path] = None) -> Optional[Dict[str, Any]]:
+    """Invoice all uninvoiced licenses for one RVP (a (name, rep_code) pair) or for every RVP.
+
+    Returns {'batches': [...], 'line_count': n, 'total_amount': x}; running again
+    with nothing new to bill yields no batches. Returns None if the run failed
+    (nothing is written in that case).
+    """
     try:
-        rows = db.list_trainees(db_path)
-        # Convert row objects to plain dicts for csv.DictWriter
-        return [dict(r) for r in rows]
+        batches = [dict(b) for b in db.create_invoice_run(rvp, submitted_through, db_path=db_path)]
+        return {
+            "batches": batches,
+            "line_count": sum(b['line_count'] for b in batches),
+            "total_amount": round(sum(b['total_amount'] for b in batches), 2),
+        }
     except Exception as e:
-        logger.error(f"Error getting trainee export data: {e}")
-        return []
+        logger.error(f"Error running invoices for {rvp or 'all RVPs'}: {e}")
+        return None
 
-def get_license_export_data(db_path: Optional[Path] = None) -> List[Dict[str, Any]]:
-    """Fetch all license data formatted for export."""
+def generate_rvp_statements(out_dir: str, month: Optional[str] = None, rvp: Optional[tuple] = None,
+                            workers: Optional[int] = None, progress: Optional[Callable[[int, int], None]] = None,
+                            db_path: Optional[Path] = None) -> Optional[List[Dict[str, Any]]]:
+    """Write one HTML invoice statement per RVP for a 'YYYY-MM' month (default: the current month).
+
+    The invoice summary is partitioned by RVP (or restricted to one (name,
+    rep_code) pair) and statements are rendered in a process pool of up to
+    `workers` processes (default: CPU count), each reading through its own
+    read-only connection. A single statement is rendered in-process.
+    progress(statements_written, total) is called as each one finishes.
+    Returns one dict per statement (path, line_count, total_amount, outstanding),
+    or None if generation failed.
+    """
+    month = month or date.today().strftime("%Y-%m")
     try:
-        rows = db.list_licenses(db_path)
-        return [dict(r) for r in rows]
+        statements.month_bounds(month)  # validate before starting any workers
+        partitions: Dict[tuple, List[Dict[str, Any]]] = {}
+        for r in db.get_rvp_invoice_summary(db_path):
+            key = (r['rvp_name'], r['rvp_rep_code'])
+            if rvp is not None and key != tuple(rvp):
+                continue
+            outstanding = partitions.setdefault(key, [])
+            if not r['invoiced']:
+                outstanding.append(dict(r))
+        Path(out_dir).mkdir(parents=True, exist_ok=True)
+        jobs = [(name, code, month, outstanding, str(out_dir)) for (name, code), outstanding in partitions.items()]
+        workers = min(workers or os.cpu_count() or 1, len(jobs))
+        db_file = str(db_path or db.DEFAULT_DB)
+        results = []
+        if workers <= 1:
+            statements.init_worker(db_file)
+            try:
+                for job in jobs:
+                    results.append(statements.write_statement(*job))
+                    if progress:
+                        progress(len(results), len(jobs))
+            finally:
+                statements.close_worker()
+        else:
+            # spawn, not fork: the GUI process has Qt threads running
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                     initializer=statements.init_worker, initargs=(db_file,)) as pool:
+                for result in pool.map(statements.write_statement, *zip(*jobs)):
+                    results.append(result)
+                    if progress:
+                        progress(len(results), len(jobs))
+        logger.info(f"Wrote {len(results)} RVP statements for {month} to {out_dir} using {max(workers, 1)} process(es)")
+        return results
     except Exception as e:
-        logger.error(f"Error getting license export data: {e}")
-        return []
+        logger.error(f"Error generating RVP statements for {month}: {e}")
+        return None
+
+def start_rvp_statements(out_dir: str, month: Optional[str] = None, rvp: Optional[tuple] = None,
+                         db_path: Optional[Path] = None) -> jobs.BackgroundJob:
+    """Run generate_rvp_statements() on a background thread; poll the returned job for progress and result."""
+    return jobs.BackgroundJob(
+        lambda progress, cancelled: generate_rvp_statements(out_dir, month, rvp, progress=progress, db_path=db_path)
+    ).start()
+
+def generate_rvp_extracts(out_dir: str, rvp: Optional[tuple] = None, workers: Optional[int] = None,
+                          progress: Optional[Callable[[int, int], None]] = None,
+                          db_path: Optional[Path] = None) -> Optional[List[Dict[str, Any]]]:
+    """Write one standalone SQLite file per RVP holding only that RVP's trainees and their records.
 
-def get_recruiter_export_data(db_path: Optional[Path] = None) -> List[Dict[str, Any]]:
-    """Fetch all recruiter data formatted for export."""
+    Extracts are built in a process pool of up to `workers` processes
+    (default: CPU count), each attaching the live database read-only; a single
+    extract is built in-process. `rvp` restricts the run to one (name,
+    rep_code) pair. progress(extracts_written, total) is called as each one
+    finishes. Returns one dict per extract (path and rows copied per table),
+    or None if generation failed.
+    """
     try:
-        rows = db.list_recruiters(db_path)
-        return [dict(r) for r in rows]
+        jobs = [(r['rvp_name'], r['rvp_rep_code']) for r in db.list_unique_rvps(db_path)
+                if rvp is None or (r['rvp_name'], r['rvp_rep_code']) == tuple(rvp)]
+        Path(out_dir).mkdir(parents=True, exist_ok=True)
+        workers = min(workers or os.cpu_count() or 1, len(jobs))
+        db_file = str(db_path or db.DEFAULT_DB)
+        results = []
+        if workers <= 1:
+            for name, code in jobs:
+                results.append(extracts.write_extract(db_file, name, code, str(out_dir)))
+                if progress:
+                    progress(len(results), len(jobs))
+        else:
+            # spawn, not fork: the GUI process has Qt threads running
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+                for result in pool.map(extracts.write_extract, [db_file] * len(jobs), *zip(*jobs),
+                                       [str(out_dir)] * len(jobs)):
+                    results.append(result)
+                    if progress:
+                        progress(len(results), len(jobs))
+        logger.info(f"Wrote {len(results)} RVP extracts to {out_dir} using {max(workers, 1)} process(es)")
+        return results
     except Exception as e:
-        logger.error(f"Error getting recruiter export data: {e}")
-        return []
+        logger.error(f"Error generating RVP extracts: {e}")
+        return None
 
-def get_recruiter_performance_report(db_path: Optional[Path] = None) -> List[Dict[str, Any]]:
-    """Calculate pass rates and stats per recruiter."""
+def start_rvp_extracts(out_dir: str, rvp: Optional[tuple] = None,
+                       db_path: Optional[Path] = None) -> jobs.BackgroundJob:
+    """Run generate_rvp_extracts() on a background thread; poll the returned job for progress and result."""
+    return jobs.BackgroundJob(
+        lambda progress, cancelled: generate_rvp_extracts(out_dir, rvp, progress=progress, db_path=db_path)
+    ).start()
+
+def export_dataset(dataset: str, filename: str, progress: Optional[Callable[[int, int], None]] = None,
+                   cancelled: Optional[Callable[[], bool]] = None, chunk_size: int = EXPORT_CHUNK_SIZE,
+                   fmt: Optional[str] = None, since: Optional[str] = None, until: Optional[str] = None,
+                   db_path: Optional[Path] = None) -> Optional[int]:
+    """Stream an export dataset (see db.EXPORT_DATASETS) to a file.
+
+    `fmt` is one of exporters.EXPORT_FORMATS (csv, jsonl, xlsx, parquet) and
+    defaults to the one matching the file extension. Rows are handed to the
+    writer chunk by chunk as they come off the cursor, so memory does not grow
+    with the table. progress(rows_written, total_rows) is called after each
+    chunk, and the export stops as soon as cancelled() returns True. Output
+    goes to a temporary file that replaces `filename` only when complete.
+    since/until limit the export to rows whose updated_at falls in that window.
+    Returns the number of rows written, or None if the export failed or was cancelled.
+    """
+    tmp = Path(f"{filename}.part")
     try:
-        conn = db.get_conn(db_path); cur = conn.cursor()
-        # Join recruiter with trainees and exams
-        sql = """
-            SELECT r.id, r.name, 
-                   COUNT(DISTINCT t.id) as trainee_count,
-                   SUM(CASE WHEN e.result = 'Pass' THEN 1 ELSE 0 END) as pass_count,
-                   COUNT(e.id) as total_exams
-            FROM recruiter r
-            LEFT JOIN trainee t ON r.id = t.recruiter_id
-            LEFT JOIN exam e ON t.id = e.trainee_id
-            GROUP BY r.id, r.name
-        """
-        cur.execute(sql)
-        rows = cur.fetchall(); conn.close()
-        
+        writer_cls = exporters.get_writer(fmt or exporters.format_for_path(filename))
+        total = db.count_export_rows(dataset, db_path, since=since, until=until)
+        written = 0
+        chunks = db.iter_export_chunks(dataset, chunk_size, db_path, since=since, until=until)
+        try:
+            writer = writer_cls(str(tmp), db.export_columns(dataset))
+            try:
+                for rows in chunks:
+                    if cancelled and cancelled():
+                        logger.info(f"Export of {dataset} to {filename} cancelled after {written} rows")
+                        return None
+                    writer.write_rows(rows)
+                    written += len(rows)
+                    if progress:
+                        progress(written, total)
+            finally:
+                writer.close()
+        finally:
+            chunks.close()
+        tmp.replace(filename)
+        logger.info(f"Successfully exported {written} {dataset} records to {filename} as {writer_cls.name}")
+        return written
+    except Exception as e:
+        logger.error(f"Error exporting {dataset} to {filename}: {e}")
+        return None
+    finally:
+        tmp.unlink(missing_ok=True)
+
+def export_changes(dataset: str, filename: str, feed: Optional[str] = None, fmt: Optional[str] = None,
+                   progress: Optional[Callable[[int, int], None]] = None, cancelled: Optional[Callable[[], bool]] = None,
+                   db_path: Optional[Path] = None) -> Optional[Dict[str, Any]]:
+    """Export only the rows changed since the feed's stored watermark, then advance it.
+
+    `feed` names the downstream consumer (default: the dataset name); each
+    feed keeps its own watermark. The first export of a feed is a full one.
+    The watermark only moves once the file is complete, so a failed or
+    cancelled run is simply repeated next time. Deleted rows are not reported.
+    Returns {rows, since, until}, or None if the export failed or was cancelled.
+    """
+    feed = feed or dataset
+    try:
+        since = db.get_export_watermark(feed, db_path)
+        until = db.export_cutoff(db_path)
+    except Exception as e:
+        logger.error(f"Error reading export watermark for {feed}: {e}")
+        return None
+    written = export_dataset(dataset, filename, progress=progress, cancelled=cancelled, fmt=fmt,
+                             since=since, until=until, db_path=db_path)
+    if written is None:
+        return None
+    try:
+        db.set_export_watermark(feed, until, db_path)
+    except Exception as e:
+        logger.error(f"Exported changes to {filename} but failed to store the {feed} watermark: {e}")
+        return None
+    logger.info(f"Delta export {feed}: {written} {dataset} changed in [{since or 'start'}, {until})")
+    return {"rows": written, "since": since, "until": until}
+
+def backup_database(dest_dir: Optional[str] = None, compression: Optional[str] = "gz", keep: Optional[int] = None,
+                    progress: Optional[Callable[[int, int], None]] = None, cancelled: Optional[Callable[[], bool]] = None,
+                    db_path: Optional[Path] = None) -> Optional[Dict[str, Any]]:
+    """Take a verified, compressed online backup of the database (see backups.run_backup).
+
+    Writes to `dest_dir` (default BACKUP_DIR) and, if `keep` is given, prunes
+    all but the newest `keep` backups there afterwards. Safe to call while the
+    application is writing. Returns {path, pages, bytes, restarts, fallback,
+    seconds}, or None if the backup failed or was cancelled; `fallback` is True
+    when concurrent writes forced a single-step copy (see backups.run_backup).
+    """
+    dest_dir = dest_dir or BACKUP_DIR
+    try:
+        result = backups.run_backup(dest_dir, compression=compression, progress=progress, cancelled=cancelled,
+                                    db_path=db_path)
+        if keep:
+            backups.prune(dest_dir, keep)
+    except backups.BackupCancelled:
+        logger.info("Backup cancelled")
+        return None
+    except Exception as e:
+        logger.error(f"Error backing up the database to {dest_dir}: {e}")
+        return None
+    logger.info(f"Backed up {result['pages']} pages to {result['path']} ({result['bytes']} bytes, "
+                f"{result['restarts']} restarts, {result['seconds']}s)")
+    if result['fallback']:
+        logger.warning(f"Backup restarted {result['restarts']} times under concurrent writes; "
+                       f"finished with a single-step copy")
+    return result
+
+def start_backup(dest_dir: Optional[str] = None, compression: Optional[str] = "gz", keep: Optional[int] = None,
+                 db_path: Optional[Path] = None) -> backups.BackupJob:
+    """Run backup_database() on a background thread; poll or cancel the returned job."""
+    return backups.BackupJob(
+        lambda progress, cancelled: backup_database(dest_dir, compression, keep, progress, cancelled, db_path)
+    ).start()
+
+def _months_before(day: date, months: int) -> date:
+    year, month = divmod(day.year * 12 + day.month - 1 - months, 12)
+    month += 1
+    last_day = (date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)).day
+    return date(year, month, min(day.day, last_day))
+
+def archive_inactive_trainees(months: int = ARCHIVE_AFTER_MONTHS, db_path: Optional[Path] = None) -> Optional[Dict[str, int]]:
+    """Move trainees whose latest license was approved more than `months` months ago to the archive file.
+
+    Their exams, licenses, practice status, class enrollments, status history
+    and invoice lines move with them in one transaction (db.archive_trainees);
+    read them back with include_archive=True on list_trainees, get_trainee and
+    get_rvp_stats. Returns rows moved per table, or None on error.
+    """
+    cutoff = _months_before(date.today(), months).isoformat()
+    try:
+        moved = db.archive_trainees(cutoff, db_path)
+    except Exception as e:
+        logger.error(f"Error archiving trainees licensed before {cutoff}: {e}")
+        return None
+    logger.info(f"Archived {moved['trainee']} trainees licensed before {cutoff} to {db.archive_path(db_path)}")
+    return moved
+
+def sync_databases(peer_path: str, db_path: Optional[Path] = None) -> Optional[Dict[str, Any]]:
+    """Two-way sync with another office's database file (see sync.py).
+
+    Both files are brought up to the current schema first. Returns the counts
+    from sync.sync(): changes sent and received, how many were applied on each
+    side, conflicts (rows changed on both sides since the last sync), stale
+    changes skipped because the other side's edit was newer, orphans
+    skipped because their trainee no longer exists, and changes skipped
+    because they would delete or add to archived rows. None on error.
+    """
+    try:
+        db.init_db(db_path)
+        db.init_db(Path(peer_path))
+        result = sync.sync(db_path, Path(peer_path))
+    except Exception as e:
+        logger.error(f"Error syncing with {peer_path}: {e}")
+        return None
+    logger.info(f"Synced with {peer_path}: sent {result['sent']}, received {result['received']}, "
+                f"{result['conflicts']} conflicts")
+    return result
+
+def import_dataset(dataset: str, filename: str, progress: Optional[Callable[[int, int], None]] = None,
+                   cancelled: Optional[Callable[[], bool]] = None, chunk_size: int = IMPORT_CHUNK_SIZE,
+                   reject_path: Optional[str] = None, db_path: Optional[Path] = None) -> Optional[Dict[str, Any]]:
+    """Bulk-load a CSV file of recruiters, trainees, exams or licenses (see importers.IMPORT_DATASETS).
+
+    The file is read chunk_size rows at a time; each chunk is validated against
+    in-memory lookup maps and its accepted rows are inserted with one
+    executemany in one transaction. Rejected rows are streamed to `reject_path`
+    (default <name>_rejects.csv next to the input) with their row number and
+    reason. progress(rows_read, estimated_rows) is called after each chunk, and
+    cancelled() is checked before each one; chunks already committed are kept.
+    Returns {imported, rejected, reject_file, cancelled}, or None if the import failed.
+    """
+    source = Path(filename)
+    reject_path = Path(reject_path) if reject_path else source.with_name(f"{source.stem}_rejects.csv")
+    reject_file = None
+    try:
+        spec = importers.IMPORT_DATASETS[dataset]
+        validate = spec["validate"]
+        with open(source, 'rb') as f:
+            estimated = max(sum(block.count(b"\n") for block in iter(lambda: f.read(1 << 20), b"")) - 1, 0)
+        lookups = importers.ImportLookups.load(db_path)
+        imported = rejected = read = 0
+        was_cancelled = False
+        with open(source, newline='', encoding='utf-8-sig') as f:
+            reader = csv.reader(f)
+            raw_header = next(reader, [])
+            header = importers.normalize_header(raw_header)
+            importers.check_header(dataset, header)
+            while True:
+                chunk = list(islice(reader, chunk_size))
+                if not chunk:
+                    break
+                if cancelled and cancelled():
+                    was_cancelled = True
+                    break
+                accepted = []
+                for values in chunk:
+                    read += 1
+                    if not any(v.strip() for v in values):
+                        continue
+                    try:
+                        accepted.append(validate(dict(zip(header, values)), lookups))
+                    except ValueError as e:
+                        if reject_file is None:
+                            reject_file = open(reject_path, 'w', newline='', encoding='utf-8')
+                            rejects = csv.writer(reject_file)
+                            rejects.writerow(["row", "error"] + raw_header)
+                        rejects.writerow([read + 1, str(e)] + values)
+                        rejected += 1
+                db.insert_rows(spec["table"], spec["columns"], accepted, db_path)
+                imported += len(accepted)
+                if progress:
+                    progress(read, estimated)
+        logger.info(f"Imported {imported} {dataset} from {filename}; {rejected} rejected"
+                    + (" (cancelled)" if was_cancelled else ""))
+        return {
+            "imported": imported,
+            "rejected": rejected,
+            "reject_file": str(reject_path) if rejected else None,
+            "cancelled": was_cancelled,
+        }
+    except Exception as e:
+        logger.error(f"Error importing {dataset} from {filename}: {e}")
+        return None
+    finally:
+        if reject_file is not None:
+            reject_file.close()
+
+def reconcile_results(filename: str, report_path: Optional[str] = None, dry_run: bool = False,
+                      db_path: Optional[Path] = None) -> Optional[Dict[str, Any]]:
+    """Apply a provincial results file: exam pass/fail and scores, license approvals.
+
+    Each row is matched through reconciliation.ResultsIndex (license number,
+    then rep code, then normalized name) and all matched updates are applied in
+    one transaction, so a failure leaves the database untouched. Rows that
+    match nothing, match more than one record or are malformed are written to
+    `report_path` (default <name>_exceptions.csv) with the outcome and reason.
+    dry_run matches and reports without applying anything.
+    Returns counts plus the report path, or None if the file could not be processed.
+    """
+    source = Path(filename)
+    report_path = Path(report_path) if report_path else source.with_name(f"{source.stem}_exceptions.csv")
+    try:
+        index = reconciliation.ResultsIndex.load(db_path)
+        exam_updates, license_updates, exceptions = [], [], []
+        counts = {"rows": 0, "matched": 0, "unmatched": 0, "ambiguous": 0, "invalid": 0}
+        with open(source, newline='', encoding='utf-8-sig') as f:
+            reader = csv.reader(f)
+            raw_header = next(reader, [])
+            header = importers.normalize_header(raw_header)
+            for number, values in enumerate(reader, start=2):
+                if not any(v.strip() for v in values):
+                    continue
+                counts["rows"] += 1
+                try:
+                    exam_update, license_update = index.match(dict(zip(header, values)), number)
+                except reconciliation.Ambiguous as e:
+                    outcome, reason = "ambiguous", str(e)
+                except reconciliation.Unmatched as e:
+                    outcome, reason = "unmatched", str(e)
+                except ValueError as e:
+                    outcome, reason = "invalid", str(e)
+                else:
+                    counts["matched"] += 1
+                    if exam_update:
+                        exam_updates.append(exam_update)
+                    if license_update:
+                        license_updates.append(license_update)
+                    continue
+                counts[outcome] += 1
+                exceptions.append([number, outcome, reason] + values)
+
+        if not dry_run:
+            db.apply_reconciled_results(exam_updates, license_updates, db_path)
+        if exceptions:
+            with open(report_path, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow(["row", "outcome", "reason"] + raw_header)
+                writer.writerows(exceptions)
+        logger.info(f"Reconciled {filename}: {counts['matched']} of {counts['rows']} rows matched, "
+                    f"{len(exam_updates)} exams and {len(license_updates)} licenses"
+                    + (" (dry run)" if dry_run else " updated"))
+        return {
+            **counts,
+            "exams_updated": len(exam_updates),
+            "licenses_updated": len(license_updates),
+            "report_file": str(report_path) if exceptions else None,
+            "dry_run": dry_run,
+        }
+    except Exception as e:
+        logger.error(f"Error reconciling results from {filename}: {e}")
+        return None
+
+def get_recruiter_performance_report(days: Optional[int] = None, db_path: Optional[Path] = None) -> List[Dict[str, Any]]:
+    """Calculate practice and provincial pass rates per recruiter, best provincial rate first.
+
+    Exam counts come from the analytics snapshot, grouped by the trainee's
+    recruiter, practice flag and result in one pass. `days` restricts exams
+    to a trailing window (e.g. one of REPORT_WINDOWS); None covers all history.
+    Pass rates are over exams with a recorded result. Results are cached until
+    the database changes.
+    """
+    since = _window_start(days)
+
+    def compute() -> List[Dict[str, Any]]:
+        snap = analytics.get_snapshot(db_path)
+        trainees, exams, recruiters = snap.table("trainee"), snap.table("exam"), snap.table("recruiter")
+        recruiter_of = exams.lookup("trainee_id", trainees, "recruiter_id")
+        window = exams.date_mask("exam_date", since=since) if since else None
+        trainee_counts = trainees.count_by(["recruiter_id"])
+        totals: Dict[int, Counter] = {}
+        for (rid, practice, passed), n in exams.count_by([recruiter_of, "is_practice", "passed"], window).items():
+            t = totals.setdefault(rid, Counter())
+            t['total_exams'] += n
+            kind = {1: "practice", 0: "prov"}.get(practice)
+            if kind and passed is not None:
+                t[f'{kind}_graded'] += n
+                t[f'{kind}_passes'] += n if passed == 1 else 0
+
         report = []
-        for r in rows:
-            pass_count = r['pass_count'] or 0
-            total_exams = r['total_exams'] or 0
-            pass_rate = (pass_count / total_exams * 100) if total_exams > 0 else 0
+        for rid, name in zip(recruiters.values("id"), recruiters.values("name")):
+            r = totals.get(rid, Counter())
+            passes = r['practice_passes'] + r['prov_passes']
+            graded = r['practice_graded'] + r['prov_graded']
             report.append({
-                'id': r['id'],
-                'name': r['name'],
-                'trainees': r['trainee_count'],
-                'passes': pass_count,
-                'total_exams': total_exams,
-                'pass_rate': f"{pass_rate:.1f}%"
+                'id': rid,
+                'name': name,
+                'trainees': trainee_counts.get(rid, 0),
+                'passes': passes,
+                'total_exams': r['total_exams'],
+                'pass_rate': _rate(passes, graded),
+                'practice_passes': r['practice_passes'],
+                'practice_graded': r['practice_graded'],
+                'practice_pass_rate': _rate(r['practice_passes'], r['practice_graded']),
+                'provincial_passes': r['prov_passes'],
+                'provincial_graded': r['prov_graded'],
+                'provincial_pass_rate': _rate(r['prov_passes'], r['prov_graded']),
             })
+        report.sort(key=lambda x: (
+            -(x['provincial_passes'] / x['provincial_graded']) if x['provincial_graded'] else 1,
+            -x['provincial_passes'],
+            x['name'] or "",
+        ))
         return report
+
+    try:
+        return _cached_report(("recruiter_performance", days), db_path, compute, stamp=since)
     except Exception as e:
         logger.error(f"Error generating recruiter report: {e}")
         return []
@@ -252,43 +780,23 @@ def get_recruiter_performance_report(db_path: Optional[Path] = None) -> List[Dic
 def get_exam_module_stats(db_path: Optional[Path] = None) -> List[Dict[str, Any]]:
     """Calculate statistics per exam module to identify difficulty."""
     try:
-        conn = db.get_conn(db_path); cur = conn.cursor()
-        sql = """
-            SELECT module,
-                   COUNT(*) as total,
-                   SUM(passed) as passes
-            FROM exam
-            GROUP BY module
-        """
-        cur.execute(sql)
-        rows = cur.fetchall(); conn.close()
-        
-        # Prepare default stats for all modules
-        module_stats = {mod: {'module': mod, 'total': 0, 'passes': 0} for mod in PRACTICE_MODULES}
+        exams = analytics.get_snapshot(db_path).table("exam")
+        totals = exams.count_by(["module"])
+        passes = exams.count_by(["module"], exams.mask("passed", 1))
         
-        for r in rows:
-            mod = r['module']
-            if not mod or mod not in module_stats: 
-                continue # Skip unknown modules or nulls
-            
-            module_stats[mod]['total'] = r['total'] or 0
-            module_stats[mod]['passes'] = r['passes'] or 0
-            
         # Convert to list and calculate rates
         stats = []
         for mod in PRACTICE_MODULES:
-            data = module_stats[mod]
-            total = data['total']
-            passes = data['passes']
-            pct = (passes / total * 100) if total > 0 else 0
-            # If no exams taken, maybe show "N/A" or "0.0%"? Let's stick to 0.0% for now or "-"
-            # But the UI expects a string. Let's use "N/A" if total is 0 to distinguish from 0% pass rate.
+            total = totals.get(mod, 0)
+            mod_passes = passes.get(mod, 0)
+            pct = (mod_passes / total * 100) if total > 0 else 0
+            # Use "N/A" if total is 0 to distinguish from 0% pass rate.
             rate_str = f"{pct:.1f}%" if total > 0 else "N/A"
             
             stats.append({
                 'module': mod,
                 'total': total,
-                'passes': passes,
+                'passes': mod_passes,
                 'pass_rate': rate_str
             })
         return stats
@@ -296,6 +804,387 @@ def get_exam_module_stats(db_path: Optional[Path] = None) -> List[Dict[str, Any]
         logger.error(f"Error getting module stats: {e}")
         return []
 
+def get_module_pass_rate_trends(period: str = "month", db_path: Optional[Path] = None) -> List[Dict[str, Any]]:
+    """Pass rates per module per week or month, split into practice and provincial exams.
+
+    Buckets are computed with one grouped query over the exam(module, exam_date, ...)
+    covering index and cached. When exams change, only buckets from the earliest
+    touched exam_date onward (per the trigger-fed exam_date_change table) are
+    re-aggregated; older closed buckets are served from the cache.
+    """
+    if period not in TREND_PERIODS:
+        raise ValueError(f"period must be one of {sorted(TREND_PERIODS)}")
+    bucket_expr = TREND_PERIODS[period]
+    cache_key = (period, str(db_path or db.DEFAULT_DB))
+
+    try:
+        token = db.get_data_version(db_path)
+        entry = _trend_cache.get(cache_key)
+        if entry is None or entry['token'] != token:
+            with db.get_db_connection(db_path) as conn:
+                cur = conn.cursor()
+                cur.execute("BEGIN")  # consistent snapshot of exam and exam_date_change
+                cur.execute("SELECT COALESCE(MAX(seq), 0) FROM exam_date_change")
+                seq = cur.fetchone()[0]
+                buckets = dict(entry['buckets']) if entry else {}
+                refresh = entry is None
+                from_start = None
+                if entry is not None and seq != entry['seq']:
+                    cur.execute("SELECT MIN(seq) FROM exam_date_change")
+                    if cur.fetchone()[0] > entry['seq'] + 1:
+                        # Changes this cache never saw were pruned: rebuild every bucket
+                        buckets, refresh = {}, True
+                    else:
+                        cur.execute(
+                            f"SELECT MIN({bucket_expr.format(col='exam_date')}) FROM exam_date_change WHERE seq > ?",
+                            (entry['seq'],)
+                        )
+                        from_start = cur.fetchone()[0]
+                        refresh = from_start is not None
+                if refresh:
+                    sql = f"""
+                        SELECT module, {bucket_expr.format(col='exam_date')} AS bucket,
+                               COALESCE(is_practice, 0) AS is_practice,
+                               COUNT(*) AS total,
+                               SUM(CASE WHEN passed IS NOT NULL THEN 1 ELSE 0 END) AS graded,
+                               SUM(CASE WHEN passed = 1 THEN 1 ELSE 0 END) AS passes
+                        FROM exam
+                        WHERE module IS NOT NULL AND exam_date IS NOT NULL {{since}}
+                        GROUP BY module, bucket, COALESCE(is_practice, 0)
+                    """
+                    if from_start is None:
+                        cur.execute(sql.format(since=""))
+                    else:
+                        buckets = {k: v for k, v in buckets.items() if k[1] < from_start}
+                        cur.execute(sql.format(since="AND exam_date >= ?"), (from_start,))
+                    for r in cur.fetchall():
+                        if r['bucket'] is None:
+                            continue
+                        buckets[(r['module'], r['bucket'], bool(r['is_practice']))] = (
+                            r['total'], r['graded'], r['passes']
+                        )
+                conn.commit()
+            entry = {'token': token, 'seq': seq, 'buckets': buckets}
+            _trend_cache[cache_key] = entry
+            # Rows every cached period has consumed are no longer needed
+            consumed = min(e['seq'] for (_, f), e in _trend_cache.items() if f == cache_key[1])
+            db.prune_exam_date_changes(consumed, EXAM_CHANGE_PRUNE_ROWS, db_path)
+
+        trends = []
+        for (module, start, is_practice), (total, graded, passes) in sorted(entry['buckets'].items()):
+            trends.append({
+                'module': module,
+                'period_start': start,
+                'is_practice': is_practice,
+                'total': total,
+                'graded': graded,
+                'passes': passes,
+                'pass_rate': _rate(passes, graded),
+            })
+        return trends
+    except Exception as e:
+        logger.error(f"Error getting module pass rate trends: {e}")
+        return []
+
+def get_report_cube(group_by: Optional[List[str]] = None, filters: Optional[Dict[str, Any]] = None,
+                    month_from: Optional[str] = None, month_to: Optional[str] = None,
+                    db_path: Optional[Path] = None) -> List[Dict[str, Any]]:
+    """Licenses issued/pending/invoiced and exams taken/passed, sliced from the reporting cube.
+
+    group_by defaults to ["month"]; see db.query_report_cube for filters. The
+    cube's open month is re-rolled first if anything was committed since the
+    last refresh, so raw history is never re-aggregated on read.
+    """
+    if group_by is None:
+        group_by = ["month"]
+    unknown = [d for d in [*group_by, *(filters or {})] if d not in db.CUBE_DIMENSIONS]
+    if unknown:
+        raise ValueError(f"cube dimensions must be among {list(db.CUBE_DIMENSIONS)}")
+    try:
+        key = str(db_path or db.DEFAULT_DB)
+        if _cube_versions.get(key) != db.get_data_version(db_path):
+            db.refresh_report_cube(db_path=db_path)
+            _cube_versions[key] = db.get_data_version(db_path)
+        rows = db.query_report_cube(group_by, filters, month_from, month_to, db_path=db_path)
+        return [dict(r) for r in rows]
+    except Exception as e:
+        logger.error(f"Error querying report cube: {e}")
+        return []
+
+# group_by -> (SQL label expression, joins needed to reach it from exam e)
+SCORE_GROUPS = {
+    "module": ("e.module", ""),
+    "class": ("c.name", "LEFT JOIN class c ON e.class_id = c.id"),
+    "recruiter": ("r.name", "JOIN trainee t ON e.trainee_id = t.id LEFT JOIN recruiter r ON t.recruiter_id = r.id"),
+    "rvp": ("t.rvp_name", "JOIN trainee t ON e.trainee_id = t.id"),
+}
+SCORE_PERCENTILES = {"p10": 0.10, "median": 0.50, "p90": 0.90}
+
+def _percentile_sql(p: float, name: str) -> str:
+    """Aggregate column for the p-th percentile (linear interpolation) over rows ranked as
+    i = 0..n-1 by value v within their group, e.g. via ROW_NUMBER() and COUNT(*) windows."""
+    h = f"((n - 1) * {p})"
+    lo = f"CAST({h} AS INTEGER)"
+    return (
+        f"SUM(CASE WHEN i = {lo} THEN v * (1 - ({h} - {lo})) "
+        f"WHEN i = {lo} + 1 THEN v * ({h} - {lo}) ELSE 0 END) AS {name}"
+    )
+
+def get_score_statistics(group_by: str = "module", is_practice: Optional[bool] = None, bins: int = 10,
+                         db_path: Optional[Path] = None) -> List[Dict[str, Any]]:
+    """Mean, median, p10/p90 and a 0-100 histogram of numeric exam scores per group.
+
+    group_by is one of SCORE_GROUPS. Percentiles use linear interpolation between
+    ranks and are computed inside SQLite with window functions, so the whole
+    report is two grouped queries regardless of how many exams there are.
+    Scores outside 0-100 fall into the first/last histogram bin.
+    """
+    if group_by not in SCORE_GROUPS:
+        raise ValueError(f"group_by must be one of {sorted(SCORE_GROUPS)}")
+    label_expr, joins = SCORE_GROUPS[group_by]
+    where = "e.score_value IS NOT NULL"
+    params: List[Any] = []
+    if is_practice is not None:
+        where += " AND COALESCE(e.is_practice, 0) = ?"
+        params.append(1 if is_practice else 0)
+    scored = f"SELECT COALESCE({label_expr}, '—') AS grp, e.score_value AS v FROM exam e {joins} WHERE {where}"
+
+    pct_cols = [_percentile_sql(p, name) for name, p in SCORE_PERCENTILES.items()]
+    stats_sql = f"""
+        WITH ranked AS (
+            SELECT grp, v,
+                   ROW_NUMBER() OVER (PARTITION BY grp ORDER BY v) - 1 AS i,
+                   COUNT(*) OVER (PARTITION BY grp) AS n
+            FROM ({scored})
+        )
+        SELECT grp, COUNT(*) AS count, AVG(v) AS mean, MIN(v) AS min, MAX(v) AS max,
+               {', '.join(pct_cols)}
+        FROM ranked
+        GROUP BY grp
+        ORDER BY grp
+    """
+    width = 100.0 / bins
+    hist_sql = f"""
+        SELECT grp, MAX(0, MIN({bins - 1}, CAST(v / {width} AS INTEGER))) AS bin, COUNT(*) AS cnt
+        FROM ({scored})
+        GROUP BY grp, bin
+    """
+    try:
+        with db.get_db_connection(db_path) as conn:
+            cur = conn.cursor()
+            cur.execute(stats_sql, params)
+            stat_rows = cur.fetchall()
+            cur.execute(hist_sql, params)
+            hist_rows = cur.fetchall()
+
+        histograms: Dict[str, List[int]] = {}
+        for r in hist_rows:
+            histograms.setdefault(r['grp'], [0] * bins)[r['bin']] = r['cnt']
+
+        stats = []
+        for r in stat_rows:
+            entry = {'group': r['grp'], 'count': r['count']}
+            for key in ('mean', 'min', 'max', *SCORE_PERCENTILES):
+                entry[key] = round(r[key], 2)
+            entry['histogram'] = histograms.get(r['grp'], [0] * bins)
+            entry['bin_edges'] = [round(width * b, 2) for b in range(bins + 1)]
+            stats.append(entry)
+        return stats
+    except Exception as e:
+        logger.error(f"Error getting score statistics by {group_by}: {e}")
+        return []
+
+def get_license_status_dwell_stats(include_open: bool = False, db_path: Optional[Path] = None) -> List[Dict[str, Any]]:
+    """Days licenses spend in each status, from license_status_history.
+
+    A span runs from one status change to the license's next one. Spans still
+    open (the current status) are measured up to now only when include_open is
+    set. Mean, median, p90 and max are computed in SQL with window functions.
+    """
+    spans = """
+        SELECT status, julianday(COALESCE(next_at, 'now')) - julianday(changed_at) AS v
+        FROM (
+            SELECT status, changed_at,
+                   LEAD(changed_at) OVER (PARTITION BY license_id ORDER BY changed_at, id) AS next_at
+            FROM license_status_history
+        )
+        WHERE {open_filter}
+    """.format(open_filter="1" if include_open else "next_at IS NOT NULL")
+    sql = f"""
+        WITH ranked AS (
+            SELECT status, v,
+                   ROW_NUMBER() OVER (PARTITION BY status ORDER BY v) - 1 AS i,
+                   COUNT(*) OVER (PARTITION BY status) AS n
+            FROM ({spans})
+            WHERE v IS NOT NULL
+        )
+        SELECT status, COUNT(*) AS count, AVG(v) AS mean_days,
+               {_percentile_sql(0.5, 'median_days')}, {_percentile_sql(0.9, 'p90_days')},
+               MAX(v) AS max_days
+        FROM ranked
+        GROUP BY status
+        ORDER BY status
+    """
+    try:
+        with db.get_db_connection(db_path) as conn:
+            cur = conn.cursor()
+            cur.execute(sql)
+            rows = cur.fetchall()
+        return [
+            {
+                'status': r['status'],
+                'count': r['count'],
+                **{k: round(r[k], 1) for k in ('mean_days', 'median_days', 'p90_days', 'max_days')},
+            }
+            for r in rows
+        ]
+    except Exception as e:
+        logger.error(f"Error getting license status dwell stats: {e}")
+        return []
+
+# Attempts-to-pass histogram buckets; the last one is open-ended
+ATTEMPT_BUCKETS = ("1", "2", "3", "4+")
+
+def get_attempt_analytics(db_path: Optional[Path] = None) -> Dict[str, List[Dict[str, Any]]]:
+    """Provincial exam attempt statistics per module, class and recruiter.
+
+    Attempts are numbered per trainee and module with ROW_NUMBER(); each
+    (trainee, module) pair then contributes its attempts-to-pass and first-attempt
+    result. All three breakdowns come from one query and are cached until the
+    database changes. Returns {'module': [...], 'class': [...], 'recruiter': [...]}.
+    """
+    attempts = db.PROVINCIAL_ATTEMPTS_SQL.format(where="AND e.module IS NOT NULL")
+    buckets = ", ".join(
+        f"SUM(CASE WHEN to_pass {'>= 4' if b == '4+' else '= ' + b} THEN 1 ELSE 0 END) AS pass_on_{i}"
+        for i, b in enumerate(ATTEMPT_BUCKETS)
+    )
+    sql = f"""
+        WITH pairs AS (
+            SELECT trainee_id, module, COUNT(*) AS attempts,
+                   MIN(CASE WHEN passed = 1 THEN attempt END) AS to_pass,
+                   MAX(CASE WHEN attempt = 1 THEN passed END) AS first_result
+            FROM ({attempts})
+            GROUP BY trainee_id, module
+        ),
+        labelled AS (
+            SELECT 'module' AS dimension, p.module AS grp, p.* FROM pairs p
+            UNION ALL
+            SELECT 'class', c.name, p.* FROM pairs p
+            LEFT JOIN trainee_class tc ON tc.trainee_id = p.trainee_id
+            LEFT JOIN class c ON c.id = tc.class_id
+            UNION ALL
+            SELECT 'recruiter', r.name, p.* FROM pairs p
+            JOIN trainee t ON t.id = p.trainee_id
+            LEFT JOIN recruiter r ON r.id = t.recruiter_id
+        )
+        SELECT dimension, grp,
+               COUNT(*) AS pairs,
+               SUM(attempts) AS attempts,
+               SUM(CASE WHEN first_result IS NOT NULL THEN 1 ELSE 0 END) AS first_graded,
+               SUM(CASE WHEN first_result = 1 THEN 1 ELSE 0 END) AS first_passes,
+               SUM(CASE WHEN attempts > 1 THEN 1 ELSE 0 END) AS retakes,
+               SUM(CASE WHEN to_pass IS NULL THEN 1 ELSE 0 END) AS not_passed,
+               AVG(to_pass) AS avg_to_pass,
+               {buckets}
+        FROM labelled
+        GROUP BY dimension, grp
+        ORDER BY dimension, grp IS NULL, grp
+    """
+
+    def compute() -> Dict[str, List[Dict[str, Any]]]:
+        with db.get_db_connection(db_path) as conn:
+            cur = conn.cursor()
+            cur.execute(sql)
+            rows = cur.fetchall()
+        report: Dict[str, List[Dict[str, Any]]] = {"module": [], "class": [], "recruiter": []}
+        for r in rows:
+            report[r['dimension']].append({
+                'group': r['grp'] or "Unassigned",
+                'trainees': r['pairs'],
+                'attempts': r['attempts'],
+                'first_attempt_pass_rate': _rate(r['first_passes'], r['first_graded']),
+                'retake_rate': _rate(r['retakes'], r['pairs']),
+                'avg_attempts_to_pass': round(r['avg_to_pass'], 2) if r['avg_to_pass'] is not None else None,
+                'attempts_to_pass': {b: r[f'pass_on_{i}'] for i, b in enumerate(ATTEMPT_BUCKETS)},
+                'not_passed': r['not_passed'],
+            })
+        return report
+
+    try:
+        return _cached_report("attempt_analytics", db_path, compute)
+    except Exception as e:
+        logger.error(f"Error getting provincial attempt analytics: {e}")
+        return {"module": [], "class": [], "recruiter": []}
+
+# Funnel milestones, in pipeline order; durations are days since the IBA date (trainee.dob)
+FUNNEL_STAGES = ["practice_complete", "first_provincial", "first_pass", "licensed"]
+FUNNEL_GROUPS = {
+    "class": ("c.name", "LEFT JOIN trainee_class tc ON tc.trainee_id = t.id LEFT JOIN class c ON c.id = tc.class_id"),
+    "recruiter": ("r.name", "LEFT JOIN recruiter r ON r.id = t.recruiter_id"),
+}
+
+def get_funnel_report(group_by: str = "class", db_path: Optional[Path] = None) -> List[Dict[str, Any]]:
+    """Time-to-license funnel per class cohort or recruiter.
+
+    For each group, reports how many trainees reached each of FUNNEL_STAGES and
+    the mean/median days from IBA date to that milestone. Milestone dates come
+    from db's trainee_milestone table (one row per trainee, kept current by
+    triggers), SQLite computes the day differences and returns the rows sorted
+    by group. Python then summarises each group in one pass over its columns.
+    The first row covers all trainees. Trainees in several classes count
+    towards each of their cohorts.
+    """
+    if group_by not in FUNNEL_GROUPS:
+        raise ValueError(f"group_by must be one of {sorted(FUNNEL_GROUPS)}")
+    label_expr, joins = FUNNEL_GROUPS[group_by]
+    sql = f"""
+        SELECT t.id, COALESCE({label_expr}, 'Unassigned') AS grp,
+               julianday(date(m.practice_done)) - julianday(t.dob),
+               julianday(date(m.first_exam)) - julianday(t.dob),
+               julianday(date(m.first_pass)) - julianday(t.dob),
+               julianday(date(m.approved)) - julianday(t.dob)
+        FROM trainee t
+        {joins}
+        LEFT JOIN trainee_milestone m ON m.trainee_id = t.id
+        ORDER BY grp
+    """
+    try:
+        db.set_milestone_modules(REQUIRED_PRACTICE_MODULES, db_path)
+        with db.get_db_connection(db_path) as conn:
+            conn.row_factory = None  # plain tuples; this can be one row per trainee
+            cur = conn.cursor()
+            cur.execute(sql)
+            rows = cur.fetchall()
+
+        def summarize(name: str, group_rows: List[tuple]) -> Dict[str, Any]:
+            # Transpose once, then work column-wise per stage
+            columns = list(zip(*group_rows))[2:] if group_rows else [()] * len(FUNNEL_STAGES)
+            stages = {}
+            for stage, column in zip(FUNNEL_STAGES, columns):
+                values = [d for d in column if d is not None]
+                values.sort()
+                stages[stage] = _summarize_days(values)
+            return {'group': name, 'trainees': len(group_rows), 'stages': stages}
+
+        # Only class cohorts can list a trainee more than once
+        unique_rows = list({r[0]: r for r in rows}.values()) if group_by == "class" else rows
+        report = [summarize("All trainees", unique_rows)]
+        for grp, group_rows in groupby(rows, key=itemgetter(1)):
+            report.append(summarize(grp, list(group_rows)))
+        return report
+    except Exception as e:
+        logger.error(f"Error building funnel report by {group_by}: {e}")
+        return []
+
+def _summarize_days(values: List[float]) -> Dict[str, Any]:
+    """Count, mean and median of already sorted day counts."""
+    n = len(values)
+    if not n:
+        return {'reached': 0, 'mean_days': None, 'median_days': None}
+    mid = n // 2
+    median = values[mid] if n % 2 else (values[mid - 1] + values[mid]) / 2
+    return {'reached': n, 'mean_days': round(math.fsum(values) / n, 1), 'median_days': round(median, 1)}
+
 def is_ready_for_provincial_exam(trainee_id: int, db_path: Optional[Path] = None) -> bool:
     """Check if trainee has completed all required practice modules."""
     try:
@@ -0,0 +1,122 @@
+"""Monthly per-RVP invoice statements as standalone, print-ready HTML files.
+
+services.generate_rvp_statements() partitions db.get_rvp_invoice_summary() by
+RVP and hands each partition to write_statement() in a process pool. Every
+worker opens one read-only connection (init_worker) and uses it for all the
+statements it renders, so workers never contend for a write lock and the main
+process only ships small picklable partitions back and forth.
+"""
+from datetime import date
+from html import escape
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+import re
+import sqlite3
+
+from . import db
+
+_worker_conn: Optional[sqlite3.Connection] = None
+
+STATEMENT_CSS = """
+body { font-family: "Segoe UI", Arial, sans-serif; color: #1e293b; margin: 2em; }
+h1 { font-size: 18pt; margin-bottom: 0; }
+.meta { color: #64748b; margin-bottom: 1.5em; }
+table { border-collapse: collapse; width: 100%; margin-bottom: 1.5em; }
+th, td { border-bottom: 1px solid #e2e8f0; padding: 4px 8px; text-align: left; font-size: 10pt; }
+th { background: #f1f5f9; }
+td.amount, th.amount { text-align: right; }
+tr.total td { font-weight: bold; border-top: 2px solid #1e293b; }
+@page { size: letter; margin: 15mm; }
+@media print { body { margin: 0; } }
+"""
+
+
+def init_worker(db_path: str) -> None:
+    """Process-pool initializer: open this worker's read-only connection."""
+    global _worker_conn
+    _worker_conn = db.get_readonly_conn(db_path)
+
+
+def close_worker() -> None:
+    global _worker_conn
+    if _worker_conn is not None:
+        _worker_conn.close()
+        _worker_conn = None
+
+
+def month_bounds(month: str) -> Tuple[str, str]:
+    """('YYYY-MM-01', first day of the next month) for a 'YYYY-MM' month."""
+    start = date.fromisoformat(f"{month}-01")
+    end = date(start.year + start.month // 12, start.month % 12 + 1, 1)
+    return start.isoformat(), end.isoformat()
+
+
+def rvp_slug(rvp_name: str, rvp_rep_code: Optional[str]) -> str:
+    """Filesystem-safe name for an RVP, shared by statements and extracts."""
+    return re.sub(r'[^A-Za-z0-9]+', '_', f"{rvp_name} {rvp_rep_code or ''}").strip('_') or "rvp"
+
+
+def statement_filename(rvp_name: str, rvp_rep_code: Optional[str], month: str) -> str:
+    return f"statement_{month}_{rvp_slug(rvp_name, rvp_rep_code)}.html"
+
+
+def _name(row: Dict[str, Any]) -> str:
+    return escape(f"{row['last_name']}, {row['first_name']}")
+
+
+def render_statement(rvp_name: str, rvp_rep_code: Optional[str], month: str,
+                     lines: List[Dict[str, Any]], outstanding: List[Dict[str, Any]]) -> str:
+    """HTML for one RVP's statement: lines billed in the month plus licenses not yet invoiced."""
+    total = sum(l['amount'] for l in lines)
+    title = f"Invoice Statement: {rvp_name}" + (f" ({rvp_rep_code})" if rvp_rep_code else "")
+    billed = "".join(
+        f"<tr><td>{l['batch_id']}</td><td>{escape(l['invoiced_on'] or '')}</td><td>{_name(l)}</td>"
+        f"<td>{escape(l['license_type'] or '—')}</td><td>{escape(l['license_number'] or '—')}</td>"
+        f"<td>{escape(l['application_submitted_date'] or '—')}</td><td class=\"amount\">${l['amount']:,.2f}</td></tr>"
+        for l in lines
+    ) or '<tr><td colspan="7">No licenses were invoiced this month.</td></tr>'
+    pending = "".join(
+        f"<tr><td>{_name(o)}</td><td>{escape(o['license_type'] or '—')}</td>"
+        f"<td>{escape(o['application_submitted_date'] or '—')}</td></tr>"
+        for o in outstanding
+    )
+    parts = [
+        "<!DOCTYPE html>",
+        f"<html><head><meta charset=\"utf-8\"><title>{escape(title)} - {month}</title>",
+        f"<style>{STATEMENT_CSS}</style></head><body>",
+        f"<h1>{escape(title)}</h1>",
+        f"<div class=\"meta\">Statement period {month} &middot; generated {date.today().isoformat()}</div>",
+        "<h2>Invoiced</h2><table><tr><th>Batch</th><th>Invoiced</th><th>Trainee</th><th>License type</th>"
+        "<th>License #</th><th>Submitted</th><th class=\"amount\">Amount</th></tr>",
+        billed,
+        f"<tr class=\"total\"><td colspan=\"6\">Total ({len(lines)} licenses)</td>"
+        f"<td class=\"amount\">${total:,.2f}</td></tr></table>",
+    ]
+    if outstanding:
+        parts += [
+            f"<h2>Not yet invoiced ({len(outstanding)})</h2>",
+            "<table><tr><th>Trainee</th><th>License type</th><th>Submitted</th></tr>",
+            pending,
+            "</table>",
+        ]
+    parts.append("</body></html>")
+    return "\n".join(parts)
+
+
+def write_statement(rvp_name: str, rvp_rep_code: Optional[str], month: str,
+                    outstanding: List[Dict[str, Any]], out_dir: str) -> Dict[str, Any]:
+    """Render and write one statement using this worker's read-only connection."""
+    start, end = month_bounds(month)
+    cur = _worker_conn.cursor()
+    cur.execute(db.RVP_STATEMENT_SQL, (rvp_name, rvp_rep_code, start, end))
+    lines = [dict(r) for r in cur.fetchall()]
+    path = Path(out_dir) / statement_filename(rvp_name, rvp_rep_code, month)
+    path.write_text(render_statement(rvp_name, rvp_rep_code, month, lines, outstanding), encoding='utf-8')
+    return {
+        "rvp_name": rvp_name,
+        "rvp_rep_code": rvp_rep_code,
+        "path": str(path),
+        "line_count": len(lines),
+        "total_amount": round(sum(l['amount'] for l in lines), 2),
+        "outstanding": len(outstanding),
+    }
@@ -0,0 +1,232 @@
+"""Two-way sync of two licensing databases through their change logs.
+
+Each database records the latest change per row in change_log (see
+db._ensure_change_log) and remembers, per peer site, the last version of that
+peer's log it has applied (sync_peer). A sync reads only entries past that
+version from each side, skipping entries that originally came from the other
+side, and applies them in one transaction per database. Rows are identified by
+uid and foreign keys travel as the parent's uid, so local ids never need to
+agree.
+
+Conflicts are resolved deterministically, last writer wins: a change is
+applied only if its origin stamp (ts, site) is greater than the stamp of the
+row's latest local change. Both databases compare the same two stamps, so
+they converge to the same winner whichever side starts the sync, and a change
+that comes back around never re-applies.
+
+Rows moved to the archive file (db.archive_trainees) keep their change-log
+entry with op 'A'. They are sent from the archive like any other upsert, and
+a peer's newer edit to one is written to the archived row. A peer's delete of
+an archived row, and new rows whose required parent is archived, are skipped
+and counted as archived: the archive is history and is never revived.
+"""
+from typing import Any, Dict, List
+import sqlite3
+
+from . import db
+
+# Foreign keys that are NOT NULL: a change whose parent is missing here cannot be applied
+REQUIRED_REFS = {"trainee_id"}
+
+
+def site_id(conn: sqlite3.Connection) -> str:
+    return conn.execute("SELECT site_id FROM sync_state WHERE id = 1").fetchone()[0]
+
+
+def _last_seen(conn: sqlite3.Connection, peer_site: str) -> int:
+    row = conn.execute("SELECT last_seen FROM sync_peer WHERE site_id = ?", (peer_site,)).fetchone()
+    return row[0] if row else 0
+
+
+def _has_archive(conn: sqlite3.Connection) -> bool:
+    return any(r[1] == "archive" for r in conn.execute("PRAGMA database_list").fetchall())
+
+
+def read_changes(conn: sqlite3.Connection, since: int, exclude_site: str) -> List[Dict[str, Any]]:
+    """Change-log entries after version `since` that did not originate at `exclude_site`, with row data.
+
+    Archived rows ('A') are read from the attached archive; without one they are left out.
+    """
+    archived = _has_archive(conn)
+    changes = []
+    for table, spec in db.SYNC_TABLES.items():
+        plain = [c for c in spec["columns"] if c not in spec["refs"]]
+        if table in db.TIMESTAMPED_TABLES:
+            plain.append("created_at")
+        sources = [("main", "c.op != 'A'")]
+        if archived and table in db.ARCHIVE_TABLES:
+            sources.append(("archive", "c.op = 'A'"))
+        for schema, ops in sources:
+            present = set(db._table_columns(conn, schema, table))
+            select = [f"r.{c}" if c in present else "NULL" for c in plain]
+            joins = []
+            for i, (col, parent) in enumerate(spec["refs"].items()):
+                # Archived rows point at archived trainees but live recruiters and classes
+                parent_schema = schema if parent in db.ARCHIVE_TABLES else "main"
+                select.append(f"p{i}.uid")
+                joins.append(f"LEFT JOIN {parent_schema}.{parent} p{i} ON p{i}.id = r.{col}")
+            cur = conn.execute(
+                f"SELECT c.version, c.uid, c.op, c.site, c.ts, {', '.join(select)} "
+                f"FROM change_log c LEFT JOIN {schema}.{table} r ON r.id = c.row_id AND c.op != 'D' {' '.join(joins)} "
+                f"WHERE c.version > ? AND c.tbl = ? AND c.site != ? AND {ops} ORDER BY c.version",
+                (since, table, exclude_site)
+            )
+            for row in cur.fetchall():
+                values = tuple(row)[5:]
+                changes.append({
+                    "table": table, "version": row[0], "uid": row[1], "op": row[2], "site": row[3], "ts": row[4],
+                    "values": dict(zip(plain, values[:len(plain)])),
+                    "refs": dict(zip(spec["refs"], values[len(plain):])),
+                })
+    changes.sort(key=lambda c: c["version"])
+    return changes
+
+
+def _find_parent(cur: sqlite3.Cursor, parent: str, parent_uid: str, archived: bool):
+    """(id, is_archived) of the parent row with `parent_uid`, live first; (None, False) if there is none."""
+    found = cur.execute(f"SELECT id FROM main.{parent} WHERE uid = ?", (parent_uid,)).fetchone()
+    if found:
+        return found[0], False
+    if archived and parent in db.ARCHIVE_TABLES:
+        found = cur.execute(f"SELECT id FROM archive.{parent} WHERE uid = ?", (parent_uid,)).fetchone()
+        if found:
+            return found[0], True
+    return None, False
+
+
+def apply_changes(conn: sqlite3.Connection, changes: List[Dict[str, Any]]) -> Dict[str, int]:
+    """Apply a peer's changes inside the caller's transaction: deletes children-first, then upserts parents-first."""
+    stats = {"applied": 0, "stale": 0, "orphaned": 0, "archived": 0}
+    archived = _has_archive(conn)
+    order = list(db.SYNC_TABLES)
+    deletes = sorted((c for c in changes if c["op"] == "D"), key=lambda c: -order.index(c["table"]))
+    upserts = sorted((c for c in changes if c["op"] != "D"), key=lambda c: order.index(c["table"]))
+    cur = conn.cursor()
+    for change in deletes + upserts:
+        table, uid = change["table"], change["uid"]
+        local = cur.execute("SELECT ts, site, op, row_id FROM change_log WHERE tbl = ? AND uid = ?",
+                            (table, uid)).fetchone()
+        if local and (local[0], local[1]) >= (change["ts"], change["site"]):
+            stats["stale"] += 1
+            continue
+        if local and local[2] == "A":
+            if change["op"] == "D" or not archived or not _update_archived(cur, change, archived):
+                stats["archived"] += 1
+                continue
+            # A new version, so the edit is relayed onwards like any applied change
+            cur.execute("DELETE FROM change_log WHERE tbl = ? AND uid = ?", (table, uid))
+            cur.execute(
+                "INSERT INTO change_log (tbl, row_id, uid, op, site, ts) VALUES (?, ?, ?, 'A', ?, ?)",
+                (table, local[3], uid, change["site"], change["ts"])
+            )
+            stats["applied"] += 1
+            continue
+        before = cur.execute("SELECT COALESCE(MAX(version), 0) FROM change_log").fetchone()[0]
+        if change["op"] == "D":
+            cur.execute(f"DELETE FROM {table} WHERE uid = ?", (uid,))
+            if cur.rowcount == 0:
+                # Never had the row: keep a tombstone so an older insert arriving later stays dead
+                cur.execute(
+                    "INSERT OR REPLACE INTO change_log (tbl, row_id, uid, op, site, ts) VALUES (?, 0, ?, 'D', ?, ?)",
+                    (table, uid, change["site"], change["ts"])
+                )
+        else:
+            values = dict(change["values"])
+            in_archive = False
+            for col, parent in db.SYNC_TABLES[table]["refs"].items():
+                parent_uid = change["refs"][col]
+                values[col], parent_archived = (
+                    _find_parent(cur, parent, parent_uid, archived) if parent_uid else (None, False))
+                in_archive |= parent_archived and col in REQUIRED_REFS
+            if in_archive:
+                stats["archived"] += 1
+                continue
+            if any(values[col] is None for col in REQUIRED_REFS if col in values):
+                stats["orphaned"] += 1
+                continue
+            existing = cur.execute(f"SELECT id FROM {table} WHERE uid = ?", (uid,)).fetchone()
+            if existing:
+                values.pop("created_at", None)
+                cur.execute(
+                    f"UPDATE {table} SET {', '.join(f'{c} = ?' for c in values)} WHERE id = ?",
+                    (*values.values(), existing[0])
+                )
+            else:
+                cols = [*values, "uid"]
+                cur.execute(
+                    f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})",
+                    (*values.values(), uid)
+                )
+        # Entries this change produced (including cascaded deletes) carry the origin's stamp
+        cur.execute("UPDATE change_log SET site = ?, ts = ? WHERE version > ?", (change["site"], change["ts"], before))
+        stats["applied"] += 1
+    return stats
+
+
+def _update_archived(cur: sqlite3.Cursor, change: Dict[str, Any], archived: bool) -> bool:
+    """Write a peer's upsert to the archived copy of its row; False if the row or a required parent is gone."""
+    table = change["table"]
+    present = set(db._table_columns(cur.connection, "archive", table))
+    values = {c: v for c, v in change["values"].items() if c in present and c != "created_at"}
+    for col, parent in db.SYNC_TABLES[table]["refs"].items():
+        parent_uid = change["refs"][col]
+        values[col] = _find_parent(cur, parent, parent_uid, archived)[0] if parent_uid else None
+    if any(values[col] is None for col in REQUIRED_REFS if col in values):
+        return False
+    cur.execute(
+        f"UPDATE archive.{table} SET {', '.join(f'{c} = ?' for c in values)} WHERE uid = ?",
+        (*values.values(), change["uid"])
+    )
+    return cur.rowcount > 0
+
+
+def _mark_seen(conn: sqlite3.Connection, peer_site: str, version: int) -> None:
+    conn.execute(
+        "INSERT INTO sync_peer (site_id, last_seen, synced_at) VALUES (?, ?, strftime('%Y-%m-%d %H:%M:%f', 'now')) "
+        "ON CONFLICT(site_id) DO UPDATE SET last_seen = excluded.last_seen, synced_at = excluded.synced_at",
+        (peer_site, version)
+    )
+
+
+def sync(local_path, peer_path) -> Dict[str, Any]:
+    """Exchange changes between two database files and return what happened on each side.
+
+    Both files are write-locked for the duration, so the exchange sees a
+    consistent pair of logs; each side commits its own transaction. Each
+    side's archive file, if it has one, is attached for its archived rows.
+    """
+    with db.get_db_connection(local_path) as local, db.get_db_connection(peer_path) as peer:
+        local_site, peer_site = site_id(local), site_id(peer)
+        if local_site == peer_site:
+            raise ValueError("both databases have the same site id; one is a copy of the other")
+        db.attach_archive(local, local_path)
+        db.attach_archive(peer, peer_path)
+        local.execute("BEGIN IMMEDIATE")
+        peer.execute("BEGIN IMMEDIATE")
+        try:
+            outgoing = read_changes(local, _last_seen(peer, local_site), peer_site)
+            incoming = read_changes(peer, _last_seen(local, peer_site), local_site)
+            local_version = local.execute("SELECT COALESCE(MAX(version), 0) FROM change_log").fetchone()[0]
+            peer_version = peer.execute("SELECT COALESCE(MAX(version), 0) FROM change_log").fetchone()[0]
+            both = {(c["table"], c["uid"]) for c in outgoing} & {(c["table"], c["uid"]) for c in incoming}
+
+            peer_stats = apply_changes(peer, outgoing)
+            _mark_seen(peer, local_site, local_version)
+            local_stats = apply_changes(local, incoming)
+            _mark_seen(local, peer_site, peer_version)
+            peer.commit()
+            local.commit()
+        except Exception:
+            peer.rollback()
+            local.rollback()
+            raise
+    return {
+        "sent": len(outgoing),
+        "received": len(incoming),
+        "conflicts": len(both),
+        "applied_to_peer": peer_stats["applied"],
+        "applied_locally": local_stats["applied"],
+        "stale": peer_stats["stale"] + local_stats["stale"],
+        "orphaned": peer_stats["orphaned"] + local_stats["orphaned"],
+        "archived": peer_stats["archived"] + local_stats["archived"],
+    }
@@ -2,7 +2,7 @@ from PySide6.QtWidgets import (
     QWidget, QVBoxLayout, QHBoxLayout, QGridLayout, QLabel, 
     QScrollArea, QFrame, QPushButton
 )
-from PySide6.QtCore import Qt
+from PySide6.QtCore import Qt, QTimer
 from ..widgets import create_section_header, _load_icon
 from .. import services
 from ..styles import (
@@ -55,11 +55,18 @@ class ActivityItem(QWidget):
         layout.addWidget(time_label)
 
 class DashboardTab(QWidget):
+    DEADLINE_SCAN_INTERVAL_MS = 5 * 60 * 1000
+
     def __init__(self, main_window):
         super().__init__()
         self.main_window = main_window
         self._build_ui()
 
+        # Re-scan license deadlines periodically so the counts stay current between edits
+        self.deadline_timer = QTimer(self)
+        self.deadline_timer.timeout.connect(self._scan_deadlines)
+        self.deadline_timer.start(self.DEADLINE_SCAN_INTERVAL_MS)
+
     def _build_ui(self) -> None:
         main_layout = QVBoxLayout(self)
         main_layout.setContentsMargins(20, 20, 20, 20)
@@ -117,6 +124,13 @@ class DashboardTab(QWidget):
         
         shortcuts_container.addWidget(self.add_trainee_btn)
         shortcuts_container.addWidget(self.add_exam_btn)
+
+        # License deadline worklist, most overdue first
+        shortcuts_container.addSpacing(10)
+        shortcuts_container.addWidget(create_section_header("License Deadlines"))
+        self.deadline_layout = QVBoxLayout()
+        self.deadline_layout.setSpacing(0)
+        shortcuts_container.addLayout(self.deadline_layout)
         
         bottom_layout.addLayout(shortcuts_container, 1)
         
@@ -149,13 +163,56 @@ class DashboardTab(QWidget):
             card = DashboardCard(ms['module'], ms['pass_rate'])
             self.module_stats_grid.addWidget(card, row, col)
 
-        # 2. Clear and rebuild activity list
+        # 1c. License deadlines (also refreshed by the timer)
+        self._scan_deadlines()
+
+        # 2. Reload the first page of the activity feed
+        self._activities = services.get_recent_activity()
+        self._render_activity()
+
+    def _scan_deadlines(self) -> None:
+        """Update the deadline cards and worklist from the indexed deadline scan."""
+        for i in reversed(range(self.deadline_layout.count())):
+            self.deadline_layout.itemAt(i).widget().setParent(None)
+        for card in getattr(self, "_deadline_cards", []):
+            card.setParent(None)
+
+        scan = services.scan_license_deadlines(limit=10)
+        counts = scan["counts"]
+        self._deadline_cards = [
+            DashboardCard("Stale Pending", str(counts["stale_pending"])),
+            DashboardCard(f"Expiring ({services.EXPIRY_WARNING_DAYS}d)", str(counts["expiring"])),
+            DashboardCard("Expired", str(counts["expired"])),
+        ]
+        for col, card in enumerate(self._deadline_cards):
+            self.stats_grid.addWidget(card, 1, col)
+
+        if not scan["worklist"]:
+            self.deadline_layout.addWidget(QLabel("Nothing due."))
+        for item in scan["worklist"]:
+            when = f"{-item['days_left']}d overdue" if item['days_left'] < 0 else f"due in {item['days_left']}d"
+            self.deadline_layout.addWidget(
+                ActivityItem(item['kind'], f"{item['trainee']}: {item['reason']}", when)
+            )
+
+    def _load_older_activity(self) -> None:
+        """Append the next page of older journal entries to the feed."""
+        if not self._activities:
+            return
+        older = services.get_recent_activity(before=self._activities[-1]['cursor'])
+        if not older:
+            self.main_window._show_status("No older activity")
+            return
+        self._activities.extend(older)
+        self._render_activity()
+
+    def _render_activity(self) -> None:
         for i in reversed(range(self.activity_layout.count())): 
             item = self.activity_layout.itemAt(i)
             if item.widget():
                 item.widget().setParent(None)
 
-        activities = services.get_recent_activity()
+        activities = self._activities
         
         # Group by type
         grouped = {}
@@ -179,6 +236,11 @@ class DashboardTab(QWidget):
             for act in items:
                 self.activity_layout.addWidget(ActivityItem(act['type'], act['label'], act['timestamp']))
 
+        if activities:
+            more_btn = QPushButton("Show older activity")
+            more_btn.clicked.connect(self._load_older_activity)
+            self.activity_layout.addWidget(more_btn)
+
 def setup_dashboard_tab(main_window):
     tab = DashboardTab(main_window)
     main_window.dashboard_tab = tab
@@ -10,7 +10,7 @@ logger = logging.getLogger(__name__)
 from ..widgets import (
     log_and_show_error, create_form_section, create_button_row, 
     create_section_header, _load_icon, create_badge,
-    setup_searchable_combobox
+    setup_searchable_combobox, format_score, run_import, run_reconcile
 )
 from ..styles import BADGE_SUCCESS, BADGE_ERROR
 from .. import db
@@ -60,13 +60,15 @@ class ExamTab(QWidget):
         exam_btns = create_button_row([
             ("Edit", self._edit_exam, "edit"),
             ("Delete", self._delete_selected_exam, "delete"),
+            ("Import", self._import_exams, "add"),
+            ("Provincial Results", self._reconcile_results, "check"),
         ])
         right.addLayout(exam_btns)
         
         # Provincial info
         right.addWidget(create_section_header("Provincial Exam Data for Selected Trainee"))
         self.prov_exam_info = QTreeWidget()
-        self.prov_exam_info.setHeaderLabels(["Exam Date", "Module", "Score", "Result", "Notes"])
+        self.prov_exam_info.setHeaderLabels(["Exam Date", "Module", "Attempt", "Score", "Result", "Notes"])
         self.prov_exam_info.setAlternatingRowColors(True)
         self.prov_exam_info.setRootIsDecorated(False)
         right.addWidget(self.prov_exam_info)
@@ -156,18 +158,16 @@ class ExamTab(QWidget):
                 badge.setStyleSheet(BADGE_SUCCESS if completed else BADGE_ERROR)
 
         # Update provincial list
-        conn = db.get_conn(); cur = conn.cursor()
-        cur.execute("SELECT * FROM exam WHERE trainee_id = ? AND is_practice = 0 ORDER BY exam_date DESC", (tid,))
-        for e in cur.fetchall():
+        for e in db.list_provincial_attempts(tid):
             res = "Pass" if e['passed'] == 1 else "Fail" if e['passed'] == 0 else "—"
             QTreeWidgetItem(self.prov_exam_info, [
                 e['exam_date'] or "—",
                 e['module'] or "—",
-                e['score'] or "—",
+                str(e['attempt']) if e['module'] else "—",
+                format_score(e),
                 res,
                 e['notes'] or ""
             ])
-        conn.close()
 
     def _edit_exam(self) -> None:
         sel = self.exam_list.currentRow()
@@ -226,6 +226,19 @@ class ExamTab(QWidget):
         if dlg.exec() == QDialog.Accepted:
             self.refresh()
 
+    def _import_exams(self) -> None:
+        result = run_import(self, "exams", "Import Exams")
+        if result:
+            self.main_window._show_status(f"Imported {result['imported']} exams")
+            self.refresh()
+
+    def _reconcile_results(self) -> None:
+        result = run_reconcile(self)
+        if result:
+            self.main_window._show_status(
+                f"Applied results: {result['exams_updated']} exams, {result['licenses_updated']} licenses updated")
+            self.refresh()
+
     def _delete_selected_exam(self) -> None:
         sel = self.exam_list.currentRow()
         if sel < 0: return
@@ -3,7 +3,7 @@ from PySide6.QtWidgets import (
     QListWidget, QListWidgetItem, QTreeWidget, QTreeWidgetItem, QAbstractItemView, QHeaderView, 
     QDialog, QFormLayout, QMessageBox, QCheckBox, QLabel, QFileDialog, QSplitter
 )
-from PySide6.QtCore import Qt
+from PySide6.QtCore import Qt, QTimer
 from PySide6.QtGui import QAction, QKeySequence
 import logging
 
@@ -12,7 +12,7 @@ logger = logging.getLogger(__name__)
 from ..widgets import (
     log_and_show_error, create_form_section, create_button_row, 
     create_section_header, create_badge, _load_icon,
-    setup_searchable_combobox
+    setup_searchable_combobox, run_export, run_import
 )
 from ..styles import BADGE_SUCCESS, BADGE_ERROR, BADGE_WARNING, BADGE_INFO
 from .. import db
@@ -38,6 +38,7 @@ class LicenseTab(QWidget):
         self.lic_type.addItems(["", "Life", "Mutual Funds"])
         self.lic_app = QLineEdit()
         self.lic_approval = QLineEdit()
+        self.lic_expiry = QLineEdit()
         self.lic_number = QLineEdit()
         self.lic_status = QLineEdit()
         
@@ -55,6 +56,7 @@ class LicenseTab(QWidget):
             ("License Type", self.lic_type),
             ("App. Date", self.lic_app),
             ("Appr. Date", self.lic_approval),
+            ("Expiry Date", self.lic_expiry),
             ("License #", self.lic_number),
             ("Status", self.lic_status),
         ]
@@ -81,9 +83,13 @@ class LicenseTab(QWidget):
         exp_btn = QPushButton("Export")
         exp_btn.setIcon(_load_icon("export"))
         exp_btn.clicked.connect(self._export_licenses)
+        imp_btn = QPushButton("Import")
+        imp_btn.setIcon(_load_icon("add"))
+        imp_btn.clicked.connect(self._import_licenses)
         
         btns_layout.addWidget(add_btn)
         btns_layout.addWidget(inv_btn)
+        btns_layout.addWidget(imp_btn)
         btns_layout.addWidget(exp_btn)
         left.addLayout(btns_layout)
         left.addStretch()
@@ -155,9 +161,10 @@ class LicenseTab(QWidget):
         rvp_tree_layout = QVBoxLayout(rvp_tree_container)
         rvp_tree_layout.addWidget(create_section_header("Select RVP"))
         self.rvp_tree = QTreeWidget()
-        self.rvp_tree.setHeaderLabels(["RVP", "Total"])
+        self.rvp_tree.setHeaderLabels(["RVP / Recruiter / Trainee", "Trainees", "Licenses"])
         self.rvp_tree.setAlternatingRowColors(True)
         self.rvp_tree.itemSelectionChanged.connect(self._on_rvp_select)
+        self.rvp_tree.itemExpanded.connect(self._on_rvp_expand)
         self.rvp_tree.itemDoubleClicked.connect(self._on_rvp_double_click)
         rvp_tree_layout.addWidget(self.rvp_tree)
         
@@ -189,27 +196,64 @@ class LicenseTab(QWidget):
         self.rvp_tree.setCurrentItem(self.rvp_tree.topLevelItem(0))
         self._refresh_licenses()
 
+    # Qt.UserRole on every hierarchy node holds its RVP (name, rep_code) so the license
+    # filter and invoice shortcuts work at any depth; NODE_ROLE holds the node itself.
+    NODE_ROLE = Qt.UserRole + 1
+
+    def _add_rvp_node(self, parent, label: str, stats: dict, rvp: tuple, node: dict) -> QTreeWidgetItem:
+        trainees = stats.get('trainee_count')
+        item = QTreeWidgetItem(parent, [
+            label,
+            "" if trainees is None else str(trainees),
+            str(stats['total_licenses'] or 0)
+        ])
+        item.setTextAlignment(1, Qt.AlignmentFlag.AlignCenter)
+        item.setTextAlignment(2, Qt.AlignmentFlag.AlignCenter)
+        item.setData(0, Qt.UserRole, rvp)
+        # Store full stats in the item for quick profile access
+        item.setData(1, Qt.UserRole, stats)
+        item.setData(0, self.NODE_ROLE, node)
+        if node['level'] != "trainee":
+            # Children are fetched on first expand
+            item.setChildIndicatorPolicy(QTreeWidgetItem.ChildIndicatorPolicy.ShowIndicator)
+        return item
+
     def _refresh_rvp_panel(self) -> None:
         self.rvp_tree.clear()
         stats = db.get_rvp_stats()
         
         # Add "All RVPs" item
-        all_item = QTreeWidgetItem(self.rvp_tree, ["All RVPs", ""])
+        all_item = QTreeWidgetItem(self.rvp_tree, ["All RVPs", "", ""])
         all_item.setData(0, Qt.UserRole, "ALL")
         
         for s in stats:
+            rvp = (s['rvp_name'], s['rvp_rep_code'])
             name = f"{s['rvp_name']} ({s['rvp_rep_code'] or '—'})"
-            item = QTreeWidgetItem(self.rvp_tree, [
-                name,
-                str(s['total_licenses'] or 0)
-            ])
-            item.setTextAlignment(1, Qt.AlignmentFlag.AlignCenter)
-            item.setData(0, Qt.UserRole, (s['rvp_name'], s['rvp_rep_code']))
-            # Store full stats in the item for quick profile access
-            item.setData(1, Qt.UserRole, s)
+            self._add_rvp_node(self.rvp_tree, name, s, rvp, {"level": "rvp", "loaded": False})
         
         self.rvp_tree.setCurrentItem(all_item)
 
+    def _on_rvp_expand(self, item: QTreeWidgetItem) -> None:
+        node = item.data(0, self.NODE_ROLE)
+        if not node or node.get('loaded'):
+            return
+        name, code = item.data(0, Qt.UserRole)
+        try:
+            if node['level'] == "rvp":
+                for r in db.get_rvp_recruiter_stats(name, code):
+                    self._add_rvp_node(item, r['recruiter_name'] or "Unassigned", r, (name, code),
+                                       {"level": "recruiter", "recruiter_id": r['recruiter_id'], "loaded": False})
+            elif node['level'] == "recruiter":
+                for t in db.get_rvp_trainee_stats(name, code, node['recruiter_id']):
+                    self._add_rvp_node(item, f"{t['last_name']}, {t['first_name']}", t, (name, code),
+                                       {"level": "trainee", "trainee_id": t['id']})
+        except Exception as exc:
+            log_and_show_error(self, "Error", "Failed to load RVP hierarchy", exc)
+            return
+        item.setData(0, self.NODE_ROLE, dict(node, loaded=True))
+        if item.childCount() == 0:
+            item.setChildIndicatorPolicy(QTreeWidgetItem.ChildIndicatorPolicy.DontShowIndicator)
+
     def _on_rvp_select(self) -> None:
         self._refresh_licenses()
         self._update_rvp_profile()
@@ -233,8 +277,12 @@ class LicenseTab(QWidget):
              
         name, code = name_code
         stats = sel_items[0].data(1, Qt.UserRole)
+        node = sel_items[0].data(0, self.NODE_ROLE) or {"level": "rvp"}
         
-        self.rvp_profile.add_header(name, f"Rep Code: {code or '—'}")
+        if node['level'] == "rvp":
+            self.rvp_profile.add_header(name, f"Rep Code: {code or '—'}")
+        else:
+            self.rvp_profile.add_header(sel_items[0].text(0), f"RVP: {name} ({code or '—'})")
         
         metrics = [
             ("Issued Licenses", str(stats['issued_count']), "check"),
@@ -242,14 +290,10 @@ class LicenseTab(QWidget):
             ("Invoiced", str(stats['invoiced_count']), "box"),
             ("Total Records", str(stats['total_licenses']), "list"),
         ]
+        if node['level'] != "trainee":
+            metrics.insert(0, ("Trainees", str(stats['trainee_count']), "user"))
         self.rvp_profile.add_section("Performance Summary", metrics)
         
-        # Trainees list
-        trainees = db.get_trainees_by_rvp(name, code)
-        if trainees:
-            tr_names = [f"{t['first_name']} {t['last_name']}" for t in trainees]
-            self.rvp_profile.add_section("Assigned Trainees", [("", n, "user") for n in tr_names])
-        
         # Action
         view_inv_btn = QPushButton(f"View Invoices for {name}")
         view_inv_btn.setIcon(_load_icon("box"))
@@ -285,6 +329,7 @@ class LicenseTab(QWidget):
         tid = int(t.split(":", 1)[0])
         app_date = self.lic_app.text().strip() or None
         approval_date = self.lic_approval.text().strip() or None
+        expiry_date = self.lic_expiry.text().strip() or None
         lic_num = self.lic_number.text().strip() or None
         status = self.lic_status.text().strip() or None
         ltype = self.lic_type.currentText() or None
@@ -304,7 +349,7 @@ class LicenseTab(QWidget):
 
         try:
             db.add_license(tid, app_date, approval_date, lic_num, status, None, 
-                           license_type=ltype, invoiced=False)
+                           license_type=ltype, invoiced=False, expiry_date=expiry_date)
             self.main_window._show_status(f"Added license for {t}")
         except Exception as exc:
             log_and_show_error(self, "Error", "Failed to add license", exc)
@@ -322,37 +367,121 @@ class LicenseTab(QWidget):
         tree.setHeaderLabels(["Entity", "License Type", "Status"])
         tree.setColumnWidth(0, 400)
         layout.addWidget(tree)
-        
-        rows = db.get_rvp_invoice_summary()
-        rvp_map = {}
-        for r in rows:
-            if filter_rvp:
-                if (r['rvp_name'], r['rvp_rep_code']) != filter_rvp:
-                    continue
-
-            rvp_key = (r['rvp_name'], r['rvp_rep_code'] or "")
-            if rvp_key not in rvp_map:
-                rvp_item = QTreeWidgetItem(tree, [f"RVP: {r['rvp_name']} ({r['rvp_rep_code'] or '—'})"])
-                rvp_map[rvp_key] = rvp_item
-            
-            parent = rvp_map[rvp_key]
-            l_item = QTreeWidgetItem(parent, [f"{r['last_name']}, {r['first_name']}", r['license_type'] or "—"])
-            
-            cb = QCheckBox("Invoiced ($50)")
-            cb.setChecked(bool(r['invoiced']))
-            
-            # Using nonlocal capture for lid because it's in a loop
-            def make_toggle_fn(lid):
-                return lambda state: db.update_license_invoice_status(lid, state == Qt.CheckState.Checked.value)
-            
-            cb.stateChanged.connect(make_toggle_fn(r['license_id']))
-            tree.setItemWidget(l_item, 2, cb)
-            parent.setExpanded(True)
-            
-        tree.expandAll()
+
+        run_btn = QPushButton("Invoice All Uninvoiced" + (f" for {filter_rvp[0]}" if filter_rvp else ""))
+        run_btn.setIcon(_load_icon("box"))
+        layout.addWidget(run_btn)
+
+        stmt_btn = QPushButton("Generate Monthly Statements" + (f" for {filter_rvp[0]}" if filter_rvp else ""))
+        stmt_btn.setIcon(_load_icon("export"))
+        layout.addWidget(stmt_btn)
+
+        extract_btn = QPushButton("Generate RVP Extract Databases" + (f" for {filter_rvp[0]}" if filter_rvp else ""))
+        extract_btn.setIcon(_load_icon("export"))
+        layout.addWidget(extract_btn)
+        
+        def populate():
+            tree.clear()
+            rates = db.get_invoice_rates()
+            rows = db.get_rvp_invoice_summary()
+            rvp_map = {}
+            for r in rows:
+                if filter_rvp:
+                    if (r['rvp_name'], r['rvp_rep_code']) != filter_rvp:
+                        continue
+
+                rvp_key = (r['rvp_name'], r['rvp_rep_code'] or "")
+                if rvp_key not in rvp_map:
+                    rvp_item = QTreeWidgetItem(tree, [f"RVP: {r['rvp_name']} ({r['rvp_rep_code'] or '—'})"])
+                    rvp_map[rvp_key] = rvp_item
+                
+                parent = rvp_map[rvp_key]
+                l_item = QTreeWidgetItem(parent, [f"{r['last_name']}, {r['first_name']}", r['license_type'] or "—"])
+                
+                amount = rates.get(r['license_type'], rates.get("*", db.DEFAULT_INVOICE_AMOUNT))
+                cb = QCheckBox(f"Invoiced (${amount:,.2f})")
+                cb.setChecked(bool(r['invoiced']))
+                
+                # Using nonlocal capture for lid because it's in a loop
+                def make_toggle_fn(lid):
+                    return lambda state: db.update_license_invoice_status(lid, state == Qt.CheckState.Checked.value)
+                
+                cb.stateChanged.connect(make_toggle_fn(r['license_id']))
+                tree.setItemWidget(l_item, 2, cb)
+                parent.setExpanded(True)
+                
+            tree.expandAll()
+
+        def run_invoices():
+            result = services.run_invoices(rvp=filter_rvp)
+            if result is None:
+                QMessageBox.critical(dlg, "Error", "Invoice run failed; nothing was invoiced. See the log for details.")
+                return
+            if not result['batches']:
+                QMessageBox.information(dlg, "Invoices", "Nothing left to invoice.")
+                return
+            QMessageBox.information(
+                dlg, "Invoices",
+                f"Created {len(result['batches'])} invoice batch(es) for {result['line_count']} license(s), "
+                f"totalling ${result['total_amount']:,.2f}."
+            )
+            populate()
+
+        def generate_statements():
+            out_dir = QFileDialog.getExistingDirectory(dlg, "Save Statements To")
+            if not out_dir:
+                return
+
+            def finished(results):
+                stmt_btn.setEnabled(True)
+                if results is None:
+                    QMessageBox.critical(dlg, "Error", "Statement generation failed. See the log for details.")
+                    return
+                self.main_window._show_status(f"Wrote {len(results)} statement(s) to {out_dir}")
+                QMessageBox.information(dlg, "Statements", f"Wrote {len(results)} RVP statement(s) to {out_dir}.")
+
+            stmt_btn.setEnabled(False)
+            self._watch_job(services.start_rvp_statements(out_dir, rvp=filter_rvp), "Writing statements", finished)
+
+        def generate_extracts():
+            out_dir = QFileDialog.getExistingDirectory(dlg, "Save Extracts To")
+            if not out_dir:
+                return
+
+            def finished(results):
+                extract_btn.setEnabled(True)
+                if results is None:
+                    QMessageBox.critical(dlg, "Error", "Extract generation failed. See the log for details.")
+                    return
+                self.main_window._show_status(f"Wrote {len(results)} extract(s) to {out_dir}")
+                QMessageBox.information(dlg, "Extracts", f"Wrote {len(results)} RVP extract database(s) to {out_dir}.")
+
+            extract_btn.setEnabled(False)
+            self._watch_job(services.start_rvp_extracts(out_dir, rvp=filter_rvp), "Writing extracts", finished)
+
+        run_btn.clicked.connect(run_invoices)
+        stmt_btn.clicked.connect(generate_statements)
+        extract_btn.clicked.connect(generate_extracts)
+        populate()
         dlg.exec()
         self.refresh()
 
+    def _watch_job(self, job, label: str, finished) -> None:
+        """Poll a background job from a timer, showing its progress in the status bar, then call finished(result)."""
+        timer = QTimer(self)
+
+        def poll():
+            if job.running:
+                percent = 100 * job.done // job.total if job.total else 0
+                self.main_window.statusBar().showMessage(f"{label}... {percent}%")
+                return
+            timer.stop()
+            timer.deleteLater()
+            finished(job.result)
+
+        timer.timeout.connect(poll)
+        timer.start(500)
+
     def _refresh_license_dropdowns(self) -> None:
         trainees = db.list_trainees()
         tr_items = [f"{t['id']}: {t['last_name']}, {t['first_name']}" for t in trainees]
@@ -364,35 +493,28 @@ class LicenseTab(QWidget):
 
     def _refresh_licenses(self) -> None:
         self.lic_list.clear()
-        search_text = self.lic_search.text().lower()
+        search_text = self.lic_search.text().strip()
         type_filter = self.type_filter.currentText()
         
-        # Get current RVP filter
+        # Get current RVP filter, narrowed to the recruiter or trainee node when one is selected
         sel_items = self.rvp_tree.selectedItems()
         rvp_filter = None
+        node = {}
         if sel_items:
             data = sel_items[0].data(0, Qt.UserRole)
             if data != "ALL":
-                rvp_filter = data # (name, rep_code)
-
-        for l in db.list_licenses():
-            # Apply RVP Filter
-            if rvp_filter:
-                trainee = db.get_trainee(l['trainee_id'])
-                if not trainee or (trainee['rvp_name'], trainee['rvp_rep_code']) != rvp_filter:
-                    continue
-
-            # Apply Type Filter
-            l_type = l['license_type'] or ""
-            if type_filter != "All Types" and type_filter != l_type:
-                continue
-
-            # Apply Search Filter (Trainee Name or License Number)
-            name_text = f"{l['last_name']}, {l['first_name']}".lower()
-            lnum = (l['license_number'] or "").lower()
-            if search_text and (search_text not in name_text and search_text not in lnum):
-                continue
-
+                rvp_filter = tuple(data) # (name, rep_code)
+                node = sel_items[0].data(0, self.NODE_ROLE) or {}
+
+        rows = db.query_licenses(
+            rvp=rvp_filter,
+            license_type=None if type_filter == "All Types" else type_filter,
+            text=search_text or None,
+            recruiter_id=node.get('recruiter_id'),
+            unassigned=node.get('level') == "recruiter" and node['recruiter_id'] is None,
+            trainee_id=node.get('trainee_id'),
+        )
+        for l in rows:
             item_widget = QWidget()
             # Use a slightly more complex layout for the "Card"
             main_v = QVBoxLayout(item_widget)
@@ -458,19 +580,15 @@ class LicenseTab(QWidget):
 
 
     def _export_licenses(self) -> None:
-        path, _ = QFileDialog.getSaveFileName(self, "Export Licenses", "licenses_export.csv", "CSV Files (*.csv)")
-        if not path:
-            return
-            
-        data = services.get_license_export_data()
-        if not data:
-            QMessageBox.information(self, "Export", "No license data to export.")
-            return
-            
-        if services.export_to_csv(data, path):
+        path = run_export(self, "licenses", "Export Licenses", "licenses_export")
+        if path:
             self.main_window._show_status(f"Exported to {path}")
-        else:
-            QMessageBox.critical(self, "Export", "Failed to export data. Check logs.")
+
+    def _import_licenses(self) -> None:
+        result = run_import(self, "licenses", "Import Licenses")
+        if result:
+            self.main_window._show_status(f"Imported {result['imported']} licenses")
+            self.refresh()
 
     def _edit_license(self) -> None:
         sel = self.lic_list.currentRow()
@@ -496,6 +614,7 @@ class LicenseTab(QWidget):
         type_cb.setCurrentText(lic['license_type'] or "")
         
         app_e = QLineEdit(lic['application_submitted_date'] or ""); approval_e = QLineEdit(lic['approval_date'] or "")
+        expiry_e = QLineEdit(lic['expiry_date'] or "")
         num_e = QLineEdit(lic['license_number'] or ""); status_e = QLineEdit(lic['status'] or "")
         invoiced_cb = QCheckBox("Invoiced"); invoiced_cb.setChecked(bool(lic['invoiced']))
         
@@ -506,6 +625,7 @@ class LicenseTab(QWidget):
         form.addRow("License Type", type_cb)
         form.addRow("Application date", app_e)
         form.addRow("Approval date", approval_e)
+        form.addRow("Expiry date", expiry_e)
         form.addRow("License number", num_e)
         form.addRow("Status", status_e)
         form.addRow(invoiced_cb)
@@ -531,7 +651,8 @@ class LicenseTab(QWidget):
                 db.update_license(lid, tid_new, app_e.text().strip() or None, approval_e.text().strip() or None, 
                                   num_e.text().strip() or None, status_e.text().strip() or None, None,
                                   license_type=type_cb.currentText() or None,
-                                  invoiced=invoiced_cb.isChecked())
+                                  invoiced=invoiced_cb.isChecked(),
+                                  expiry_date=expiry_e.text().strip() or None)
             except Exception as exc:
                 log_and_show_error(self, "Error", "Failed to update license", exc)
                 return
@@ -1,7 +1,7 @@
 from PySide6.QtWidgets import (
     QWidget, QHBoxLayout, QVBoxLayout, QLineEdit, QPushButton, 
     QTreeWidget, QAbstractItemView, QHeaderView, QTreeWidgetItem, 
-    QFormLayout, QDialog, QMessageBox, QFileDialog, QComboBox
+    QFormLayout, QDialog, QMessageBox, QComboBox
 )
 from PySide6.QtCore import Qt
 import logging
@@ -10,7 +10,7 @@ logger = logging.getLogger(__name__)
 from ..widgets import (
     log_and_show_error, create_form_section, create_search_bar, 
     create_button_row, create_section_header, ModernProfileView, _load_icon,
-    setup_searchable_combobox
+    setup_searchable_combobox, run_export, run_import
 )
 from .. import db
 from .. import services
@@ -64,6 +64,7 @@ class RecruiterTab(QWidget):
         btns = create_button_row([
             ("Edit", self._edit_recruiter, "edit"),
             ("Delete", self._delete_recruiter, "delete"),
+            ("Import", self._import_recruiters, "add"),
             ("Export", self._export_recruiters, "export"),
         ])
         right.addLayout(btns)
@@ -188,19 +189,15 @@ class RecruiterTab(QWidget):
                 log_and_show_error(self, e, "Error deleting recruiters")
 
     def _export_recruiters(self) -> None:
-        path, _ = QFileDialog.getSaveFileName(self, "Export Recruiters", "recruiters_export.csv", "CSV Files (*.csv)")
-        if not path:
-            return
-            
-        data = services.get_recruiter_export_data()
-        if not data:
-            QMessageBox.information(self, "Export", "No recruiter data to export.")
-            return
-            
-        if services.export_to_csv(data, path):
+        path = run_export(self, "recruiters", "Export Recruiters", "recruiters_export")
+        if path:
             self.main_window._show_status(f"Exported to {path}")
-        else:
-            QMessageBox.critical(self, "Export", "Failed to export data. Check logs.")
+
+    def _import_recruiters(self) -> None:
+        result = run_import(self, "recruiters", "Import Recruiters")
+        if result:
+            self.main_window._show_status(f"Imported {result['imported']} recruiters")
+            self.refresh()
 
     def _on_rec_name_completer(self, text: str) -> None:
         self.rec_search.setText(text)
@@ -1,7 +1,7 @@
 from PySide6.QtWidgets import (
     QWidget, QHBoxLayout, QVBoxLayout, QLineEdit, QComboBox, QPushButton, 
     QTreeWidget, QAbstractItemView, QHeaderView, QTreeWidgetItem, QDialog, 
-    QFormLayout, QMessageBox, QFileDialog
+    QFormLayout, QMessageBox, QInputDialog
 )
 from PySide6.QtCore import Qt
 from PySide6.QtGui import QBrush, QColor
@@ -12,7 +12,7 @@ logger = logging.getLogger(__name__)
 from ..widgets import (
     log_and_show_error, create_form_section, create_button_row, 
     create_section_header, create_search_bar, create_badge, ModernProfileView,
-    setup_searchable_combobox
+    setup_searchable_combobox, format_score, run_export, run_import
 )
 from ..styles import BADGE_SUCCESS, BADGE_ERROR, BADGE_WARNING, BADGE_INFO
 from .. import db
@@ -44,7 +44,9 @@ class TraineeTab(QWidget):
             ("Add Trainee", self._add_trainee, "add"),
             ("Edit Trainee", self._edit_trainee, "edit"),
             ("Delete Trainee", self._delete_trainee, "delete"),
+            ("Import", self._import_trainees, "add"),
             ("Export", self._export_trainees, "export"),
+            ("Archive", self._archive_trainees, "box"),
         ])
         left.addLayout(btns)
         l.addLayout(left, 1)
@@ -161,30 +163,24 @@ class TraineeTab(QWidget):
         if not sel: return
         # If multiple items are selected, only show details for the first one
         tid = int(sel[0].text(0))
-        t = db.get_trainee(tid)
-        if not t: return
+        profile = services.get_trainee_profile(tid)
+        if not profile: return
+        t = profile['trainee']
         
         self.tr_details.add_header(f"{t['first_name']} {t['last_name']}", f"Trainee ID: {t['id']}")
         
         basic_info = []
         if t['dob']: basic_info.append(("IBA Date", t['dob'], "search"))
         if t['rep_code']: basic_info.append(("Rep Code", t['rep_code'], "box"))
-        
-        if t['recruiter_id']:
-            r = db.get_recruiter(t['recruiter_id'])
-            if r: basic_info.append(("Recruiter", r['name'], "search"))
+        if profile['recruiter_name']: basic_info.append(("Recruiter", profile['recruiter_name'], "search"))
             
         if basic_info:
             self.tr_details.add_section("Basic Information", basic_info)
 
         # Status Badges
         try:
-            modules_complete = services.all_practice_modules_complete(tid)
-            conn = db.get_conn(); cur = conn.cursor()
-            cur.execute("SELECT MIN(exam_date) as first_date FROM exam WHERE trainee_id = ? AND is_practice = 0", (tid,))
-            first_exam_row = cur.fetchone(); conn.close()
-            first_exam_date = first_exam_row['first_date'] if first_exam_row else None
-            seewhy = services.check_seewhy_guarantee(tid, first_exam_date) if first_exam_date else False
+            modules_complete = profile['modules_complete']
+            seewhy = profile['seewhy']
             
             badge_container = QWidget()
             badge_layout = QHBoxLayout(badge_container)
@@ -204,32 +200,27 @@ class TraineeTab(QWidget):
             pass
 
         # Classes
-        conn = db.get_conn(); cur = conn.cursor()
-        cur.execute("SELECT c.* FROM class c JOIN trainee_class tc ON c.id = tc.class_id WHERE tc.trainee_id = ? ORDER BY c.start_date", (tid,))
         classes_info = []
-        for c in cur.fetchall():
+        for c in profile['classes']:
             classes_info.append((c['name'], f"{c['start_date'] or '—'} to {c['end_date'] or '—'}", "box"))
         if classes_info:
             self.tr_details.add_section("Classes", classes_info)
         
         # Exams
-        cur.execute("SELECT * FROM exam WHERE trainee_id = ? ORDER BY exam_date DESC", (tid,))
         exams_info = []
-        for e in cur.fetchall():
+        for e in profile['exams']:
             mod = f"[{e['module']}] " if 'module' in e.keys() and e['module'] else ''
             pass_str = "Pass" if e['passed'] == 1 else "Fail" if e['passed'] == 0 else "—"
-            exams_info.append((f"{e['exam_date'] or '—'}", f"{mod}{pass_str} (Score: {e['score'] or '—'})", "edit"))
+            exams_info.append((f"{e['exam_date'] or '—'}", f"{mod}{pass_str} (Score: {format_score(e)})", "edit"))
         if exams_info:
             self.tr_details.add_section("Exams", exams_info)
             
         # Licenses
-        cur.execute("SELECT * FROM license WHERE trainee_id = ? ORDER BY application_submitted_date DESC", (tid,))
         lic_info = []
-        for l in cur.fetchall():
+        for l in profile['licenses']:
             lic_info.append((f"{l['application_submitted_date'] or '—'}", f"Status: {l['status'] or '—'}", "check"))
         if lic_info:
             self.tr_details.add_section("Licenses", lic_info)
-        conn.close()
 
     def _edit_trainee(self) -> None:
         sel = self.tr_table.selectedItems()
@@ -295,19 +286,36 @@ class TraineeTab(QWidget):
         self._filter_trainees()
 
     def _export_trainees(self) -> None:
-        path, _ = QFileDialog.getSaveFileName(self, "Export Trainees", "trainees_export.csv", "CSV Files (*.csv)")
-        if not path:
+        path = run_export(self, "trainees", "Export Trainees", "trainees_export")
+        if path:
+            self.main_window._show_status(f"Exported to {path}")
+
+    def _import_trainees(self) -> None:
+        result = run_import(self, "trainees", "Import Trainees")
+        if result:
+            self.main_window._show_status(f"Imported {result['imported']} trainees")
+            self.refresh()
+
+    def _archive_trainees(self) -> None:
+        months, ok = QInputDialog.getInt(
+            self, "Archive Trainees", "Archive trainees whose latest license was approved more than this many months ago:",
+            services.ARCHIVE_AFTER_MONTHS, 1, 600
+        )
+        if not ok:
             return
-            
-        data = services.get_trainee_export_data()
-        if not data:
-            QMessageBox.information(self, "Export", "No trainee data to export.")
+        confirm = QMessageBox.question(
+            self, "Archive Trainees",
+            f"Move these trainees and their exams, licenses and history to {db.archive_path().name}? "
+            "They will no longer appear in lists and reports."
+        )
+        if confirm != QMessageBox.Yes:
             return
-            
-        if services.export_to_csv(data, path):
-            self.main_window._show_status(f"Exported to {path}")
-        else:
-            QMessageBox.critical(self, "Export", "Failed to export data. Check logs.")
+        moved = services.archive_inactive_trainees(months)
+        if moved is None:
+            QMessageBox.critical(self, "Archive Trainees", "Archiving failed; nothing was moved. Check logs.")
+            return
+        self.main_window._show_status(f"Archived {moved['trainee']} trainees")
+        self.refresh()
 
 def setup_trainee_tab(main_window):
     tab = TraineeTab(main_window)
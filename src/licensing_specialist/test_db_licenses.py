@@ -0,0 +1,185 @@
+"""
+Unit tests for license queries in db.py.
+Tests the following:
+- Latest license per trainee (bulk and single)
+- Server-side filtered license listing
+- RVP -> recruiter -> trainee rolled-up counts
+- License status history and as-of counts
+"""
+
+import sys
+import os
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+import db
+
+
+def setup_test_data(db_path):
+    """
+    Create a test database with two trainees and a few licenses.
+    Returns: (trainee_id_1, trainee_id_2, trainee_id_3)
+    """
+    db.init_db(db_path)
+    t1 = db.add_trainee("Ada", "Lovelace", db_path=db_path)
+    t2 = db.add_trainee("Alan", "Turing", db_path=db_path)
+    t3 = db.add_trainee("Grace", "Hopper", db_path=db_path)
+
+    db.add_license(t1, "2025-01-10", None, None, "Pending", None, license_type="Life", db_path=db_path)
+    db.add_license(t1, "2025-03-02", "2025-04-01", "L-100", "Approved", None, license_type="Life", db_path=db_path)
+    db.add_license(t2, "2025-02-15", None, None, "Pending", None, license_type="Mutual Funds", db_path=db_path)
+    return t1, t2, t3
+
+
+def test_get_latest_licenses():
+    """
+    Test the bulk latest-license map.
+    """
+    with tempfile.NamedTemporaryFile(suffix='.db', delete=False) as tf:
+        db_path = tf.name
+
+    try:
+        t1, t2, t3 = setup_test_data(db_path)
+
+        latest = db.get_latest_licenses(db_path=db_path)
+        assert set(latest) == {t1, t2}
+        assert latest[t1]['license_number'] == "L-100"
+        assert latest[t1]['status'] == "Approved"
+        assert latest[t2]['license_type'] == "Mutual Funds"
+        assert latest[t2]['invoiced'] is False
+
+        subset = db.get_latest_licenses([t2, t3], db_path=db_path)
+        assert set(subset) == {t2}
+        assert db.get_latest_licenses([], db_path=db_path) == {}
+
+        info = db.get_license_info_for_trainee(t1, db_path)
+        assert info['application_submitted_date'] == "2025-03-02"
+        assert db.get_license_info_for_trainee(t3, db_path) is None
+        print("✓ test_get_latest_licenses: Latest license resolved per trainee")
+    finally:
+        Path(db_path).unlink(missing_ok=True)
+
+
+def test_query_licenses():
+    """
+    Test filtering and paging licenses in SQL.
+    """
+    with tempfile.NamedTemporaryFile(suffix='.db', delete=False) as tf:
+        db_path = tf.name
+
+    try:
+        t1, t2, t3 = setup_test_data(db_path)
+        db.update_trainee(t1, "Ada", "Lovelace", None, None, rvp_name="Vera Vice", rvp_rep_code="VV001", db_path=db_path)
+        db.update_trainee(t2, "Alan", "Turing", None, None, rvp_name="Vera Vice", db_path=db_path)
+
+        assert len(db.query_licenses(db_path=db_path)) == 3
+        assert len(db.query_licenses(rvp=("Vera Vice", "VV001"), db_path=db_path)) == 2
+        assert len(db.query_licenses(rvp=("Vera Vice", None), db_path=db_path)) == 1
+        assert len(db.query_licenses(license_type="Mutual Funds", db_path=db_path)) == 1
+        assert len(db.query_licenses(text="lovelace, a", db_path=db_path)) == 2
+        assert len(db.query_licenses(text="l-1", db_path=db_path)) == 1
+        assert len(db.query_licenses(text="%", db_path=db_path)) == 0
+        assert len(db.query_licenses(status="pending", db_path=db_path)) == 2
+
+        first_page = db.query_licenses(limit=2, db_path=db_path)
+        assert [r['application_submitted_date'] for r in first_page] == ["2025-03-02", "2025-02-15"]
+        last = first_page[-1]
+        rest = db.query_licenses(after=(last['application_submitted_date'], last['id']), db_path=db_path)
+        assert [r['application_submitted_date'] for r in rest] == ["2025-01-10"]
+        print("✓ test_query_licenses: Filters and paging applied in SQL")
+    finally:
+        Path(db_path).unlink(missing_ok=True)
+
+
+def test_rvp_hierarchy_stats():
+    """
+    Test the per-level counts behind the lazy RVP tree.
+    """
+    with tempfile.NamedTemporaryFile(suffix='.db', delete=False) as tf:
+        db_path = tf.name
+
+    try:
+        t1, t2, t3 = setup_test_data(db_path)
+        rid = db.add_recruiter("Rita Recruiter", db_path=db_path)
+        db.update_trainee(t1, "Ada", "Lovelace", None, rid, rvp_name="Vera Vice", rvp_rep_code="VV001", db_path=db_path)
+        db.update_trainee(t2, "Alan", "Turing", None, None, rvp_name="Vera Vice", rvp_rep_code="VV001", db_path=db_path)
+        db.update_trainee(t3, "Grace", "Hopper", None, rid, rvp_name="Vera Vice", rvp_rep_code="VV001", db_path=db_path)
+
+        rvps = db.get_rvp_stats(db_path)
+        assert len(rvps) == 1
+        assert (rvps[0]['trainee_count'], rvps[0]['total_licenses']) == (3, 3)
+        # A trainee without any license is not a pending license
+        assert (rvps[0]['issued_count'], rvps[0]['pending_count']) == (1, 2)
+
+        recruiters = db.get_rvp_recruiter_stats("Vera Vice", "VV001", db_path)
+        assert [(r['recruiter_name'], r['trainee_count'], r['total_licenses']) for r in recruiters] == [
+            ("Rita Recruiter", 2, 2), (None, 1, 1)
+        ]
+        assert db.get_rvp_recruiter_stats("Vera Vice", None, db_path) == []
+
+        trainees = db.get_rvp_trainee_stats("Vera Vice", "VV001", rid, db_path)
+        assert [(t['last_name'], t['total_licenses']) for t in trainees] == [("Hopper", 0), ("Lovelace", 2)]
+        unassigned = db.get_rvp_trainee_stats("Vera Vice", "VV001", None, db_path)
+        assert [t['id'] for t in unassigned] == [t2]
+
+        # The license list follows the selected recruiter or trainee node
+        vv = ("Vera Vice", "VV001")
+        assert {l['trainee_id'] for l in db.query_licenses(rvp=vv, recruiter_id=rid, db_path=db_path)} == {t1}
+        assert {l['trainee_id'] for l in db.query_licenses(rvp=vv, unassigned=True, db_path=db_path)} == {t2}
+        assert len(db.query_licenses(rvp=vv, trainee_id=t1, db_path=db_path)) == 2
+        assert db.query_licenses(rvp=vv, trainee_id=t3, db_path=db_path) == []
+        print("✓ test_rvp_hierarchy_stats: Counts roll up per RVP, recruiter and trainee")
+    finally:
+        Path(db_path).unlink(missing_ok=True)
+
+
+def test_license_status_history():
+    """
+    Test the status history trigger, its backfill and as-of counts.
+    """
+    with tempfile.NamedTemporaryFile(suffix='.db', delete=False) as tf:
+        db_path = tf.name
+
+    try:
+        t1, t2, t3 = setup_test_data(db_path)
+        # Rebuild history from scratch as an upgraded database would
+        with db.get_db_connection(db_path) as conn:
+            conn.execute("DROP TABLE license_status_history")
+            conn.commit()
+        db.init_db(db_path)
+
+        assert db.get_license_status_counts_as_of("2025-01-09", db_path) == {}
+        assert db.get_license_status_counts_as_of("2025-03-05", db_path) == {"Pending": 3}
+        assert db.get_license_status_counts_as_of("2025-04-01", db_path) == {"Approved": 1, "Pending": 2}
+
+        lic = db.query_licenses(license_type="Mutual Funds", db_path=db_path)[0]
+        db.update_license(lic['id'], t2, "2025-02-15", None, None, "Pending", None,
+                          license_type="Mutual Funds", db_path=db_path)
+        db.update_license(lic['id'], t2, "2025-02-15", "2025-05-01", "MF-1", "Approved", None,
+                          license_type="Mutual Funds", db_path=db_path)
+        with db.get_db_connection(db_path) as conn:
+            history = conn.execute(
+                "SELECT status FROM license_status_history WHERE license_id = ? ORDER BY changed_at, id", (lic['id'],)
+            ).fetchall()
+        assert [h['status'] for h in history] == ["Pending", "Approved"]
+        assert db.get_license_status_counts_as_of("2025-04-01", db_path) == {"Approved": 1, "Pending": 2}
+        assert db.get_license_status_counts_as_of("2999-01-01", db_path) == {"Approved": 2, "Pending": 1}
+
+        db.delete_license(lic['id'], db_path=db_path)
+        assert db.get_license_status_counts_as_of("2999-01-01", db_path) == {"Approved": 1, "Pending": 1}
+        print("✓ test_license_status_history: Status changes journaled and counted as of a date")
+    finally:
+        Path(db_path).unlink(missing_ok=True)
+
+
+if __name__ == '__main__':
+    print("\n=== Running License DB Tests ===\n")
+
+    test_get_latest_licenses()
+    test_query_licenses()
+    test_rvp_hierarchy_stats()
+    test_license_status_history()
+
+    print("\n✓ All license DB tests passed!\n")
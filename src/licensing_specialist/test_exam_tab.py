@@ -6,6 +6,7 @@ Tests the following:
 - Fetching exams by trainee
 - Practice exam status management
 - Provincial exam info retrieval
+- Provincial attempt numbering
 """
 
 import sys
@@ -281,6 +282,32 @@ def test_practice_exam_status_integration():
         Path(db_path).unlink(missing_ok=True)
 
 
+def test_provincial_attempts():
+    """
+    Test attempt numbers on a trainee's provincial exams.
+    """
+    with tempfile.NamedTemporaryFile(suffix='.db', delete=False) as tf:
+        db_path = tf.name
+    
+    try:
+        recruiter_id, trainee_id, class_id = setup_test_data(db_path)
+        db.add_exam(trainee_id, class_id, "2025-02-01", None, None, module="Life", passed=False, db_path=db_path)
+        db.add_exam(trainee_id, class_id, "2025-03-01", None, None, module="Life", passed=True, db_path=db_path)
+        db.add_exam(trainee_id, class_id, "2025-02-15", None, None, module="Ethics", passed=True, db_path=db_path)
+        db.add_exam(trainee_id, class_id, "2025-01-01", None, None, module="Life", is_practice=True, passed=True, db_path=db_path)
+        
+        attempts = db.list_provincial_attempts(trainee_id, db_path)
+        assert [(a['exam_date'], a['module'], a['attempt']) for a in attempts] == [
+            ("2025-03-01", "Life", 2),
+            ("2025-02-15", "Ethics", 1),
+            ("2025-02-01", "Life", 1),
+        ]
+        
+        print(f"✓ test_provincial_attempts: Attempts numbered per module")
+    finally:
+        Path(db_path).unlink(missing_ok=True)
+
+
 if __name__ == '__main__':
     print("\n=== Running Exam Tab Tests ===\n")
     
@@ -290,5 +317,6 @@ if __name__ == '__main__':
     test_exam_data_structure()
     test_exam_with_nullable_fields()
     test_practice_exam_status_integration()
+    test_provincial_attempts()
     
     print("\n✓ All exam tab tests passed!\n")
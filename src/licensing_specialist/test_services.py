@@ -0,0 +1,1259 @@
+"""
+Unit tests for services.py.
+Tests the following:
+- Trainee profile loader used by the details pane
+- Recruiter performance report and its cache
+- Module pass-rate trends with incremental bucket refresh
+- Activity journal feed and paging
+- Numeric score parsing and score statistics
+- Time-to-license funnel report
+- Dashboard stats from the analytics snapshot
+- Reporting cube slices and incremental refresh
+- License status dwell times
+- License deadline scan and worklist
+- Idempotent invoice runs
+- Provincial attempt analytics
+- Streaming dataset export with progress and cancellation
+- Export formats (JSON Lines, optional XLSX/Parquet)
+- Bulk CSV import with reject report
+- Provincial results reconciliation
+- Per-RVP invoice statements
+- Change timestamps and watermark delta exports
+- Change-log sync between two databases
+- Per-RVP extract databases
+- Online backup with compression, verification and cancellation
+- Archiving long-licensed trainees and reading them back
+- Sync of archived rows
+"""
+
+import sys
+import os
+import csv
+import gzip
+import json
+import lzma
+import shutil
+import tempfile
+import time
+import statistics
+from datetime import date, timedelta
+from pathlib import Path
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from licensing_specialist import backups, db, exporters, services
+
+
+def test_get_trainee_profile():
+    """
+    Test the single-connection trainee profile.
+    """
+    with tempfile.NamedTemporaryFile(suffix='.db', delete=False) as tf:
+        db_path = tf.name
+
+    try:
+        db.init_db(db_path)
+        rid = db.add_recruiter("Rita Recruiter", db_path=db_path)
+        tid = db.add_trainee("Test", "Trainee", "2025-01-01", rid, db_path=db_path)
+        cid = db.add_class("Spring Cohort", "2025-01-05", "2025-02-05", db_path=db_path)
+        db.link_trainee_to_class(tid, cid, db_path=db_path)
+        for mod in services.REQUIRED_PRACTICE_MODULES:
+            db.update_practice_exam_status(tid, mod, True, db_path)
+        db.add_exam(tid, cid, "2999-01-10", "72", None, module="Life", passed=True, db_path=db_path)
+        db.add_exam(tid, cid, "2999-01-03", "61", None, module="A&S", passed=False, db_path=db_path)
+        db.add_license(tid, "2999-02-01", None, None, "Pending", None, db_path=db_path)
+
+        profile = services.get_trainee_profile(tid, db_path)
+        assert profile['trainee']['first_name'] == "Test"
+        assert profile['recruiter_name'] == "Rita Recruiter"
+        assert profile['modules_complete'] is True
+        assert profile['first_provincial_date'] == "2999-01-03"
+        assert profile['seewhy'] is services.check_seewhy_guarantee(tid, "2999-01-03", db_path)
+        assert profile['seewhy'] is True
+        assert [c['name'] for c in profile['classes']] == ["Spring Cohort"]
+        assert [e['exam_date'] for e in profile['exams']] == ["2999-01-10", "2999-01-03"]
+        assert len(profile['licenses']) == 1
+
+        assert services.get_trainee_profile(tid + 100, db_path) is None
+        print("✓ test_get_trainee_profile: Profile matches individual lookups")
+    finally:
+        Path(db_path).unlink(missing_ok=True)
+
+
+def test_recruiter_performance_report():
+    """
+    Test per-recruiter pass rates are not inflated by the trainee/exam join.
+    """
+    with tempfile.NamedTemporaryFile(suffix='.db', delete=False) as tf:
+        db_path = tf.name
+
+    try:
+        db.init_db(db_path)
+        r1 = db.add_recruiter("Busy Recruiter", db_path=db_path)
+        r2 = db.add_recruiter("Idle Recruiter", db_path=db_path)
+        t1 = db.add_trainee("One", "Trainee", None, r1, db_path=db_path)
+        t2 = db.add_trainee("Two", "Trainee", None, r1, db_path=db_path)
+        recent = (date.today() - timedelta(days=5)).isoformat()
+        db.add_exam(t1, None, recent, None, None, module="Life", passed=True, db_path=db_path)
+        db.add_exam(t1, None, "2001-01-01", None, None, module="Life", passed=False, db_path=db_path)
+        db.add_exam(t1, None, recent, None, None, module="Life", is_practice=True, passed=True, db_path=db_path)
+        db.add_exam(t2, None, recent, None, None, module="A&S", passed=None, db_path=db_path)
+
+        report = {r['name']: r for r in services.get_recruiter_performance_report(db_path=db_path)}
+        busy = report["Busy Recruiter"]
+        assert busy['trainees'] == 2
+        assert busy['total_exams'] == 4
+        assert busy['provincial_passes'] == 1 and busy['provincial_graded'] == 2
+        assert busy['provincial_pass_rate'] == "50.0%"
+        assert busy['practice_pass_rate'] == "100.0%"
+        assert report["Idle Recruiter"]['pass_rate'] == "N/A"
+
+        windowed = {r['name']: r for r in services.get_recruiter_performance_report(30, db_path=db_path)}
+        assert windowed["Busy Recruiter"]['provincial_pass_rate'] == "100.0%"
+
+        # Cached until the database changes
+        db.add_exam(t2, None, recent, None, None, module="A&S", passed=False, db_path=db_path)
+        windowed = {r['name']: r for r in services.get_recruiter_performance_report(30, db_path=db_path)}
+        assert windowed["Busy Recruiter"]['provincial_pass_rate'] == "50.0%"
+
+        # A new day replaces the window's cache entry instead of adding another
+        entries = len(services._report_cache)
+        window_start = services._window_start
+        services._window_start = lambda days: window_start(days - 1) if days else None
+        try:
+            services.get_recruiter_performance_report(30, db_path=db_path)
+        finally:
+            services._window_start = window_start
+        assert len(services._report_cache) == entries
+        print("✓ test_recruiter_performance_report: Rates aggregated per trainee then recruiter")
+    finally:
+        Path(db_path).unlink(missing_ok=True)
+
+
+def test_module_pass_rate_trends():
+    """
+    Test monthly/weekly buckets and that back-dated edits refresh closed buckets.
+    """
+    with tempfile.NamedTemporaryFile(suffix='.db', delete=False) as tf:
+        db_path = tf.name
+
+    try:
+        db.init_db(db_path)
+        tid = db.add_trainee("Test", "Trainee", db_path=db_path)
+        db.add_exam(tid, None, "2025-01-06", None, None, module="Seg Funds", passed=True, db_path=db_path)
+        old_fail = db.add_exam(tid, None, "2025-01-12", None, None, module="Seg Funds", passed=False, db_path=db_path)
+        db.add_exam(tid, None, "2025-02-03", None, None, module="Seg Funds", passed=False, db_path=db_path)
+        db.add_exam(tid, None, "2025-02-04", None, None, module="Seg Funds", is_practice=True, passed=True, db_path=db_path)
+
+        monthly = services.get_module_pass_rate_trends("month", db_path)
+        prov = [(t['period_start'], t['pass_rate']) for t in monthly if not t['is_practice']]
+        assert prov == [("2025-01-01", "50.0%"), ("2025-02-01", "0.0%")]
+        assert [t['period_start'] for t in monthly if t['is_practice']] == ["2025-02-01"]
+
+        weekly = services.get_module_pass_rate_trends("week", db_path)
+        assert [t['period_start'] for t in weekly if not t['is_practice']] == ["2025-01-06", "2025-02-03"]
+
+        # Editing an exam in a closed bucket is picked up incrementally
+        db.update_exam(old_fail, tid, None, "2025-01-12", None, None, module="Seg Funds", passed=True, db_path=db_path)
+        monthly = services.get_module_pass_rate_trends("month", db_path)
+        prov = [(t['period_start'], t['pass_rate']) for t in monthly if not t['is_practice']]
+        assert prov == [("2025-01-01", "100.0%"), ("2025-02-01", "0.0%")]
+
+        # Consumed change rows are pruned down to the newest; a cache that missed pruned rows rebuilds
+        with db.get_db_connection(db_path) as conn:
+            latest = conn.execute("SELECT MAX(seq) FROM exam_date_change").fetchone()[0]
+        db.update_exam(old_fail, tid, None, "2025-02-10", None, None, module="Seg Funds", passed=True, db_path=db_path)
+        assert db.prune_exam_date_changes(latest + 2, db_path=db_path) == latest + 1
+        weekly = services.get_module_pass_rate_trends("week", db_path)
+        assert [(t['period_start'], t['total']) for t in weekly if not t['is_practice']] == [
+            ("2025-01-06", 1), ("2025-02-03", 1), ("2025-02-10", 1)]
+        services.get_module_pass_rate_trends("month", db_path)
+
+        # Once every cached period has consumed them, the trend refresh prunes rows itself
+        db.update_exam(old_fail, tid, None, "2025-01-12", None, None, module="Seg Funds", passed=True, db_path=db_path)
+        threshold, services.EXAM_CHANGE_PRUNE_ROWS = services.EXAM_CHANGE_PRUNE_ROWS, 1
+        try:
+            services.get_module_pass_rate_trends("week", db_path)
+            with db.get_db_connection(db_path) as conn:
+                assert conn.execute("SELECT COUNT(*) FROM exam_date_change").fetchone()[0] == 3  # month lags
+            services.get_module_pass_rate_trends("month", db_path)
+            with db.get_db_connection(db_path) as conn:
+                assert conn.execute("SELECT COUNT(*) FROM exam_date_change").fetchone()[0] == 1
+        finally:
+            services.EXAM_CHANGE_PRUNE_ROWS = threshold
+        print("✓ test_module_pass_rate_trends: Buckets split by practice and refreshed on change")
+    finally:
+        Path(db_path).unlink(missing_ok=True)
+
+
+def test_recent_activity_journal():
+    """
+    Test that writes are journaled and the feed pages back through history.
+    """
+    with tempfile.NamedTemporaryFile(suffix='.db', delete=False) as tf:
+        db_path = tf.name
+
+    try:
+        db.init_db(db_path)
+        tid = db.add_trainee("Test", "Trainee", db_path=db_path)
+        db.add_exam(tid, None, "2025-01-06", None, None, module="Life", passed=True, db_path=db_path)
+        lid = db.add_license(tid, "2025-02-01", None, None, "Pending", None, db_path=db_path)
+        db.update_license(lid, tid, "2025-02-01", "2025-03-01", "L-1", "Approved", None, db_path=db_path)
+
+        feed = services.get_recent_activity(limit=2, db_path=db_path)
+        assert [a['label'] for a in feed] == ["Trainee: Approved (updated)", "Trainee: Pending"]
+        assert feed[0]['type'] == "License"
+
+        older = services.get_recent_activity(limit=10, before=feed[-1]['cursor'], db_path=db_path)
+        assert [a['label'] for a in older] == ["Trainee (Life): Passed", "Test Trainee"]
+
+        # Upgrading a database without a journal seeds only dated history, never in the future
+        db.add_trainee("No", "Dates", db_path=db_path)
+        db.add_exam(tid, None, "2999-01-01", None, None, module="Ethics", db_path=db_path)
+        with db.get_db_connection(db_path) as conn:
+            for table in ("trainee", "exam", "license"):
+                for event in ("insert", "update", "delete"):
+                    conn.execute(f"DROP TRIGGER trg_activity_{table}_{event}")
+            conn.execute("DROP TABLE activity_event")
+            conn.commit()
+        db.init_db(db_path)
+        with db.get_db_connection(db_path) as conn:
+            seeded = conn.execute("SELECT ts, entity_type FROM activity_event ORDER BY ts").fetchall()
+            now = conn.execute("SELECT strftime('%Y-%m-%d %H:%M:%f', 'now')").fetchone()[0]
+        assert [(r['ts'][:10], r['entity_type']) for r in seeded[:3]] == [
+            ("2025-01-06", "Trainee"), ("2025-01-06", "Exam"), ("2025-02-01", "License")]
+        assert len(seeded) == 4 and seeded[-1]['ts'] <= now
+        print("✓ test_recent_activity_journal: Journal feed ordered by time and pageable")
+    finally:
+        Path(db_path).unlink(missing_ok=True)
+
+
+def test_score_statistics():
+    """
+    Test score parsing and SQL-computed percentiles against the statistics module.
+    """
+    with tempfile.NamedTemporaryFile(suffix='.db', delete=False) as tf:
+        db_path = tf.name
+
+    try:
+        assert db._parse_score("85") == 85.0
+        assert db._parse_score(" 72.5 % ") == 72.5
+        assert db._parse_score("42/50") == 84.0
+        assert db._parse_score("n/a") is None
+        assert db._parse_score("") is None
+        for bad in ("nan", "inf", "-Infinity", "1e400", "1e308/1e-308"):
+            assert db._parse_score(bad) is None, bad
+
+        db.init_db(db_path)
+        tid = db.add_trainee("Test", "Trainee", db_path=db_path)
+        life = [55, 61, 64, 70, 72, 78, 81, 90, 95, 99, 100]
+        for sc in life:
+            db.add_exam(tid, None, "2025-01-06", str(sc), None, module="Life", db_path=db_path)
+        db.add_exam(tid, None, "2025-01-06", "30/40", None, module="A&S", db_path=db_path)
+        db.add_exam(tid, None, "2025-01-06", "absent", None, module="A&S", db_path=db_path)
+        # Score values are backfilled only when the column is added, not re-parsed on every start
+        with db.get_db_connection(db_path) as conn:
+            conn.execute("UPDATE exam SET score_value = NULL WHERE score = '30/40'")
+            conn.commit()
+        db.init_db(db_path)
+        with db.get_db_connection(db_path) as conn:
+            assert conn.execute("SELECT score_value FROM exam WHERE score = '30/40'").fetchone()[0] is None
+            conn.execute("UPDATE exam SET score_value = 75.0 WHERE score = '30/40'")
+            conn.commit()
+
+        stats = {s['group']: s for s in services.get_score_statistics("module", db_path=db_path)}
+        deciles = statistics.quantiles(life, n=10, method='inclusive')
+        assert stats["Life"]['count'] == len(life)
+        assert stats["Life"]['mean'] == round(statistics.mean(life), 2)
+        assert stats["Life"]['median'] == statistics.median(life)
+        assert stats["Life"]['p10'] == round(deciles[0], 2)
+        assert stats["Life"]['p90'] == round(deciles[-1], 2)
+        assert sum(stats["Life"]['histogram']) == len(life)
+        assert stats["Life"]['histogram'][-1] == 4  # 90, 95, 99 and 100
+        assert stats["A&S"]['count'] == 1 and stats["A&S"]['median'] == 75.0
+        print("✓ test_score_statistics: Percentiles and histograms match reference")
+    finally:
+        Path(db_path).unlink(missing_ok=True)
+
+
+def test_funnel_report():
+    """
+    Test milestone durations from IBA date per recruiter.
+    """
+    with tempfile.NamedTemporaryFile(suffix='.db', delete=False) as tf:
+        db_path = tf.name
+
+    try:
+        db.init_db(db_path)
+        rid = db.add_recruiter("Rita Recruiter", db_path=db_path)
+        t1 = db.add_trainee("Fast", "Trainee", "2025-01-01", rid, db_path=db_path)
+        t2 = db.add_trainee("Slow", "Trainee", "2025-01-01", rid, db_path=db_path)
+        db.add_trainee("No", "Recruiter", "2025-01-01", None, db_path=db_path)
+        with db.get_db_connection(db_path) as conn:
+            conn.executemany(
+                "INSERT INTO practice_exam_status (trainee_id, module, completed, completed_date) VALUES (?, ?, 1, ?)",
+                [(t1, mod, "2025-01-11 09:30:00") for mod in services.REQUIRED_PRACTICE_MODULES]
+            )
+            conn.commit()
+        db.add_exam(t1, None, "2025-01-21", None, None, module="Life", passed=False, db_path=db_path)
+        db.add_exam(t1, None, "2025-01-31", None, None, module="Life", passed=True, db_path=db_path)
+        db.add_exam(t2, None, "2025-03-02", None, None, module="Life", passed=False, db_path=db_path)
+        db.add_license(t1, "2025-02-01", "2025-03-02", "L-1", "Approved", None, db_path=db_path)
+
+        report = {r['group']: r for r in services.get_funnel_report("recruiter", db_path)}
+        assert report["All trainees"]['trainees'] == 3
+        rita = report["Rita Recruiter"]
+        assert rita['trainees'] == 2
+        assert rita['stages']['practice_complete'] == {'reached': 1, 'mean_days': 10.0, 'median_days': 10.0}
+        assert rita['stages']['first_provincial']['median_days'] == 40.0  # (20 + 60) / 2
+        assert rita['stages']['first_pass']['mean_days'] == 30.0
+        assert rita['stages']['licensed']['reached'] == 1
+        assert report["Unassigned"]['stages']['licensed']['reached'] == 0
+
+        # Exams from before is_practice existed (NULL) are provincial; edits and deletes move the milestones
+        slow_exam = db.add_exam(t2, None, "2025-01-11", None, None, module="Ethics", passed=True, db_path=db_path)
+        with db.get_db_connection(db_path) as conn:
+            conn.execute("UPDATE exam SET is_practice = NULL WHERE id = ?", (slow_exam,))
+            conn.commit()
+        db.delete_trainee(t1, db_path=db_path)
+        rita = {r['group']: r for r in services.get_funnel_report("recruiter", db_path)}["Rita Recruiter"]
+        assert rita['stages']['first_provincial'] == {'reached': 1, 'mean_days': 10.0, 'median_days': 10.0}
+        assert (rita['stages']['first_pass']['reached'], rita['stages']['licensed']['reached']) == (1, 0)
+        with db.get_db_connection(db_path) as conn:
+            assert conn.execute("SELECT COUNT(*) FROM trainee_milestone WHERE trainee_id = ?", (t1,)).fetchone()[0] == 0
+
+        # A shorter required-module list recomputes practice completion for everyone
+        db.update_practice_exam_status(t2, "Life", True, db_path=db_path)
+        assert db.set_milestone_modules(["Life"], db_path) and not db.set_milestone_modules(["Life"], db_path)
+        with db.get_db_connection(db_path) as conn:
+            assert conn.execute("SELECT practice_done FROM trainee_milestone WHERE trainee_id = ?", (t2,)).fetchone()[0]
+        print("✓ test_funnel_report: Stage durations aggregated per group")
+    finally:
+        Path(db_path).unlink(missing_ok=True)
+
+
+def test_dashboard_stats_snapshot():
+    """
+    Test dashboard counts from the columnar snapshot and its invalidation.
+    """
+    with tempfile.NamedTemporaryFile(suffix='.db', delete=False) as tf:
+        db_path = tf.name
+
+    try:
+        db.init_db(db_path)
+        t1 = db.add_trainee("Ready", "Trainee", db_path=db_path)
+        t2 = db.add_trainee("Partial", "Trainee", db_path=db_path)
+        for mod in services.REQUIRED_PRACTICE_MODULES:
+            db.update_practice_exam_status(t1, mod, True, db_path)
+        db.update_practice_exam_status(t2, "Life", True, db_path)
+        recent = (date.today() - timedelta(days=3)).isoformat()
+        db.add_exam(t1, None, recent, None, None, module="Life", passed=True, db_path=db_path)
+        db.add_exam(t1, None, "2001-01-01", None, None, module="Life", passed=True, db_path=db_path)
+        db.add_exam(t2, None, recent, None, None, module="Ethics", passed=False, db_path=db_path)
+        db.add_license(t1, "2025-01-01", None, None, "Pending", None, db_path=db_path)
+        db.add_license(t2, "2025-01-01", "2025-02-01", None, "Approved", None, db_path=db_path)
+        db.add_license(t2, "2025-01-01", None, None, None, None, db_path=db_path)
+        db.add_class("Current", "2025-01-01", "2999-01-01", db_path=db_path)
+
+        stats = services.get_dashboard_stats(db_path)
+        assert stats == {
+            "total_trainees": 2,
+            "total_exams": 3,
+            "recent_passes": 1,
+            "pending_licenses": 1,
+            "active_classes": 1,
+            "ready_for_provincial": 1,
+        }
+        modules = {m['module']: m for m in services.get_exam_module_stats(db_path)}
+        assert modules["Life"]['pass_rate'] == "100.0%"
+        assert modules["Ethics"]['pass_rate'] == "0.0%"
+        assert modules["A&S"]['pass_rate'] == "N/A"
+
+        # A commit invalidates the snapshot
+        db.add_trainee("New", "Trainee", db_path=db_path)
+        assert services.get_dashboard_stats(db_path)["total_trainees"] == 3
+        print("✓ test_dashboard_stats_snapshot: Snapshot counts match and refresh")
+    finally:
+        Path(db_path).unlink(missing_ok=True)
+
+
+def test_report_cube():
+    """
+    Test slicing the reporting cube and its current-month refresh.
+    """
+    with tempfile.NamedTemporaryFile(suffix='.db', delete=False) as tf:
+        db_path = tf.name
+
+    try:
+        db.init_db(db_path)
+        rid = db.add_recruiter("Rita Recruiter", db_path=db_path)
+        t1 = db.add_trainee("Ada", "Lovelace", None, rid, rvp_name="Vera Vice", db_path=db_path)
+        t2 = db.add_trainee("Alan", "Turing", db_path=db_path)
+        today = date.today().isoformat()
+        this_month = today[:7]
+        db.add_license(t1, "2025-01-10", "2025-02-03", "L-1", "Approved", None, invoiced=True, db_path=db_path)
+        db.add_license(t2, today, None, None, "Pending", None, db_path=db_path)
+        db.add_exam(t1, None, "2025-01-20", None, None, module="Life", passed=True, db_path=db_path)
+        db.add_exam(t1, None, today, None, None, module="Life", passed=False, db_path=db_path)
+        db.add_exam(t2, None, today, None, None, module="Ethics", is_practice=True, passed=True, db_path=db_path)
+
+        totals = services.get_report_cube([], db_path=db_path)[0]
+        assert (totals['licenses_issued'], totals['licenses_pending'], totals['licenses_invoiced']) == (1, 1, 1)
+        assert (totals['exams_taken'], totals['exams_passed']) == (3, 2)
+
+        by_month = {r['month']: r for r in services.get_report_cube(db_path=db_path)}
+        assert by_month["2025-02"]['licenses_issued'] == 1
+        assert by_month["2025-01"]['exams_passed'] == 1
+        assert by_month[this_month]['exams_taken'] == 2
+
+        by_recruiter = services.get_report_cube(["recruiter_id"], {"module": "Life"}, db_path=db_path)
+        assert [(r['recruiter_name'], r['exams_taken']) for r in by_recruiter] == [("Rita Recruiter", 2)]
+        rvp_slice = services.get_report_cube(["rvp_name"], {"rvp_name": None}, db_path=db_path)
+        assert rvp_slice[0]['licenses_pending'] == 1
+        assert services.get_report_cube(["module"], month_from="2025-01", month_to="2025-01", db_path=db_path) == [
+            {"module": "Life", "licenses_issued": 0, "licenses_pending": 0, "licenses_invoiced": 0,
+             "exams_taken": 1, "exams_passed": 1}
+        ]
+
+        # New activity in the open month is rolled up on the next read
+        db.add_exam(t2, None, today, None, None, module="Life", passed=True, db_path=db_path)
+        assert services.get_report_cube([], db_path=db_path)[0]['exams_passed'] == 3
+
+        # Writes to closed months re-roll those months too
+        db.add_exam(t2, None, "2025-01-25", None, None, module="Life", passed=True, db_path=db_path)
+        assert services.get_report_cube([], {"month": "2025-01"}, db_path=db_path)[0]['exams_taken'] == 2
+
+        # A license submitted last month and approved this month leaves its old month
+        last_month = (date.today().replace(day=1) - timedelta(days=1)).isoformat()
+        t3 = db.add_trainee("Grace", "Hopper", db_path=db_path)
+        lid = db.add_license(t3, last_month, None, None, "Pending", None, db_path=db_path)
+        assert services.get_report_cube([], {"month": last_month[:7]}, db_path=db_path)[0]['licenses_pending'] == 1
+        db.update_license(lid, t3, last_month, today, "L-3", "Approved", None, db_path=db_path)
+        db.update_license_invoice_status(lid, True, db_path=db_path)
+        totals = services.get_report_cube([], db_path=db_path)[0]
+        assert (totals['licenses_issued'], totals['licenses_pending'], totals['licenses_invoiced']) == (2, 1, 2)
+        assert not services.get_report_cube([], {"month": last_month[:7]}, db_path=db_path)[0]['licenses_pending']
+
+        # Undated facts are kept in their own bucket and left out of month ranges
+        db.add_license(t3, None, None, None, "Pending", None, db_path=db_path)
+        by_month = {r['month']: r for r in services.get_report_cube(db_path=db_path)}
+        assert by_month[db.CUBE_UNDATED]['licenses_pending'] == 1
+        assert services.get_report_cube([], db_path=db_path)[0]['licenses_pending'] == 2
+        assert services.get_report_cube([], month_to=this_month, db_path=db_path)[0]['licenses_pending'] == 1
+
+        # Incremental refreshes agree with a full rebuild
+        incremental = services.get_report_cube(db_path=db_path)
+        assert db.refresh_report_cube(full=True, db_path=db_path) == ""
+        assert services.get_report_cube(db_path=db_path) == incremental
+
+        try:
+            services.get_report_cube(["first_name"], db_path=db_path)
+            assert False, "unknown dimension should raise"
+        except ValueError:
+            pass
+        print("✓ test_report_cube: Cube slices match and touched months refresh")
+    finally:
+        Path(db_path).unlink(missing_ok=True)
+
+
+def test_license_status_dwell_stats():
+    """
+    Test days-in-status statistics from the license status history.
+    """
+    with tempfile.NamedTemporaryFile(suffix='.db', delete=False) as tf:
+        db_path = tf.name
+
+    try:
+        db.init_db(db_path)
+        tid = db.add_trainee("Ada", "Lovelace", db_path=db_path)
+        pending_days = [10, 20, 30, 40]
+        for days in pending_days:
+            lid = db.add_license(tid, "2025-01-01", None, None, "Pending", None, db_path=db_path)
+            db.update_license(lid, tid, "2025-01-01", None, None, "Approved", None, db_path=db_path)
+            approved_on = (date(2025, 1, 1) + timedelta(days=days)).isoformat()
+            with db.get_db_connection(db_path) as conn:
+                conn.execute(
+                    "UPDATE license_status_history SET changed_at = ? WHERE license_id = ? AND status = 'Approved'",
+                    (approved_on, lid)
+                )
+                conn.commit()
+
+        stats = {s['status']: s for s in services.get_license_status_dwell_stats(db_path=db_path)}
+        assert set(stats) == {"Pending"}
+        pending = stats["Pending"]
+        assert pending['count'] == 4
+        assert pending['mean_days'] == 25.0
+        assert pending['median_days'] == 25.0
+        assert pending['p90_days'] == 37.0
+        assert pending['max_days'] == 40.0
+
+        with_open = {s['status']: s for s in services.get_license_status_dwell_stats(include_open=True, db_path=db_path)}
+        assert with_open["Approved"]['count'] == 4
+        assert with_open["Approved"]['max_days'] > 0
+        print("✓ test_license_status_dwell_stats: Dwell times per status computed in SQL")
+    finally:
+        Path(db_path).unlink(missing_ok=True)
+
+
+def test_license_deadline_scan():
+    """
+    Test stale pending and expiry counts plus the ranked worklist.
+    """
+    with tempfile.NamedTemporaryFile(suffix='.db', delete=False) as tf:
+        db_path = tf.name
+
+    try:
+        db.init_db(db_path)
+        tid = db.add_trainee("Ada", "Lovelace", db_path=db_path)
+        today = date.today()
+        ago = lambda days: (today - timedelta(days=days)).isoformat()
+        ahead = lambda days: (today + timedelta(days=days)).isoformat()
+        stale = db.add_license(tid, ago(90), None, None, "Pending", None, db_path=db_path)
+        db.add_license(tid, ago(10), None, None, "Pending", None, db_path=db_path)
+        db.add_license(tid, ago(400), ago(300), "L-1", "Approved", None, db_path=db_path)
+        expired = db.add_license(tid, ago(500), ago(400), "L-2", "Approved", None, expiry_date=ago(5), db_path=db_path)
+        expiring = db.add_license(tid, ago(500), ago(400), "L-3", "Approved", None, expiry_date=ahead(30), db_path=db_path)
+        db.add_license(tid, ago(500), ago(400), "L-4", "Approved", None, expiry_date=ahead(31), db_path=db_path)
+
+        scan = services.scan_license_deadlines(pending_days=60, expiry_days=30, db_path=db_path)
+        assert scan["counts"] == {"stale_pending": 1, "expiring": 1, "expired": 1}
+        assert [w['license_id'] for w in scan["worklist"]] == [stale, expired, expiring]
+        assert [w['days_left'] for w in scan["worklist"]] == [-30, -5, 30]
+        assert scan["worklist"][0]['kind'] == "stale_pending"
+
+        # Approving the application takes it off the list
+        db.update_license(stale, tid, ago(90), ago(1), "L-5", "Approved", None, db_path=db_path)
+        scan = services.scan_license_deadlines(pending_days=60, expiry_days=30, limit=1, db_path=db_path)
+        assert scan["counts"]["stale_pending"] == 0
+        assert [w['license_id'] for w in scan["worklist"]] == [expired]
+        print("✓ test_license_deadline_scan: Deadlines counted and ranked by due date")
+    finally:
+        Path(db_path).unlink(missing_ok=True)
+
+
+def test_invoice_runs():
+    """
+    Test batched, idempotent invoice runs per RVP and for all RVPs.
+    """
+    with tempfile.NamedTemporaryFile(suffix='.db', delete=False) as tf:
+        db_path = tf.name
+
+    try:
+        db.init_db(db_path)
+        t1 = db.add_trainee("Ada", "Lovelace", rvp_name="Vera Vice", rvp_rep_code="VV001", db_path=db_path)
+        t2 = db.add_trainee("Alan", "Turing", rvp_name="Victor Vice", db_path=db_path)
+        t3 = db.add_trainee("Grace", "Hopper", db_path=db_path)
+        db.add_license(t1, "2025-01-10", None, None, "Pending", None, license_type="Life", db_path=db_path)
+        db.add_license(t1, "2025-02-10", None, None, "Pending", None, license_type="Mutual Funds", db_path=db_path)
+        db.add_license(t1, "2025-03-10", None, None, "Pending", None, license_type="Life", invoiced=True, db_path=db_path)
+        db.add_license(t2, "2025-01-20", None, None, "Pending", None, license_type="Life", db_path=db_path)
+        db.add_license(t2, "2025-04-20", None, None, "Pending", None, license_type="Life", db_path=db_path)
+        db.add_license(t3, "2025-01-05", None, None, "Pending", None, license_type="Life", db_path=db_path)
+        assert db.get_invoice_rates(db_path) == {"*": 50.0}
+        db.set_invoice_rate("Mutual Funds", 75, db_path=db_path)
+
+        run = services.run_invoices(rvp=("Vera Vice", "VV001"), db_path=db_path)
+        assert len(run['batches']) == 1
+        assert (run['line_count'], run['total_amount']) == (2, 125.0)
+        # Re-running bills nothing twice
+        assert services.run_invoices(rvp=("Vera Vice", "VV001"), db_path=db_path)['batches'] == []
+
+        run = services.run_invoices(submitted_through="2025-03-31", db_path=db_path)
+        assert [(b['rvp_name'], b['line_count'], b['total_amount']) for b in run['batches']] == [("Victor Vice", 1, 50.0)]
+        run = services.run_invoices(db_path=db_path)
+        assert run['line_count'] == 1
+        assert services.run_invoices(db_path=db_path)['line_count'] == 0
+
+        invoiced = {l['trainee_id']: 0 for l in db.list_licenses(db_path)}
+        for l in db.list_licenses(db_path):
+            invoiced[l['trainee_id']] += l['invoiced']
+        assert invoiced == {t1: 3, t2: 2, t3: 0}
+        assert [b['run_id'] for b in db.list_invoice_batches(db_path=db_path)] == [3, 2, 1]
+        assert len(db.list_invoice_batches(("Victor Vice", None), db_path=db_path)) == 2
+        print("✓ test_invoice_runs: Invoice runs batch per RVP and never bill twice")
+    finally:
+        Path(db_path).unlink(missing_ok=True)
+
+
+def test_attempt_analytics():
+    """
+    Test attempts-to-pass and first-attempt pass rates per module, class and recruiter.
+    """
+    with tempfile.NamedTemporaryFile(suffix='.db', delete=False) as tf:
+        db_path = tf.name
+
+    try:
+        db.init_db(db_path)
+        rid = db.add_recruiter("Rita Recruiter", db_path=db_path)
+        cid = db.add_class("Spring Cohort", db_path=db_path)
+        t1 = db.add_trainee("Ada", "Lovelace", None, rid, db_path=db_path)
+        t2 = db.add_trainee("Alan", "Turing", db_path=db_path)
+        db.link_trainee_to_class(t1, cid, db_path=db_path)
+        # Ada: Life on the 1st try, Ethics on the 3rd; Alan: Life failed once, not yet passed
+        db.add_exam(t1, cid, "2025-01-10", None, None, module="Life", passed=True, db_path=db_path)
+        for day, passed in (("2025-01-11", False), ("2025-01-20", False), ("2025-02-01", True)):
+            db.add_exam(t1, cid, day, None, None, module="Ethics", passed=passed, db_path=db_path)
+        db.add_exam(t2, None, "2025-01-15", None, None, module="Life", passed=False, db_path=db_path)
+        db.add_exam(t2, None, "2025-01-01", None, None, module="Life", is_practice=True, passed=True, db_path=db_path)
+
+        report = services.get_attempt_analytics(db_path)
+        modules = {m['group']: m for m in report['module']}
+        assert modules["Life"]['trainees'] == 2
+        assert modules["Life"]['first_attempt_pass_rate'] == "50.0%"
+        assert modules["Life"]['attempts_to_pass'] == {"1": 1, "2": 0, "3": 0, "4+": 0}
+        assert modules["Life"]['not_passed'] == 1
+        assert modules["Ethics"]['attempts_to_pass']["3"] == 1
+        assert modules["Ethics"]['retake_rate'] == "100.0%"
+        assert modules["Ethics"]['avg_attempts_to_pass'] == 3.0
+
+        classes = {c['group']: c for c in report['class']}
+        assert classes["Spring Cohort"]['attempts'] == 4
+        assert classes["Unassigned"]['trainees'] == 1
+        recruiters = {r['group']: r for r in report['recruiter']}
+        assert recruiters["Rita Recruiter"]['first_attempt_pass_rate'] == "50.0%"
+        assert recruiters["Unassigned"]['first_attempt_pass_rate'] == "0.0%"
+
+        # Cached until the next commit
+        assert services.get_attempt_analytics(db_path) is report
+        db.add_exam(t2, None, "2025-02-15", None, None, module="Life", passed=True, db_path=db_path)
+        modules = {m['group']: m for m in services.get_attempt_analytics(db_path)['module']}
+        assert modules["Life"]['attempts_to_pass']["2"] == 1
+        print("✓ test_attempt_analytics: Attempt distributions computed per group")
+    finally:
+        Path(db_path).unlink(missing_ok=True)
+
+
+def test_export_dataset():
+    """
+    Test chunked CSV export, progress reporting and cancellation.
+    """
+    with tempfile.NamedTemporaryFile(suffix='.db', delete=False) as tf:
+        db_path = tf.name
+    out_path = Path(db_path).with_suffix('.csv')
+
+    try:
+        db.init_db(db_path)
+        tid = db.add_trainee("Ada", "Lovelace", db_path=db_path)
+        for month in range(1, 6):
+            db.add_license(tid, f"2025-0{month}-01", None, f"L-{month}", "Pending", None, db_path=db_path)
+
+        calls = []
+        written = services.export_dataset("licenses", str(out_path), progress=lambda d, t: calls.append((d, t)),
+                                          chunk_size=2, db_path=db_path)
+        assert written == 5
+        assert calls == [(2, 5), (4, 5), (5, 5)]
+        with open(out_path, newline='', encoding='utf-8') as f:
+            rows = list(csv.reader(f))
+        assert rows[0] == db.export_columns("licenses")
+        assert [r[rows[0].index('license_number')] for r in rows[1:]] == ["L-5", "L-4", "L-3", "L-2", "L-1"]
+        assert rows[1][rows[0].index('last_name')] == "Lovelace"
+
+        # Cancelling keeps the previous file and leaves no partial output behind
+        out_path.write_text("previous", encoding='utf-8')
+        calls.clear()
+        assert services.export_dataset("licenses", str(out_path), progress=lambda d, t: calls.append(d),
+                                       cancelled=lambda: len(calls) >= 1, chunk_size=2, db_path=db_path) is None
+        assert calls == [2]
+        assert out_path.read_text(encoding='utf-8') == "previous"
+        assert not Path(f"{out_path}.part").exists()
+        print("✓ test_export_dataset: Export streamed in chunks and cancellable")
+    finally:
+        Path(db_path).unlink(missing_ok=True)
+        out_path.unlink(missing_ok=True)
+
+
+def test_export_formats():
+    """
+    Test JSON Lines export and format selection for optional writers.
+    """
+    with tempfile.NamedTemporaryFile(suffix='.db', delete=False) as tf:
+        db_path = tf.name
+    out_path = Path(db_path).with_suffix('.jsonl')
+
+    try:
+        db.init_db(db_path)
+        tid = db.add_trainee("Ada", "Lovelace", db_path=db_path)
+        db.add_license(tid, "2025-01-01", None, "L-1", "Pending", None, db_path=db_path)
+        db.add_license(tid, "2025-02-01", None, "L-2", "Pending", None, db_path=db_path)
+
+        # Format inferred from the extension
+        assert services.export_dataset("licenses", str(out_path), chunk_size=1, db_path=db_path) == 2
+        with open(out_path, encoding='utf-8') as f:
+            records = [json.loads(line) for line in f]
+        assert [r['license_number'] for r in records] == ["L-2", "L-1"]
+        assert list(records[0]) == db.export_columns("licenses")
+        assert records[0]['last_name'] == "Lovelace"
+
+        assert exporters.format_for_path("out.XLSX") == "xlsx"
+        assert exporters.format_for_path("out.txt") == "csv"
+        available = exporters.available_formats()
+        assert {"csv", "jsonl"} <= set(available)
+        for name, writer in exporters.EXPORT_FORMATS.items():
+            if name not in available:
+                # Missing optional dependency: export fails cleanly instead of raising
+                assert services.export_dataset("licenses", str(out_path), fmt=name, db_path=db_path) is None
+        print("✓ test_export_formats: JSON Lines written and optional formats gated")
+    finally:
+        Path(db_path).unlink(missing_ok=True)
+        out_path.unlink(missing_ok=True)
+
+
+def test_import_dataset():
+    """
+    Test bulk CSV import with lookup resolution and a reject report.
+    """
+    with tempfile.NamedTemporaryFile(suffix='.db', delete=False) as tf:
+        db_path = tf.name
+    work = Path(tempfile.mkdtemp())
+
+    try:
+        db.init_db(db_path)
+        rid = db.add_recruiter("Rita Recruiter", rep_code="RR001", db_path=db_path)
+        db.add_trainee("Old", "Hand", rep_code="OH001", rvp_name="Vera Vice", rvp_rep_code="VV001", db_path=db_path)
+
+        trainees = work / "trainees.csv"
+        trainees.write_text(
+            "First Name,Last Name,DOB,Recruiter,Rep Code,RVP Name,RVP Rep Code\n"
+            "Ada,Lovelace,2025-01-02,rita recruiter,AL001,Vera Vice,\n"
+            "Alan,Turing,,,AT001,,vv001\n"
+            ",Nameless,,,,,\n"
+            "Grace,Hopper,not-a-date,,,,\n"
+            "Dup,Code,,,AL001,,\n"
+            "Bad,Rep,,,TOOLONG,,\n"
+            "Who,Knows,,Nobody,,,\n"
+            ",,,,,,\n",
+            encoding='utf-8')
+        result = services.import_dataset("trainees", str(trainees), chunk_size=3, db_path=db_path)
+        assert (result['imported'], result['rejected'], result['cancelled']) == (2, 5, False)
+        with open(result['reject_file'], newline='', encoding='utf-8') as f:
+            rejects = list(csv.reader(f))
+        assert rejects[0][:3] == ["row", "error", "First Name"]
+        assert [r[0] for r in rejects[1:]] == ["4", "5", "6", "7", "8"]
+        assert "already exists" in rejects[3][1] and "unknown recruiter" in rejects[5][1]
+
+        with db.get_db_connection(db_path) as conn:
+            rows = {r['rep_code']: r for r in conn.execute("SELECT * FROM trainee")}
+        assert rows['AL001']['recruiter_id'] == rid and rows['AL001']['rvp_rep_code'] == "VV001"
+        assert rows['AT001']['rvp_name'] == "Vera Vice" and rows['AL001']['dob'] == "2025-01-02"
+
+        licenses = work / "licenses.csv"
+        licenses.write_text(
+            "trainee_rep_code,first_name,last_name,license_type,status,application_submitted_date,license_number\n"
+            "AL001,,,Life,Pending,2025-02-01,L-1\n"
+            ",Alan,Turing,Life,,2025-02-03,\n"
+            ",Alan,Nobody,Life,,2025-02-03,\n"
+            "AT001,,,Life,Approved,2025-02-04,l-1\n",
+            encoding='utf-8')
+        result = services.import_dataset("licenses", str(licenses), db_path=db_path)
+        assert (result['imported'], result['rejected']) == (2, 2)
+        imported = db.query_licenses(db_path=db_path)
+        assert sorted(r['status'] for r in imported) == ["Pending", "Pending"]
+
+        exams = work / "exams.csv"
+        exams.write_text("trainee_rep_code,module,exam_date,score,passed,is_practice\nAL001,Life,2025-03-01,42/50,yes,no\n",
+                         encoding='utf-8')
+        assert services.import_dataset("exams", str(exams), db_path=db_path)['imported'] == 1
+        exam = db.list_exams(db_path)[0]
+        assert (exam['passed'], exam['is_practice'], exam['score_value']) == (1, 0, 84.0)
+
+        # A file without the required columns fails as a whole
+        bad = work / "bad.csv"
+        bad.write_text("email\nx@example.com\n", encoding='utf-8')
+        assert services.import_dataset("recruiters", str(bad), db_path=db_path) is None
+        print("✓ test_import_dataset: Rows validated, resolved, batch-inserted and rejects reported")
+    finally:
+        Path(db_path).unlink(missing_ok=True)
+        for p in work.iterdir():
+            p.unlink()
+        work.rmdir()
+
+
+def test_reconcile_results():
+    """
+    Test matching a provincial results file and applying it in one go.
+    """
+    with tempfile.NamedTemporaryFile(suffix='.db', delete=False) as tf:
+        db_path = tf.name
+    work = Path(tempfile.mkdtemp())
+
+    try:
+        db.init_db(db_path)
+        ada = db.add_trainee("Ada", "Lovelace", rep_code="AL001", db_path=db_path)
+        zoe = db.add_trainee("Zoë", "O'Neil", db_path=db_path)
+        db.add_trainee("Sam", "Smith", db_path=db_path)
+        db.add_trainee("Sam", "Smith", db_path=db_path)
+        ada_exam = db.add_exam(ada, None, "2025-03-01", None, None, module="Life", db_path=db_path)
+        zoe_exam = db.add_exam(zoe, None, "2025-03-02", None, None, module="Life", db_path=db_path)
+        ada_lic = db.add_license(ada, "2025-02-01", None, None, "Pending", None, license_type="Life", db_path=db_path)
+        zoe_lic = db.add_license(zoe, "2025-02-01", None, "ZL-1", "Pending", None, license_type="Life", db_path=db_path)
+
+        results = work / "results.csv"
+        results.write_text(
+            "Rep Code,Name,Module,Result,Score,Status,Approval Date,License Number\n"
+            "al001,,Life,Pass,88,Approved,2025-04-01,AL-9\n"
+            ",\"oneil, zoe\",Life,fail,41,,,\n"
+            ",,,,,Approved,2025-04-02,ZL-1\n"
+            ",Sam Smith,Life,pass,,,,\n"
+            ",Nobody Here,Life,pass,,,,\n"
+            "AL001,,Life,pass,,,,\n"
+            ",Ada Lovelace,Life,maybe,,,,\n",
+            encoding='utf-8')
+
+        preview = services.reconcile_results(str(results), dry_run=True, db_path=db_path)
+        assert (preview['matched'], preview['exams_updated'], preview['licenses_updated']) == (3, 2, 2)
+        assert db.get_exam(ada_exam, db_path)['passed'] is None
+
+        result = services.reconcile_results(str(results), db_path=db_path)
+        assert (result['rows'], result['matched'], result['unmatched'], result['ambiguous'], result['invalid']) == (7, 3, 1, 2, 1)
+        assert (db.get_exam(ada_exam, db_path)['passed'], db.get_exam(ada_exam, db_path)['score_value']) == (1, 88.0)
+        assert db.get_exam(zoe_exam, db_path)['passed'] == 0
+        lic = db.get_license(ada_lic, db_path)
+        assert (lic['status'], lic['approval_date'], lic['license_number']) == ("Approved", "2025-04-01", "AL-9")
+        assert db.get_license(zoe_lic, db_path)['approval_date'] == "2025-04-02"
+
+        with open(result['report_file'], newline='', encoding='utf-8') as f:
+            report = list(csv.reader(f))
+        assert report[0][:4] == ["row", "outcome", "reason", "Rep Code"]
+        assert [(r[0], r[1]) for r in report[1:]] == [
+            ("5", "ambiguous"), ("6", "unmatched"), ("7", "ambiguous"), ("8", "invalid")
+        ]
+        assert "row 2" in report[3][2]
+        print("✓ test_reconcile_results: Results matched by rep code, license number and name")
+    finally:
+        Path(db_path).unlink(missing_ok=True)
+        for p in work.iterdir():
+            p.unlink()
+        work.rmdir()
+
+
+def test_generate_rvp_statements():
+    """
+    Test per-RVP statement files, rendered in worker processes.
+    """
+    with tempfile.NamedTemporaryFile(suffix='.db', delete=False) as tf:
+        db_path = tf.name
+    out_dir = Path(tempfile.mkdtemp())
+
+    try:
+        db.init_db(db_path)
+        ada = db.add_trainee("Ada", "Lovelace", rvp_name="Vera Vice", rvp_rep_code="VV001", db_path=db_path)
+        alan = db.add_trainee("Alan", "Turing", rvp_name="Otto <Other>", db_path=db_path)
+        db.add_license(ada, "2025-01-10", None, "L-1", "Pending", None, license_type="Life", db_path=db_path)
+        db.add_license(alan, "2025-01-12", None, None, "Pending", None, license_type="Life", db_path=db_path)
+        assert services.run_invoices(rvp=("Vera Vice", "VV001"), db_path=db_path)['line_count'] == 1
+        db.add_license(ada, "2025-02-01", None, None, "Pending", None, license_type="Mutual Funds", db_path=db_path)
+
+        month = date.today().strftime("%Y-%m")
+        results = services.generate_rvp_statements(str(out_dir), workers=2, db_path=db_path)
+        by_rvp = {r['rvp_name']: r for r in results}
+        assert set(by_rvp) == {"Vera Vice", "Otto <Other>"}
+        assert (by_rvp["Vera Vice"]['line_count'], by_rvp["Vera Vice"]['total_amount']) == (1, db.DEFAULT_INVOICE_AMOUNT)
+        assert (by_rvp["Vera Vice"]['outstanding'], by_rvp["Otto <Other>"]['outstanding']) == (1, 1)
+
+        html = Path(by_rvp["Vera Vice"]['path']).read_text(encoding='utf-8')
+        assert Path(by_rvp["Vera Vice"]['path']).name == f"statement_{month}_Vera_Vice_VV001.html"
+        assert "Lovelace, Ada" in html and "L-1" in html and "Not yet invoiced (1)" in html
+        assert "Otto &lt;Other&gt;" in Path(by_rvp["Otto <Other>"]['path']).read_text(encoding='utf-8')
+
+        # Another month has nothing billed; a single RVP is rendered in-process
+        single = services.generate_rvp_statements(str(out_dir), month="2001-01", rvp=("Vera Vice", "VV001"),
+                                                  db_path=db_path)
+        assert [(r['line_count'], r['total_amount']) for r in single] == [(0, 0)]
+        assert services.generate_rvp_statements(str(out_dir), month="2001-13", db_path=db_path) is None
+        print("✓ test_generate_rvp_statements: One statement per RVP written by worker processes")
+    finally:
+        Path(db_path).unlink(missing_ok=True)
+        for p in out_dir.iterdir():
+            p.unlink()
+        out_dir.rmdir()
+
+
+def test_export_changes():
+    """
+    Test trigger-maintained timestamps and watermark delta exports.
+    """
+    with tempfile.NamedTemporaryFile(suffix='.db', delete=False) as tf:
+        db_path = tf.name
+    out_path = Path(db_path).with_suffix('.csv')
+
+    def exported_numbers():
+        with open(out_path, newline='', encoding='utf-8') as f:
+            return sorted(r['license_number'] for r in csv.DictReader(f))
+
+    try:
+        db.init_db(db_path)
+        tid = db.add_trainee("Ada", "Lovelace", db_path=db_path)
+        l1 = db.add_license(tid, "2025-01-01", None, "L-1", "Pending", None, db_path=db_path)
+        db.add_license(tid, "2025-02-01", None, "L-2", "Pending", None, db_path=db_path)
+        lic = db.get_license(l1, db_path)
+        assert lic['created_at'] and lic['updated_at'] == lic['created_at']
+
+        # Stamping rows must not leak into the activity journal or status history
+        with db.get_db_connection(db_path) as conn:
+            assert conn.execute("SELECT COUNT(*) FROM activity_event").fetchone()[0] == 3
+            assert conn.execute("SELECT COUNT(*) FROM license_status_history").fetchone()[0] == 2
+
+        first = services.export_changes("licenses", str(out_path), feed="payroll", db_path=db_path)
+        assert (first['rows'], first['since']) == (2, None)
+        assert exported_numbers() == ["L-1", "L-2"]
+        second = services.export_changes("licenses", str(out_path), feed="payroll", db_path=db_path)
+        assert (second['rows'], second['since']) == (0, first['until'])
+
+        db.update_license(l1, tid, "2025-01-01", "2025-03-01", "L-1", "Approved", None, db_path=db_path)
+        assert db.get_license(l1, db_path)['updated_at'] > lic['updated_at']
+        third = services.export_changes("licenses", str(out_path), feed="payroll", db_path=db_path)
+        assert third['rows'] == 1 and third['since'] == second['until']
+        assert exported_numbers() == ["L-1"]
+
+        # Feeds keep separate watermarks; rows without timestamps appear in full exports only
+        with db.get_db_connection(db_path) as conn:
+            conn.execute("UPDATE license SET updated_at = NULL")
+            conn.commit()
+        assert services.export_changes("licenses", str(out_path), feed="crm", db_path=db_path)['rows'] == 2
+        assert services.export_changes("licenses", str(out_path), feed="payroll", db_path=db_path)['rows'] == 0
+        print("✓ test_export_changes: Only rows changed since the watermark are exported")
+    finally:
+        Path(db_path).unlink(missing_ok=True)
+        out_path.unlink(missing_ok=True)
+
+
+def test_sync_databases():
+    """
+    Test change-log sync: first exchange, incremental rounds, last-writer-wins conflicts and deletes.
+    """
+    paths = []
+    for _ in range(3):
+        with tempfile.NamedTemporaryFile(suffix='.db', delete=False) as tf:
+            paths.append(tf.name)
+    office_a, office_b, copy_of_a = paths
+
+    def names(path):
+        with db.get_db_connection(path) as conn:
+            return sorted(f"{r[0]} {r[1]}" for r in conn.execute("SELECT first_name, last_name FROM trainee"))
+
+    try:
+        db.init_db(office_a)
+        db.init_db(office_b)
+        rid = db.add_recruiter("Grace Hopper", db_path=office_a)
+        ada = db.add_trainee("Ada", "Lovelace", recruiter_id=rid, db_path=office_a)
+        db.add_exam(ada, None, "2025-01-10", "80", None, module="Life", db_path=office_a)
+        db.add_trainee("Alan", "Turing", db_path=office_b)
+
+        first = services.sync_databases(office_b, db_path=office_a)
+        assert (first['sent'], first['received'], first['conflicts']) == (3, 1, 0)
+        assert names(office_a) == names(office_b) == ["Ada Lovelace", "Alan Turing"]
+        with db.get_db_connection(office_b) as conn:
+            row = conn.execute(
+                "SELECT r.name, e.module FROM trainee t JOIN recruiter r ON r.id = t.recruiter_id "
+                "JOIN exam e ON e.trainee_id = t.id WHERE t.first_name = 'Ada'"
+            ).fetchone()
+            assert tuple(row) == ("Grace Hopper", "Life")
+            ada_b = conn.execute("SELECT id FROM trainee WHERE first_name = 'Ada'").fetchone()[0]
+            alan_b = conn.execute("SELECT id FROM trainee WHERE first_name = 'Alan'").fetchone()[0]
+
+        # Nothing new on either side: nothing travels, and applied changes never echo back
+        again = services.sync_databases(office_b, db_path=office_a)
+        assert (again['sent'], again['received']) == (0, 0)
+
+        # Both offices edit Ada; the later edit wins on both sides whichever side syncs
+        db.update_trainee(ada, "Ada", "King", None, rid, db_path=office_a)
+        time.sleep(0.01)
+        db.update_trainee(ada_b, "Augusta Ada", "Lovelace", None, None, db_path=office_b)
+        db.delete_trainee(alan_b, db_path=office_b)
+        result = services.sync_databases(office_a, db_path=office_b)
+        assert result['conflicts'] == 1 and result['stale'] == 1
+        assert names(office_a) == names(office_b) == ["Augusta Ada Lovelace"]
+        with db.get_db_connection(office_a) as conn:
+            assert conn.execute("SELECT recruiter_id FROM trainee").fetchone()[0] is None
+            assert conn.execute("SELECT COUNT(*) FROM exam").fetchone()[0] == 1
+
+        # A file copy shares the site id and must not be synced as if it were another office
+        shutil.copy(office_a, copy_of_a)
+        assert services.sync_databases(copy_of_a, db_path=office_a) is None
+        print("✓ test_sync_databases: Offices converge through the change log")
+    finally:
+        for path in paths:
+            Path(path).unlink(missing_ok=True)
+
+
+def test_generate_rvp_extracts():
+    """
+    Test per-RVP extract files: only that RVP's trainees and their records, built in worker processes.
+    """
+    with tempfile.NamedTemporaryFile(suffix='.db', delete=False) as tf:
+        db_path = tf.name
+    out_dir = Path(tempfile.mkdtemp())
+
+    try:
+        db.init_db(db_path)
+        rid = db.add_recruiter("Grace Hopper", db_path=db_path)
+        cid = db.add_class("Spring", db_path=db_path)
+        ada = db.add_trainee("Ada", "Lovelace", recruiter_id=rid, rvp_name="Vera Vice", rvp_rep_code="VV001",
+                             db_path=db_path)
+        alan = db.add_trainee("Alan", "Turing", rvp_name="Otto Other", db_path=db_path)
+        db.add_trainee("Nobody", "Assigned", db_path=db_path)
+        db.add_exam(ada, cid, "2025-01-10", "80", None, module="Life", db_path=db_path)
+        db.add_exam(alan, None, "2025-01-11", "55", None, module="Life", db_path=db_path)
+        db.add_license(ada, "2025-01-20", None, "L-1", "Pending", None, db_path=db_path)
+        db.update_practice_exam_status(ada, "Ethics", True, db_path=db_path)
+
+        results = services.generate_rvp_extracts(str(out_dir), workers=2, db_path=db_path)
+        by_rvp = {r['rvp_name']: r for r in results}
+        assert set(by_rvp) == {"Vera Vice", "Otto Other"}
+        vera = by_rvp["Vera Vice"]
+        assert Path(vera['path']).name == "extract_Vera_Vice_VV001.db"
+        assert (vera['trainee'], vera['exam'], vera['license'], vera['practice_exam_status']) == (1, 1, 1, 1)
+        assert (vera['recruiter'], vera['class']) == (1, 1)
+
+        # The extract is an ordinary database with the app's schema and nobody else's trainees
+        with db.get_db_connection(vera['path']) as conn:
+            assert [r[0] for r in conn.execute("SELECT last_name FROM trainee")] == ["Lovelace"]
+            assert conn.execute("SELECT score FROM exam").fetchone()[0] == "80"
+            assert conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'idx_trainee_rvp'").fetchone()[0] == 1
+        with db.get_db_connection(by_rvp["Otto Other"]['path']) as conn:
+            assert [r[0] for r in conn.execute("SELECT last_name FROM trainee")] == ["Turing"]
+            assert conn.execute("SELECT COUNT(*) FROM recruiter").fetchone()[0] == 0
+
+        # Rebuilding a single RVP on a background job replaces its file and reports progress
+        job = services.start_rvp_extracts(str(out_dir), rvp=("Otto Other", None), db_path=db_path)
+        single = job.wait(30)
+        assert not job.running and (job.done, job.total) == (1, 1)
+        assert [r['exam'] for r in single] == [1]
+        assert sorted(p.name for p in out_dir.iterdir()) == ["extract_Otto_Other.db", "extract_Vera_Vice_VV001.db"]
+        print("✓ test_generate_rvp_extracts: One extract per RVP with only its own trainees")
+    finally:
+        Path(db_path).unlink(missing_ok=True)
+        for p in out_dir.iterdir():
+            p.unlink()
+        out_dir.rmdir()
+
+
+def test_backup_database():
+    """
+    Test online backups: background job, compressed and verified copies, cancellation and pruning.
+    """
+    with tempfile.NamedTemporaryFile(suffix='.db', delete=False) as tf:
+        db_path = tf.name
+    out_dir = Path(tempfile.mkdtemp())
+
+    def restore(path):
+        raw = Path(path).with_suffix('.restored')
+        opener = {'.gz': gzip.open, '.xz': lzma.open}[Path(path).suffix]
+        with opener(path, 'rb') as src, open(raw, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        return raw
+
+    try:
+        db.init_db(db_path)
+        for i in range(200):
+            db.add_trainee(f"First{i}", f"Last{i}", db_path=db_path)
+
+        job = services.start_backup(str(out_dir), keep=5, db_path=db_path)
+        result = job.wait(30)
+        assert not job.running and result and job.done == job.total > 0
+        assert Path(result['path']).name.endswith('.db.gz')
+
+        # One page per step, with a write from another connection mid-copy: the copy restarts
+        # and the backup still holds the row
+        seen = []
+
+        def write_during_backup(done, total):
+            seen.append((done, total))
+            if len(seen) == 2:
+                db.add_trainee("Mid", "Backup", db_path=db_path)
+
+        result = backups.run_backup(out_dir, compression="xz", pages=1, progress=write_during_backup, db_path=db_path)
+        assert result['restarts'] >= 1 and not result['fallback'] and seen[-1][0] == seen[-1][1]
+        restored = restore(result['path'])
+        with db.get_db_connection(restored) as conn:
+            assert conn.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+            assert conn.execute("SELECT COUNT(*) FROM trainee").fetchone()[0] == 201
+        restored.unlink()
+
+        # A write on every step would restart the copy forever: after max_restarts it is redone in one step
+        writes = []
+
+        def write_every_step(done, total):
+            if done < total // 2 and len(writes) < 50:
+                writes.append(db.add_trainee("Busy", "Writer", db_path=db_path))
+
+        result = backups.run_backup(out_dir, compression="gz", pages=1, progress=write_every_step,
+                                    max_restarts=3, db_path=db_path)
+        assert result['fallback'] and result['restarts'] == 3 and all(writes) and len(writes) < 50
+        restored = restore(result['path'])
+        with db.get_db_connection(restored) as conn:
+            assert conn.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+            assert conn.execute("SELECT COUNT(*) FROM trainee").fetchone()[0] == 201 + len(writes)
+        restored.unlink()
+
+        # Cancelling leaves no partial files; pruning keeps only the newest backups
+        assert services.backup_database(str(out_dir), cancelled=lambda: True, db_path=db_path) is None
+        assert not list(out_dir.glob("*.partial"))
+        assert services.backup_database(str(out_dir), compression="zip", db_path=db_path) is None
+        assert backups.prune(out_dir, 1) == 1 and len(list(out_dir.iterdir())) == 1
+        print("✓ test_backup_database: Verified compressed backups taken while the database changes")
+    finally:
+        Path(db_path).unlink(missing_ok=True)
+        for p in out_dir.iterdir():
+            p.unlink()
+        out_dir.rmdir()
+
+
+def test_archive_inactive_trainees():
+    """
+    Test the archive job: what moves, what stays live, and include_archive reads.
+    """
+    with tempfile.NamedTemporaryFile(suffix='.db', delete=False) as tf:
+        db_path = tf.name
+    archive = db.archive_path(db_path)
+
+    try:
+        db.init_db(db_path)
+        cid = db.add_class("Spring 2019", db_path=db_path)
+        old = db.add_trainee("Ada", "Lovelace", rvp_name="Vera Vice", db_path=db_path)
+        db.add_exam(old, cid, "2019-05-01", "80", None, module="Life", db_path=db_path)
+        db.update_practice_exam_status(old, "Life", True, db_path=db_path)
+        db.link_trainee_to_class(old, cid, db_path=db_path)
+        db.add_license(old, "2019-06-01", None, "L-OLD", "Pending", None, db_path=db_path)
+        lid = db.get_latest_licenses([old], db_path)[old]['id']
+        db.update_license(lid, old, "2019-06-01", "2019-07-01", "L-OLD", "Approved", None, db_path=db_path)
+
+        pending = db.add_trainee("Alan", "Turing", rvp_name="Vera Vice", db_path=db_path)
+        db.add_license(pending, "2019-06-01", "2019-07-01", None, "Approved", None, db_path=db_path)
+        db.add_license(pending, "2025-01-01", None, None, "Pending", None, db_path=db_path)
+        # Only the latest license counts: an old rejection does not block, a revocation is not issued
+        retried = db.add_trainee("Mary", "Somerville", rvp_name="Vera Vice", db_path=db_path)
+        db.add_license(retried, "2018-01-01", None, None, "Rejected", None, db_path=db_path)
+        db.add_license(retried, "2018-06-01", "2018-07-01", None, "Approved", None, db_path=db_path)
+        revoked = db.add_trainee("Emmy", "Noether", rvp_name="Vera Vice", db_path=db_path)
+        db.add_license(revoked, "2018-06-01", "2018-07-01", None, "Revoked", None, db_path=db_path)
+        recent = db.add_trainee("Grace", "Hopper", rvp_name="Vera Vice", db_path=db_path)
+        db.add_license(recent, "2025-01-01", date.today().isoformat(), None, "Approved", None, db_path=db_path)
+        db.add_exam(recent, None, "2024-11-01", "90", None, module="Life", db_path=db_path)
+        # Newest trainee id: kept live even though licensed long ago, so its id is never reused
+        newest = db.add_trainee("Last", "Added", db_path=db_path)
+        db.add_license(newest, "2019-01-01", "2019-02-01", None, "Approved", None, db_path=db_path)
+        assert services.run_invoices(db_path=db_path)['line_count'] == 7
+        with db.get_db_connection(db_path) as conn:
+            journal = conn.execute("SELECT COUNT(*) FROM activity_event").fetchone()[0]
+            changes = [tuple(r) for r in conn.execute("SELECT * FROM change_log ORDER BY version")]
+
+        moved = services.archive_inactive_trainees(months=24, db_path=db_path)
+        assert (moved['trainee'], moved['exam'], moved['license'], moved['practice_exam_status']) == (2, 1, 3, 1)
+        assert (moved['trainee_class'], moved['invoice_line']) == (1, 3) and moved['license_status_history'] >= 3
+        assert [t['last_name'] for t in db.list_trainees(db_path)] == ["Added", "Hopper", "Noether", "Turing"]
+        with db.get_db_connection(db_path) as conn:
+            assert conn.execute("SELECT COUNT(*) FROM exam").fetchone()[0] == 1
+            assert conn.execute("SELECT COUNT(*) FROM invoice_line").fetchone()[0] == 4
+            assert conn.execute("SELECT line_count FROM invoice_batch").fetchone()[0] == 7
+            # Archiving is neither an edit for the journal nor a delete to sync to other offices:
+            # archived rows keep their change-log stamp and version, marked 'A'
+            assert conn.execute("SELECT COUNT(*) FROM activity_event").fetchone()[0] == journal
+            after = [tuple(r) for r in conn.execute("SELECT * FROM change_log ORDER BY version")]
+        assert [c[:4] + c[5:] for c in after] == [c[:4] + c[5:] for c in changes]
+        assert sum(c[4] == "A" for c in after) == 6  # two trainees, one exam, three licenses
+
+        # History stays queryable on request
+        everyone = db.list_trainees(db_path, include_archive=True)
+        assert [t['last_name'] for t in everyone] == ["Added", "Hopper", "Lovelace", "Noether", "Somerville", "Turing"]
+        assert db.get_trainee(old, db_path) is None
+        assert db.get_trainee(old, db_path, include_archive=True)['first_name'] == "Ada"
+        live = {r['rvp_name']: r for r in db.get_rvp_stats(db_path)}
+        full = {r['rvp_name']: r for r in db.get_rvp_stats(db_path, include_archive=True)}
+        assert (live["Vera Vice"]['trainee_count'], full["Vera Vice"]['trainee_count']) == (3, 5)
+        assert (live["Vera Vice"]['invoiced_count'], full["Vera Vice"]['invoiced_count']) == (4, 7)
+
+        # New live columns reach the archive on the next run; a second run finds nothing new
+        with db.get_db_connection(db_path) as conn:
+            conn.execute("ALTER TABLE trainee ADD COLUMN nickname TEXT")
+            conn.commit()
+        again = services.archive_inactive_trainees(months=24, db_path=db_path)
+        assert again['trainee'] == 0
+        assert db.list_trainees(db_path, include_archive=True)[2]['nickname'] is None
+        print("✓ test_archive_inactive_trainees: Long-licensed trainees move to the archive and stay readable")
+    finally:
+        Path(db_path).unlink(missing_ok=True)
+        archive.unlink(missing_ok=True)
+
+
+def test_sync_after_archive():
+    """
+    Test that archived rows stay archived through a sync and their unsynced edits still travel.
+    """
+    paths = []
+    for _ in range(2):
+        with tempfile.NamedTemporaryFile(suffix='.db', delete=False) as tf:
+            paths.append(tf.name)
+    office_a, office_b = paths
+
+    try:
+        db.init_db(office_a)
+        db.init_db(office_b)
+        old = db.add_trainee("Ada", "Lovelace", db_path=office_a)
+        lid = db.add_license(old, "2019-06-01", "2019-07-01", "L-1", "Approved", None, db_path=office_a)
+        db.add_exam(old, None, "2019-05-01", "80", None, module="Life", db_path=office_a)
+        # Newest rows stay live so archived ids are never reused
+        newest = db.add_trainee("Alan", "Turing", db_path=office_a)
+        db.add_license(newest, "2025-01-01", None, None, "Pending", None, db_path=office_a)
+        db.add_exam(newest, None, "2025-01-10", "70", None, module="Life", db_path=office_a)
+        services.sync_databases(office_b, db_path=office_a)
+
+        # Office A edits the license, then archives before syncing
+        db.update_license(lid, old, "2019-06-01", "2019-07-01", "L-1A", "Approved", None, db_path=office_a)
+        assert services.archive_inactive_trainees(months=24, db_path=office_a)['trainee'] == 1
+        time.sleep(0.01)
+        with db.get_db_connection(office_b) as conn:
+            ada_b = conn.execute("SELECT id FROM trainee WHERE first_name = 'Ada'").fetchone()[0]
+            lid_b = conn.execute("SELECT id FROM license WHERE trainee_id = ?", (ada_b,)).fetchone()[0]
+        db.update_trainee(ada_b, "Augusta Ada", "Lovelace", None, None, db_path=office_b)
+        db.add_exam(ada_b, None, "2019-09-01", "90", None, module="A&S", db_path=office_b)
+        db.delete_license(lid_b, db_path=office_b)
+
+        result = services.sync_databases(office_b, db_path=office_a)
+        # The license edit is sent from the archive, and is older than office B's delete
+        assert (result['sent'], result['received'], result['archived']) == (1, 3, 2)
+        # Office B's newer edit lands in the archived row; nothing comes back to life
+        assert [t['first_name'] for t in db.list_trainees(office_a)] == ["Alan"]
+        everyone = db.list_trainees(office_a, include_archive=True)
+        assert sorted(t['first_name'] for t in everyone) == ["Alan", "Augusta Ada"]
+        with db.get_db_connection(office_a) as conn:
+            assert conn.execute("SELECT COUNT(*) FROM exam").fetchone()[0] == 1
+            assert conn.execute("SELECT COUNT(*) FROM license").fetchone()[0] == 1
+
+        again = services.sync_databases(office_b, db_path=office_a)
+        assert (again['sent'], again['received']) == (0, 0)
+        print("✓ test_sync_after_archive: Archived rows are kept through a sync")
+    finally:
+        for path in paths:
+            Path(path).unlink(missing_ok=True)
+            db.archive_path(path).unlink(missing_ok=True)
+
+
+if __name__ == '__main__':
+    print("\n=== Running Services Tests ===\n")
+
+    test_get_trainee_profile()
+    test_recruiter_performance_report()
+    test_module_pass_rate_trends()
+    test_recent_activity_journal()
+    test_score_statistics()
+    test_funnel_report()
+    test_dashboard_stats_snapshot()
+    test_report_cube()
+    test_license_status_dwell_stats()
+    test_license_deadline_scan()
+    test_invoice_runs()
+    test_attempt_analytics()
+    test_export_dataset()
+    test_export_formats()
+    test_import_dataset()
+    test_reconcile_results()
+    test_generate_rvp_statements()
+    test_export_changes()
+    test_sync_databases()
+    test_generate_rvp_extracts()
+    test_backup_database()
+    test_archive_inactive_trainees()
+    test_sync_after_archive()
+
+    print("\n✓ All services tests passed!\n")
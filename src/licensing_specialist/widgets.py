@@ -6,13 +6,15 @@ from PySide6.QtGui import QIcon
 from PySide6.QtWidgets import (
     QLabel, QFormLayout, QVBoxLayout, QHBoxLayout, QLineEdit, 
     QPushButton, QWidget, QMessageBox, QScrollArea, QFrame, QGridLayout,
-    QComboBox, QCompleter
+    QComboBox, QCompleter, QFileDialog, QProgressDialog
 )
 from PySide6.QtCore import QTimer, Qt, QObject, QEvent, QStringListModel, QCoreApplication, QSortFilterProxyModel
 import logging
 
 logger = logging.getLogger(__name__)
 
+from . import exporters
+from . import services
 from .styles import SECTION_HEADER_STYLE
 
 
@@ -144,12 +146,114 @@ def create_badge(text: str, badge_style: str) -> QLabel:
     label.setAlignment(Qt.AlignCenter)
     return label
 
+def format_score(exam) -> str:
+    """Display text for an exam score, preferring the parsed numeric value."""
+    value = exam['score_value'] if 'score_value' in exam.keys() else None
+    if value is not None:
+        return f"{value:g}%"
+    return exam['score'] or "—"
+
 def log_and_show_error(parent, title, message, exception=None):
     """Log an error and show a message box to the user."""
     full_msg = f"{message}: {exception}" if exception else message
     logger.error(f"{title}: {full_msg}")
     QMessageBox.critical(parent, title, full_msg)
 
+def run_export(parent, dataset: str, title: str, default_name: str) -> Optional[str]:
+    """Ask for a target file and format and stream an export dataset to it behind a cancellable progress dialog.
+
+    The format comes from the selected file filter; its extension is appended if missing.
+
+    Returns the path written, or None if the user cancelled or the export failed.
+    """
+    formats = exporters.available_formats()
+    filters = {w.description: name for name, w in formats.items()}
+    path, selected = QFileDialog.getSaveFileName(parent, title, default_name, ";;".join(filters))
+    if not path:
+        return None
+    fmt = filters.get(selected, "csv")
+    if not path.lower().endswith(formats[fmt].extension):
+        path += formats[fmt].extension
+
+    progress = QProgressDialog(f"Exporting {dataset}...", "Cancel", 0, 0, parent)
+    progress.setWindowTitle(title)
+    progress.setWindowModality(Qt.WindowModal)
+    progress.setMinimumDuration(500)
+
+    def on_progress(done: int, total: int) -> None:
+        progress.setMaximum(max(total, done, 1))
+        progress.setValue(done)
+        QCoreApplication.processEvents()
+
+    written = services.export_dataset(dataset, path, progress=on_progress, cancelled=progress.wasCanceled, fmt=fmt)
+    was_cancelled = progress.wasCanceled()
+    progress.close()
+    if written is None:
+        if not was_cancelled:
+            QMessageBox.critical(parent, "Export", "Failed to export data. Check logs.")
+        return None
+    return path
+
+def run_import(parent, dataset: str, title: str) -> Optional[dict]:
+    """Ask for a CSV file and bulk-import it behind a cancellable progress dialog, then summarize the result.
+
+    Returns the import result (see services.import_dataset), or None if nothing was imported.
+    """
+    path, _ = QFileDialog.getOpenFileName(parent, title, "", "CSV Files (*.csv)")
+    if not path:
+        return None
+
+    progress = QProgressDialog(f"Importing {dataset}...", "Cancel", 0, 0, parent)
+    progress.setWindowTitle(title)
+    progress.setWindowModality(Qt.WindowModal)
+    progress.setMinimumDuration(500)
+
+    def on_progress(done: int, total: int) -> None:
+        progress.setMaximum(max(total, done, 1))
+        progress.setValue(done)
+        QCoreApplication.processEvents()
+
+    result = services.import_dataset(dataset, path, progress=on_progress, cancelled=progress.wasCanceled)
+    progress.close()
+    if result is None:
+        QMessageBox.critical(parent, title, "Failed to import file. Check logs.")
+        return None
+    message = f"Imported {result['imported']} {dataset}."
+    if result['cancelled']:
+        message += "\nImport was cancelled; rows already imported were kept."
+    if result['rejected']:
+        message += f"\n{result['rejected']} rows were rejected; see {result['reject_file']}"
+    QMessageBox.information(parent, title, message)
+    return result
+
+def run_reconcile(parent, title: str = "Provincial Results") -> Optional[dict]:
+    """Ask for a provincial results CSV, preview the matches, and apply them once confirmed.
+
+    Returns the applied result (see services.reconcile_results), or None if nothing was applied.
+    """
+    path, _ = QFileDialog.getOpenFileName(parent, title, "", "CSV Files (*.csv)")
+    if not path:
+        return None
+    preview = services.reconcile_results(path, dry_run=True)
+    if preview is None:
+        QMessageBox.critical(parent, title, "Failed to read results file. Check logs.")
+        return None
+    summary = (f"{preview['matched']} of {preview['rows']} rows matched: "
+               f"{preview['exams_updated']} exams and {preview['licenses_updated']} licenses will be updated.\n"
+               f"{preview['unmatched']} unmatched, {preview['ambiguous']} ambiguous, {preview['invalid']} invalid.")
+    if not preview['matched']:
+        QMessageBox.information(parent, title, summary)
+        return None
+    if QMessageBox.question(parent, title, summary + "\n\nApply these updates?") != QMessageBox.StandardButton.Yes:
+        return None
+    result = services.reconcile_results(path)
+    if result is None:
+        QMessageBox.critical(parent, title, "Failed to apply results. Check logs.")
+        return None
+    if result['report_file']:
+        QMessageBox.information(parent, title, f"Rows that were not applied are listed in {result['report_file']}")
+    return result
+
 from PySide6.QtCore import (
     QTimer, Qt, QObject, QEvent, QStringListModel, 
     QCoreApplication, QSortFilterProxyModel